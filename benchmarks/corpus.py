@@ -0,0 +1,105 @@
+"""
+/benchmarks/corpus.py
+
+Synthetic corpus and query generation for the benchmark suite.
+
+Documents are drawn from a fixed number of topics, each with its own
+vocabulary, so clustering and retrieval have real structure to find.
+Everything is seeded: the same arguments always produce the same corpus.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import hashlib
+
+import numpy as np
+from llama_index.core import Document
+
+COMMON_WORDS = (
+    "the of and to in that is for it as with was on be by this are or "
+    "from at which an not have has but were their been shall any such"
+).split()
+
+
+def _topic_vocab(rng: np.random.Generator, topic: int, size: int) -> list[str]:
+    """Build a pseudo-word vocabulary unique to one topic."""
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    words = []
+    for _ in range(size):
+        length = int(rng.integers(4, 10))
+        words.append(f"t{topic}" + "".join(rng.choice(letters, length)))
+    return words
+
+
+def _sentence(rng: np.random.Generator, vocab: list[str], weights: np.ndarray) -> str:
+    n_topic = int(rng.integers(6, 14))
+    n_common = int(rng.integers(3, 8))
+    words = list(rng.choice(vocab, n_topic, p=weights)) + list(rng.choice(COMMON_WORDS, n_common))
+    rng.shuffle(words)
+    return " ".join(words).capitalize() + "."
+
+
+def generate_corpus(
+    n_docs: int,
+    n_topics: int = 8,
+    sentences_per_doc: tuple[int, int] = (40, 120),
+    vocab_size: int = 400,
+    seed: int = 42,
+) -> list[Document]:
+    """
+    Generate ``n_docs`` synthetic documents.
+
+    Args:
+        n_docs: Number of documents to generate
+        n_topics: Number of latent topics
+        sentences_per_doc: Inclusive (min, max) sentence count per document
+        vocab_size: Words per topic vocabulary
+        seed: RNG seed
+
+    Returns:
+        List of Documents carrying ``file_name``, ``doc_id`` and ``topic`` metadata
+    """
+    rng = np.random.default_rng(seed)
+    vocabs = [_topic_vocab(rng, t, vocab_size) for t in range(n_topics)]
+    # Zipf-like word frequencies inside each topic
+    weights = 1.0 / np.arange(1, vocab_size + 1)
+    weights /= weights.sum()
+
+    documents = []
+    for i in range(n_docs):
+        topic = int(rng.integers(n_topics))
+        n_sent = int(rng.integers(sentences_per_doc[0], sentences_per_doc[1] + 1))
+        paragraphs = []
+        for _ in range(0, n_sent, 6):
+            paragraphs.append(" ".join(_sentence(rng, vocabs[topic], weights) for _ in range(6)))
+        file_name = f"synthetic_{i:06d}.txt"
+        documents.append(Document(
+            text="\n\n".join(paragraphs),
+            metadata={
+                "file_name": file_name,
+                "doc_id": hashlib.md5(file_name.encode()).hexdigest()[:12],
+                "topic": topic,
+            },
+        ))
+    return documents
+
+
+def generate_queries(documents: list[Document], n_queries: int, seed: int = 7) -> list[str]:
+    """Sample query strings as short word windows taken from random documents."""
+    return generate_labeled_queries(documents, n_queries, seed)[0]
+
+
+def generate_labeled_queries(documents: list[Document], n_queries: int, seed: int = 7) -> tuple[list[str], list[str]]:
+    """generate_queries, plus the doc_id each query was taken from."""
+    rng = np.random.default_rng(seed)
+    queries, sources = [], []
+    for _ in range(n_queries):
+        doc = documents[int(rng.integers(len(documents)))]
+        words = doc.text.split()
+        start = int(rng.integers(0, max(1, len(words) - 12)))
+        queries.append(" ".join(words[start:start + 12]))
+        sources.append(doc.metadata["doc_id"])
+    return queries, sources
@@ -0,0 +1,125 @@
+"""
+/benchmarks/fakes.py
+
+Deterministic local stand-ins for Ollama so the benchmarks run without
+any model server. Both plug into llama_index ``Settings`` exactly like
+``OllamaEmbedding`` and ``Ollama`` do.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import hashlib
+import re
+import time
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import (
+    CompletionResponse,
+    CompletionResponseGen,
+    CustomLLM,
+    LLMMetadata,
+)
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=200_000)
+def _token_vector(token: str, dim: int) -> np.ndarray:
+    """Stable pseudo-random unit vector for a single token."""
+    seed = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+    vec = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def hashed_embedding(text: str, dim: int) -> np.ndarray:
+    """
+    Bag-of-words embedding built from per-token hash vectors.
+
+    Texts sharing vocabulary land close together, which is enough for
+    recall measurements to mean something.
+    """
+    acc = np.zeros(dim, dtype=np.float32)
+    for token in TOKEN_RE.findall(text.lower()):
+        acc += _token_vector(token, dim)
+    norm = np.linalg.norm(acc)
+    if norm == 0:
+        acc[0] = 1.0
+        return acc
+    return acc / norm
+
+
+class FakeEmbedding(BaseEmbedding):
+    """Deterministic embedder with optional simulated per-call latency."""
+
+    dim: int = 768
+    latency_ms: float = 0.0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeEmbedding"
+
+    def _embed(self, text: str) -> list[float]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return hashed_embedding(text, self.dim).tolist()
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        # One simulated round trip per batch, like a batched Ollama call
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return [hashed_embedding(t, self.dim).tolist() for t in texts]
+
+
+class FakeLLM(CustomLLM):
+    """
+    Deterministic LLM that echoes a digest of the prompt.
+
+    Latency scales with prompt length so prompt-size changes show up in
+    synthesis timings the way they would on a local model.
+    """
+
+    context_window: int = 32768
+    num_output: int = 256
+    base_latency_ms: float = 0.0
+    ms_per_1k_prompt_tokens: float = 0.0
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=self.num_output,
+            model_name="fake-llm",
+        )
+
+    def _answer(self, prompt: str) -> str:
+        n_tokens = len(TOKEN_RE.findall(prompt))
+        delay = self.base_latency_ms + self.ms_per_1k_prompt_tokens * n_tokens / 1000.0
+        if delay:
+            time.sleep(delay / 1000.0)
+        digest = hashlib.md5(prompt.encode()).hexdigest()[:8]
+        return f"category_{digest[:2]}" if "Category" in prompt else f"answer {digest}"
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return CompletionResponse(text=self._answer(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        text = self._answer(prompt)
+        yield CompletionResponse(text=text, delta=text)
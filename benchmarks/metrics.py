@@ -0,0 +1,72 @@
+"""
+/benchmarks/metrics.py
+
+Timing, recall and memory helpers shared by the benchmark suite.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def percentiles(samples_ms: list[float]) -> dict:
+    """Summarize a list of latencies (milliseconds)."""
+    if not samples_ms:
+        return {}
+    arr = np.asarray(samples_ms)
+    return {
+        "count": int(arr.size),
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p90_ms": round(float(np.percentile(arr, 90)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+        "max_ms": round(float(arr.max()), 3),
+    }
+
+
+def recall_at_k(approx: list[list], exact: list[list], k: int) -> float:
+    """Mean fraction of the exact top-k found in the approximate top-k."""
+    if not exact:
+        return 0.0
+    hits = [len(set(a[:k]) & set(e[:k])) / max(1, min(k, len(e))) for a, e in zip(approx, exact)]
+    return round(float(np.mean(hits)), 4)
+
+
+def rss_high_water_mb() -> float:
+    """Process peak resident set size in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 2)
+
+
+@contextmanager
+def measure(result: dict, trace_heap: bool = False):
+    """
+    Record wall time and memory high-water marks for a block.
+
+    Fills ``result`` with ``seconds`` and ``rss_peak_mb``. With ``trace_heap``
+    the Python heap peak is recorded too; tracemalloc slows allocation-heavy
+    code noticeably, so timings taken with it on are not comparable.
+    """
+    if trace_heap:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result["seconds"] = round(time.perf_counter() - start, 4)
+        if trace_heap:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result["py_heap_peak_mb"] = round(peak / (1024 * 1024), 2)
+        result["rss_peak_mb"] = rss_high_water_mb()
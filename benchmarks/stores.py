@@ -0,0 +1,213 @@
+"""
+/benchmarks/stores.py
+
+Vector store backends the benchmark suite can run against.
+
+  memory    - NumPy matrix with an IVF (k-means partitioned) ANN index,
+              no external services at all
+  local     - src/common/local_vector_store.py in a temporary directory
+              (memory-mapped matrix plus persisted ANN graph)
+  pgvector  - a throwaway table with an HNSW index in a local
+              Postgres+pgvector database, dropped again on close()
+
+Every backend answers both an approximate and an exact top-k search so
+recall@k of the ANN index can be measured against ground truth.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from sklearn.cluster import KMeans
+
+from src.common.local_vector_store import LocalVectorIndex
+
+
+class InMemoryBackend:
+    """Exact search plus an IVF index over a NumPy float32 matrix."""
+
+    name = "memory"
+
+    def __init__(self, dim: int, n_probe: int = 4, seed: int = 42):
+        self.dim = dim
+        self.n_probe = n_probe
+        self.seed = seed
+        self.ids: list[str] = []
+        self._chunks: list[np.ndarray] = []
+        self.matrix = np.empty((0, dim), dtype=np.float32)
+        self.centroids = None
+        self.lists: list[np.ndarray] = []
+
+    def add(self, ids: list[str], vectors: np.ndarray, metadata: list[dict] | None = None):
+        self.ids.extend(ids)
+        self._chunks.append(np.asarray(vectors, dtype=np.float32))
+
+    def build(self):
+        """Finalize the matrix and train the IVF partitions."""
+        self.matrix = np.vstack(self._chunks) if self._chunks else self.matrix
+        self._chunks = [self.matrix]
+        n_lists = max(1, int(np.sqrt(len(self.ids))))
+        kmeans = KMeans(n_clusters=n_lists, random_state=self.seed, n_init=1)
+        labels = kmeans.fit_predict(self.matrix)
+        self.centroids = kmeans.cluster_centers_.astype(np.float32)
+        self.lists = [np.flatnonzero(labels == i) for i in range(n_lists)]
+
+    def search(self, query: np.ndarray, k: int) -> list[str]:
+        probe = np.argsort(-(self.centroids @ query))[:self.n_probe]
+        candidates = np.concatenate([self.lists[i] for i in probe])
+        scores = self.matrix[candidates] @ query
+        top = candidates[np.argsort(-scores)[:k]]
+        return [self.ids[i] for i in top]
+
+    def exact(self, query: np.ndarray, k: int) -> list[str]:
+        scores = self.matrix @ query
+        top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.ids[i] for i in top]
+
+    def close(self):
+        self.matrix = np.empty((0, self.dim), dtype=np.float32)
+        self._chunks = []
+
+
+class LocalBackend:
+    """
+    LocalVectorIndex in a temp directory; reopened after build to time the mmap load.
+
+    ``brute_force_limit`` defaults to 0 so graph construction and search are
+    what gets measured; the index's production default (20k rows) would
+    scan the benchmark's corpora exactly.
+    """
+
+    name = "local"
+
+    def __init__(self, dim: int, ef_search: int = 64, brute_force_limit: int = 0):
+        self.dim = dim
+        self.ef_search = ef_search
+        self.brute_force_limit = brute_force_limit
+        self.dir = tempfile.mkdtemp(prefix="bench_local_index_")
+        self.index = LocalVectorIndex(self.dir, dim=dim, ef_search=ef_search, brute_force_limit=brute_force_limit)
+        self.ids: list[str] = []
+        self.stats = {}
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self.index.vectors
+
+    def add(self, ids: list[str], vectors: np.ndarray, metadata: list[dict] | None = None):
+        metadata = metadata or [{} for _ in ids]
+        self.index.add(
+            vectors,
+            [{"id": i} for i in ids],
+            [m.get("doc_id", i) for i, m in zip(ids, metadata)],
+            [m.get("cluster_id") for m in metadata],
+        )
+        self.ids.extend(ids)
+
+    def build(self):
+        self.index.close()
+        start = time.perf_counter()
+        self.index = LocalVectorIndex(self.dir, ef_search=self.ef_search, brute_force_limit=self.brute_force_limit)
+        self.stats["load_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+    def search(self, query: np.ndarray, k: int) -> list[str]:
+        return [self.ids[r] for _, r in self.index.search(query, k)]
+
+    def exact(self, query: np.ndarray, k: int) -> list[str]:
+        return [self.ids[r] for _, r in self.index.search(query, k, exact=True)]
+
+    def close(self):
+        self.index.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class PGVectorBackend:
+    """
+    HNSW search against a temporary pgvector table.
+
+    Exact results come from the same table with index scans disabled, so
+    both searches see identical data and distance semantics.
+    """
+
+    name = "pgvector"
+
+    def __init__(self, dim: int, db_uri: str, ef_search: int = 40):
+        from sqlalchemy import create_engine, text
+
+        self._text = text
+        self.dim = dim
+        self.ef_search = ef_search
+        self.table = f"bench_vectors_{os.getpid()}"
+        self.engine = create_engine(db_uri)
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            conn.execute(text(f"DROP TABLE IF EXISTS {self.table}"))
+            conn.execute(text(
+                f"CREATE TABLE {self.table} (id TEXT PRIMARY KEY, embedding VECTOR({dim}))"
+            ))
+
+    @staticmethod
+    def _literal(vec: np.ndarray) -> str:
+        return "[" + ",".join(f"{x:.6f}" for x in vec) + "]"
+
+    def add(self, ids: list[str], vectors: np.ndarray, metadata: list[dict] | None = None):
+        rows = [{"id": i, "e": self._literal(v)} for i, v in zip(ids, vectors)]
+        with self.engine.begin() as conn:
+            conn.execute(
+                self._text(f"INSERT INTO {self.table} (id, embedding) VALUES (:id, CAST(:e AS vector))"),
+                rows,
+            )
+
+    def build(self):
+        with self.engine.begin() as conn:
+            conn.execute(self._text(
+                f"CREATE INDEX ON {self.table} USING hnsw (embedding vector_cosine_ops)"
+            ))
+            conn.execute(self._text(f"ANALYZE {self.table}"))
+
+    def _query(self, query: np.ndarray, k: int, exact: bool) -> list[str]:
+        with self.engine.begin() as conn:
+            if exact:
+                conn.execute(self._text("SET LOCAL enable_indexscan = off"))
+            else:
+                conn.execute(self._text(f"SET LOCAL hnsw.ef_search = {int(self.ef_search)}"))
+            rows = conn.execute(
+                self._text(
+                    f"SELECT id FROM {self.table} "
+                    f"ORDER BY embedding <=> CAST(:q AS vector) LIMIT :k"
+                ),
+                {"q": self._literal(query), "k": k},
+            )
+            return [r[0] for r in rows]
+
+    def search(self, query: np.ndarray, k: int) -> list[str]:
+        return self._query(query, k, exact=False)
+
+    def exact(self, query: np.ndarray, k: int) -> list[str]:
+        return self._query(query, k, exact=True)
+
+    def close(self):
+        with self.engine.begin() as conn:
+            conn.execute(self._text(f"DROP TABLE IF EXISTS {self.table}"))
+        self.engine.dispose()
+
+
+def make_backend(name: str, dim: int, **kwargs):
+    """Instantiate a backend by name."""
+    if name == "memory":
+        return InMemoryBackend(dim, n_probe=kwargs.get("n_probe", 4))
+    if name == "local":
+        return LocalBackend(dim, ef_search=kwargs.get("ef_search", 64),
+                            brute_force_limit=kwargs.get("brute_force_limit", 0))
+    if name == "pgvector":
+        if not kwargs.get("db_uri"):
+            raise ValueError("The pgvector backend needs --pg-uri (a throwaway database).")
+        return PGVectorBackend(dim, kwargs["db_uri"], ef_search=kwargs.get("ef_search", 40))
+    raise ValueError(f"Unknown backend: {name}")
@@ -50,6 +50,7 @@ CREATE TABLE IF NOT EXISTS document_metadata_catalog (
     date DATE,
     jurisdiction TEXT,
     doc_path TEXT,
+    canonical_doc_id TEXT,
     created_at TIMESTAMP DEFAULT NOW()
 );
 
@@ -57,11 +58,48 @@ CREATE TABLE IF NOT EXISTS document_clusters (
     cluster_id SERIAL PRIMARY KEY,
     cluster_name TEXT NOT NULL,
     doc_count INTEGER DEFAULT 0,
+    centroid BYTEA,               -- float32 cluster centroid, for cluster-routed retrieval
+    centroid_dim INTEGER,
+    embedding_version TEXT,       -- embedding space the centroid lives in
     created_at TIMESTAMP DEFAULT NOW(),
     updated_at TIMESTAMP DEFAULT NOW()
 );
 
 CREATE INDEX IF NOT EXISTS idx_doc_cluster ON document_metadata_catalog(cluster_id);
+
+-- Document and section summaries (small-to-big retrieval; vectors live in rag_db)
+CREATE TABLE IF NOT EXISTS document_summaries (
+    summary_id TEXT PRIMARY KEY,
+    doc_id TEXT NOT NULL,
+    level TEXT NOT NULL,          -- document | section
+    section_index INTEGER,        -- position of the section among the document's sections
+    section TEXT,
+    summary TEXT NOT NULL,
+    parent_id TEXT,               -- a section's document summary
+    chunk_count INTEGER,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_summary_doc ON document_summaries(doc_id);
+
+-- Near-duplicate detection (MinHash signatures + LSH bands)
+CREATE TABLE IF NOT EXISTS document_minhash (
+    doc_id TEXT PRIMARY KEY,
+    signature BYTEA NOT NULL,
+    num_perm INTEGER NOT NULL,
+    canonical_doc_id TEXT NOT NULL,
+    similarity REAL,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS document_lsh_bands (
+    band SMALLINT NOT NULL,
+    band_hash BIGINT NOT NULL,
+    doc_id TEXT NOT NULL,
+    PRIMARY KEY (band, band_hash, doc_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_lsh_doc ON document_lsh_bands(doc_id);
 EOF
 
 echo ""
@@ -0,0 +1,314 @@
+# /src/agents/batch_query.py
+
+"""
+Batch query mode for offline evaluation and report runs.
+
+    st query --batch questions.jsonl [--output results.jsonl] [--resume] [--domain NAME]
+
+Each input line is a JSON object with ``question`` (or ``query``), an
+optional ``id`` (default: line number) and optional ``doc_ids`` restricting
+the search; without doc_ids the whole domain is searched. Questions go
+through the same retrieval, near-duplicate collapsing, reranking and
+context packing as filtered_semantic_search, but stage by stage over a
+chunk of questions at a time instead of one agent run per process:
+
+  1. embed     every question of the chunk in batched embedding calls
+  2. search    vector searches on a thread pool (the store's connection pool)
+  3. rerank    one cross-encoder call over all (question, node) pairs of the chunk
+  4. synthesize answers on a bounded pool at bulk LLM priority, overlapping
+               with retrieval of the next chunk
+
+Results are appended to the output as JSONL as soon as each answer is
+ready (so in completion order, not input order). ``--resume`` skips ids
+already answered without error. Throughput and per-stage latencies are
+printed at the end and written next to the output as ``.stats.json``.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+from llama_index.core import Settings, get_response_synthesizer
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+from .domain_router import DomainRegistry
+from .reranker_agent import CONTEXT_PACKING, collapser, packer, reranker
+from .semantic_retriever_agent import LLM_MODEL, OLLAMA_URL, create_filtered_query_engine
+from src.common.config import load_global_config
+from src.common.llm_pool import llm_endpoints, pooled_llm
+from src.common.query_cache import cached_query_embeddings
+
+GLOBAL_CONFIG = load_global_config()
+BATCH_CHUNK_SIZE = int(GLOBAL_CONFIG.get("batch_query_chunk_size", 64))
+BATCH_EMBED_SIZE = int(GLOBAL_CONFIG.get("batch_query_embed_size", GLOBAL_CONFIG.get("embedding_batch_size", 32)))
+BATCH_SEARCH_WORKERS = int(GLOBAL_CONFIG.get("batch_query_search_workers", 8))
+BATCH_RERANK_SIZE = int(GLOBAL_CONFIG.get("batch_query_rerank_batch_size", 128))
+BATCH_SYNTHESIS_WORKERS = int(GLOBAL_CONFIG.get("batch_query_synthesis_workers", 4))
+
+
+def read_questions(path: Path) -> list[dict]:
+    questions = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            question = record.get("question") or record.get("query")
+            if not question:
+                raise ValueError(f"{path}:{line_no}: no 'question' field")
+            questions.append({"id": str(record.get("id", line_no)), "question": question,
+                              "doc_ids": record.get("doc_ids") or []})
+    return questions
+
+
+def answered_ids(path: Path) -> set[str]:
+    """Ids already in ``path`` without an error (what --resume skips)."""
+    done = set()
+    if path.exists():
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by the interrupted run
+                if not record.get("error"):
+                    done.add(str(record["id"]))
+    return done
+
+
+def latency_summary(samples_ms: list[float]) -> dict:
+    if not samples_ms:
+        return {}
+    arr = np.asarray(samples_ms)
+    return {"count": int(arr.size), "mean_ms": round(float(arr.mean()), 1),
+            "p50_ms": round(float(np.percentile(arr, 50)), 1), "p95_ms": round(float(np.percentile(arr, 95)), 1),
+            "max_ms": round(float(arr.max()), 1)}
+
+
+def rerank_many(items: list[tuple[str, list]], batch_size: int) -> list[list]:
+    """
+    Rerank the nodes of many queries.
+
+    A cross-encoder reranker (FlagEmbeddingReranker, or WorkerReranker on
+    the shared model worker) scores every (query, node) pair of ``items`` in
+    one ``compute_score`` call, batched by ``batch_size`` (by the worker's
+    max_batch on the worker); any other postprocessor runs query by query.
+    """
+    model = getattr(reranker, "_model", None)
+    if not hasattr(model, "compute_score"):
+        return [reranker.postprocess_nodes(nodes, QueryBundle(q)) if nodes else [] for q, nodes in items]
+
+    pairs = [(q, n.node.get_content(metadata_mode=MetadataMode.EMBED)) for q, nodes in items for n in nodes]
+    if not pairs:
+        return [[] for _ in items]
+    scores = np.atleast_1d(model.compute_score(pairs, batch_size=batch_size))
+    ranked, offset = [], 0
+    for _, nodes in items:
+        rescored = [NodeWithScore(node=n.node, score=float(s))
+                    for n, s in zip(nodes, scores[offset:offset + len(nodes)])]
+        offset += len(nodes)
+        ranked.append(sorted(rescored, key=lambda n: -n.score)[:reranker.top_n])
+    return ranked
+
+
+class BatchRunner:
+    """
+    Runs question chunks through one domain's retrieval stack.
+
+    Args:
+        ctx: DomainContext of the domain being queried
+        output: Open JSONL file results are appended to
+        search_workers: Concurrent vector searches
+        synthesis_workers: Concurrent LLM syntheses (None or 0: retrieval only)
+        embed_batch_size: Questions per embedding call
+        rerank_batch_size: Pairs per cross-encoder forward pass
+    """
+
+    def __init__(self, ctx, output, search_workers: int = BATCH_SEARCH_WORKERS,
+                 synthesis_workers: int = BATCH_SYNTHESIS_WORKERS, embed_batch_size: int = BATCH_EMBED_SIZE,
+                 rerank_batch_size: int = BATCH_RERANK_SIZE):
+        self.ctx = ctx
+        self.output = output
+        self.embed_model = ctx.index._embed_model or Settings.embed_model
+        self.embed_batch_size = embed_batch_size
+        self.rerank_batch_size = rerank_batch_size
+        self.search_pool = ThreadPoolExecutor(max_workers=search_workers)
+        self.synthesis_pool = ThreadPoolExecutor(max_workers=synthesis_workers) if synthesis_workers else None
+        self.max_pending = 2 * synthesis_workers if synthesis_workers else 0
+        # Offline work yields LLM slots to interactive queries on the shared pool
+        llm = pooled_llm(LLM_MODEL, llm_endpoints(GLOBAL_CONFIG, default_url=OLLAMA_URL), priority="bulk")
+        self.synthesizer = get_response_synthesizer(llm=llm)
+        self.pending = set()
+        self._write_lock = threading.Lock()
+        self.timings = {"embed": [], "search": [], "rerank": [], "synthesis": []}
+        self.counts = {"ok": 0, "errors": 0}
+
+    def _search(self, question: dict, embedding) -> list:
+        t0 = time.perf_counter()
+        retriever = create_filtered_query_engine(
+            question["doc_ids"], question["question"], target_index=self.ctx.index,
+            schema=self.ctx.domain.schema, space=self.ctx.space, cache=self.ctx.retrieval_cache,
+            router=self.ctx.cluster_router, whole_index=True, summary_index=self.ctx.summary_index,
+        )
+        if retriever is None:
+            raise RuntimeError("vector index is not available")
+        nodes = retriever.retrieve(QueryBundle(query_str=question["question"], embedding=embedding))
+        self.timings["search"].append((time.perf_counter() - t0) * 1000)
+        return collapser.postprocess_nodes(nodes, QueryBundle(question["question"]))
+
+    def _write(self, record: dict):
+        with self._write_lock:
+            self.output.write(json.dumps(record) + "\n")
+            self.output.flush()
+            self.counts["errors" if record.get("error") else "ok"] += 1
+
+    def _finish(self, question: dict, nodes: list, error: str = None):
+        """Synthesize (when enabled) and write one result."""
+        record = {"id": question["id"], "question": question["question"], "answer": None,
+                  "sources": [{"node_id": n.node.node_id, "doc_id": n.node.metadata.get("doc_id"),
+                               "score": None if n.score is None else round(float(n.score), 4)} for n in nodes]}
+        if error is None and self.synthesis_pool is not None:
+            t0 = time.perf_counter()
+            try:
+                record["answer"] = str(self.synthesizer.synthesize(question["question"], nodes))
+            except Exception as e:
+                error = f"synthesis: {e}"
+            self.timings["synthesis"].append((time.perf_counter() - t0) * 1000)
+        if error:
+            record["error"] = error
+        self._write(record)
+
+    def _drain(self, limit: int):
+        """Write finished syntheses; block until at most ``limit`` are outstanding."""
+        while len(self.pending) > limit:
+            done, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                f.result()
+
+    def run_chunk(self, questions: list[dict]):
+        texts = [q["question"] for q in questions]
+        t0 = time.perf_counter()
+        embeddings = cached_query_embeddings(self.embed_model, texts, self.ctx.embedding_version,
+                                             self.embed_batch_size)
+        self.timings["embed"].append((time.perf_counter() - t0) * 1000)
+
+        futures = [self.search_pool.submit(self._search, q, e) for q, e in zip(questions, embeddings)]
+        retrieved, errors = [], {}
+        for q, f in zip(questions, futures):
+            try:
+                retrieved.append(f.result())
+            except Exception as e:
+                errors[q["id"]] = f"search: {e}"
+                retrieved.append([])
+
+        t0 = time.perf_counter()
+        try:
+            ranked = rerank_many(list(zip(texts, retrieved)), self.rerank_batch_size)
+        except Exception as e:
+            ranked = [[] for _ in questions]
+            errors.update({q["id"]: errors.get(q["id"], f"rerank: {e}") for q in questions})
+        self.timings["rerank"].append((time.perf_counter() - t0) * 1000)
+        if CONTEXT_PACKING:
+            ranked = [packer.postprocess_nodes(nodes, QueryBundle(text)) if nodes else nodes
+                      for text, nodes in zip(texts, ranked)]
+
+        for q, nodes in zip(questions, ranked):
+            error = errors.get(q["id"])
+            if self.synthesis_pool is None or error:
+                self._finish(q, nodes, error)
+                continue
+            self._drain(self.max_pending - 1)
+            self.pending.add(self.synthesis_pool.submit(self._finish, q, nodes))
+
+    def close(self):
+        self._drain(0)
+        self.search_pool.shutdown()
+        if self.synthesis_pool is not None:
+            self.synthesis_pool.shutdown()
+
+
+def run_batch(questions: list[dict], output_path: Path, domain: str = None, resume: bool = False,
+              chunk_size: int = BATCH_CHUNK_SIZE, **runner_kwargs) -> dict:
+    """
+    Answer ``questions`` into ``output_path`` (JSONL); returns throughput stats.
+
+    Args:
+        questions: Records from read_questions
+        output_path: Results file (appended to with ``resume``)
+        domain: Domain to query; None uses the default domain
+        resume: Skip ids already answered in ``output_path``
+        chunk_size: Questions embedded, searched and reranked together
+        runner_kwargs: Passed to BatchRunner (worker counts, batch sizes)
+    """
+    skip = answered_ids(output_path) if resume else set()
+    todo = [q for q in questions if q["id"] not in skip]
+    print(f"[BATCH] {len(todo)} questions to run" + (f" ({len(skip)} already answered)" if skip else ""))
+
+    registry = DomainRegistry()
+    started = time.perf_counter()
+    with registry.use(domain) as ctx, open(output_path, "a" if resume else "w") as output:
+        runner = BatchRunner(ctx, output, **runner_kwargs)
+        try:
+            for start in range(0, len(todo), chunk_size):
+                runner.run_chunk(todo[start:start + chunk_size])
+                done = runner.counts["ok"] + runner.counts["errors"]
+                print(f"   {min(start + chunk_size, len(todo))}/{len(todo)} retrieved, {done} written "
+                      f"({done / (time.perf_counter() - started):.2f} q/s)", end="\r")
+        finally:
+            runner.close()
+        print()
+        elapsed = time.perf_counter() - started
+        stats = {
+            "domain": ctx.domain.name, "embedding_version": ctx.embedding_version,
+            "questions": len(todo), "skipped": len(skip), **runner.counts,
+            "seconds": round(elapsed, 2), "questions_per_sec": round(len(todo) / elapsed, 3) if elapsed else None,
+            "stages": {name: latency_summary(samples) for name, samples in runner.timings.items()},
+            "retrieval_cache": ctx.retrieval_cache.stats,
+            "cluster_routing": dict(ctx.cluster_router.stats),
+        }
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run many questions through retrieval, reranking and synthesis")
+    parser.add_argument("--batch", type=Path, required=True, help="questions JSONL")
+    parser.add_argument("--output", type=Path, default=None, help="results JSONL (default: <batch>.results.jsonl)")
+    parser.add_argument("--resume", action="store_true", help="skip questions already answered in --output")
+    parser.add_argument("--domain", default=os.getenv("DOMAIN"))
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE)
+    parser.add_argument("--embed-batch-size", type=int, default=BATCH_EMBED_SIZE)
+    parser.add_argument("--search-workers", type=int, default=BATCH_SEARCH_WORKERS)
+    parser.add_argument("--rerank-batch-size", type=int, default=BATCH_RERANK_SIZE)
+    parser.add_argument("--synthesis-workers", type=int, default=BATCH_SYNTHESIS_WORKERS,
+                        help="concurrent LLM syntheses (0: retrieval and reranking only)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = args.output or args.batch.with_suffix(".results.jsonl")
+    stats = run_batch(
+        read_questions(args.batch), output, domain=args.domain, resume=args.resume, chunk_size=args.chunk_size,
+        search_workers=args.search_workers, synthesis_workers=args.synthesis_workers,
+        embed_batch_size=args.embed_batch_size, rerank_batch_size=args.rerank_batch_size,
+    )
+    stats_path = output.with_suffix(".stats.json")
+    stats_path.write_text(json.dumps(stats, indent=2))
+
+    print(f"✅ {stats['ok']} answered, {stats['errors']} failed in {stats['seconds']} s "
+          f"({stats['questions_per_sec']} questions/s) -> {output}")
+    for stage, summary in stats["stages"].items():
+        if summary:
+            print(f"   {stage:<10} p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms ({summary['count']} calls)")
+    print(f"   Stats written to {stats_path}")
+    if stats["errors"]:
+        print(f"⚠️  Re-run with --resume to retry the {stats['errors']} failed questions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+# /src/agents/domain_router.py
+
+"""
+Per-domain (tenant) routing for the query service.
+
+Each configured domain gets its own DomainContext: a metadata engine scoped
+to the domain's schema, its own vector store / index, agent tools bound to
+both, and a private cache area. Contexts warm lazily on first use and are
+evicted independently, by idle time and by an LRU cap on warm domains, so a
+burst of traffic for one tenant can't push out another tenant's engines and
+caches beyond that cap. Contexts serving a request are never closed.
+
+A context is bound to the domain's active embedding space. The registry
+re-reads the active version every embedding_space_check_sec and, after a
+cutover (st reembed cutover), swaps in a fresh context; the old one closes
+once its last request finishes. Caches are namespaced by embedding version
+through DomainContext.cache().
+
+Requests without a domain go to the default domain's context too
+(default_registry()), so they follow cutovers like any other domain.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .metadata_tool import DEFAULT_DOMAIN, DOMAINS, config, make_metadata_query_tool
+from .reranker_agent import make_reranked_query_tool
+from .semantic_retriever_agent import OLLAMA_URL, SUMMARY_FIRST_RETRIEVAL, VectorStoreIndex, open_vector_store
+from src.common.domains import scoped_engine
+from src.common.cluster_routing import ClusterRouter
+from src.common.embedding_spaces import active_space, make_embed_model
+from src.common.query_cache import RetrievalCache, embedding_cache
+
+DOMAIN_CACHE = config.get("domain_cache", {}) or {}
+MAX_WARM_DOMAINS = int(os.getenv("MAX_WARM_DOMAINS", DOMAIN_CACHE.get("max_warm_domains", 4)))
+DOMAIN_IDLE_EVICT_SEC = float(os.getenv("DOMAIN_IDLE_EVICT_SEC", DOMAIN_CACHE.get("idle_evict_sec", 900)))
+DOMAIN_POOL_SIZE = int(DOMAIN_CACHE.get("db_pool_size", 5))
+EMBEDDING_SPACE_CHECK_SEC = float(config.get("embedding_space_check_sec", 30))
+
+
+class DomainContext:
+    """Everything needed to serve one domain, opened once and reused."""
+
+    def __init__(self, domain, agent_factory=None):
+        self.domain = domain
+        self.metadata_engine = scoped_engine(
+            domain.metadata_db_uri, domain.schema, pool_size=DOMAIN_POOL_SIZE, pool_pre_ping=True
+        )
+        self.space = active_space(self.metadata_engine)
+        self.embedding_version = self.space.version
+        self.space_checked = time.monotonic()
+        self.vector_store = open_vector_store(domain.schema, self.space)
+        embed_model = make_embed_model(self.space, OLLAMA_URL)
+        self.index = VectorStoreIndex.from_vector_store(vector_store=self.vector_store, embed_model=embed_model)
+        # Document and section summaries, searched before the chunks (small-to-big)
+        self.summary_store = self.summary_index = None
+        if SUMMARY_FIRST_RETRIEVAL:
+            self.summary_store = open_vector_store(domain.schema, self.space, summaries=True)
+            self.summary_index = VectorStoreIndex.from_vector_store(vector_store=self.summary_store,
+                                                                    embed_model=embed_model)
+        self.caches = {}
+        self.stale = False
+        # Repeated tool calls skip embedding and search until the next ingest batch
+        self.retrieval_cache = self.caches[f"retrieval@{self.embedding_version}"] = RetrievalCache(
+            self.metadata_engine, self.embedding_version
+        )
+        # Vector search restricted to the clusters nearest each query
+        self.cluster_router = ClusterRouter(self.metadata_engine, self.embedding_version, self.space.dim)
+        self.tools = [
+            make_metadata_query_tool(domain, self.metadata_engine),
+            make_reranked_query_tool(self.index, domain.schema, self.space, self.retrieval_cache,
+                                     self.cluster_router, self.summary_index),
+        ]
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+        self.warmed_at = time.time()
+        self._agent_factory = agent_factory
+        self._agent = None
+        self._agent_lock = threading.Lock()
+
+    @property
+    def agent(self):
+        """Orchestrator agent over this domain's tools, built on first use."""
+        if self._agent is None:
+            if self._agent_factory is None:
+                raise RuntimeError("DomainRegistry was created without an agent_factory")
+            with self._agent_lock:
+                if self._agent is None:
+                    self._agent = self._agent_factory(self.tools)
+        return self._agent
+
+    def cache(self, name: str) -> dict:
+        """A named cache for this domain, scoped to the embedding version it was filled under."""
+        return self.caches.setdefault(f"{name}@{self.embedding_version}", {})
+
+    def space_changed(self) -> bool:
+        """True when another embedding space has been cut over since this context was built."""
+        self.space_checked = time.monotonic()
+        return active_space(self.metadata_engine).version != self.embedding_version
+
+    def close(self):
+        self.retrieval_cache.results.clear()
+        self.caches.clear()
+        self.metadata_engine.dispose()
+        for store in (self.vector_store, self.summary_store):
+            client = getattr(store, "client", None)
+            if hasattr(client, "close"):
+                client.close()
+
+
+class DomainRegistry:
+    """Lazily warmed, independently evicted DomainContexts keyed by domain name."""
+
+    def __init__(self, domains=None, agent_factory=None, max_warm: int = MAX_WARM_DOMAINS,
+                 idle_evict_sec: float = DOMAIN_IDLE_EVICT_SEC, context_factory=DomainContext,
+                 space_check_sec: float = EMBEDDING_SPACE_CHECK_SEC):
+        self.domains = domains or DOMAINS
+        self.agent_factory = agent_factory
+        self.max_warm = max_warm
+        self.idle_evict_sec = idle_evict_sec
+        self.space_check_sec = space_check_sec
+        self._context_factory = context_factory
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+        self._warm_locks = {}
+
+    def _resolve(self, name: str = None) -> str:
+        name = name or DEFAULT_DOMAIN.name
+        if name not in self.domains:
+            raise KeyError(f"Unknown domain '{name}'. Configured domains: {', '.join(self.domains)}")
+        return name
+
+    def get(self, name: str = None) -> DomainContext:
+        """Return the warm context for ``name``, warming it if needed."""
+        name = self._resolve(name)
+        with self._lock:
+            ctx = self._contexts.get(name)
+            if ctx is not None:
+                self._contexts.move_to_end(name)
+                ctx.last_used = time.monotonic()
+            warm_lock = self._warm_locks.setdefault(name, threading.Lock())
+        if ctx is not None:
+            if time.monotonic() - ctx.space_checked < self.space_check_sec or not self._retire_if_moved(name, ctx):
+                return ctx
+
+        # Only callers for this domain wait while it warms
+        with warm_lock:
+            with self._lock:
+                ctx = self._contexts.get(name)
+            if ctx is None:
+                print(f"[DOMAIN] Warming domain '{name}' (schema {self.domains[name].schema})")
+                ctx = self._context_factory(self.domains[name], self.agent_factory)
+                with self._lock:
+                    self._contexts[name] = ctx
+                    evicted = self._pop_evictable(keep=name)
+                for old in evicted:
+                    print(f"[DOMAIN] Evicting domain '{old.domain.name}'")
+                    old.close()
+        ctx.last_used = time.monotonic()
+        return ctx
+
+    def _retire_if_moved(self, name: str, ctx: DomainContext) -> bool:
+        """Drop ``ctx`` if its embedding space is no longer active; returns whether it was dropped."""
+        if not getattr(ctx, "space_changed", None) or not ctx.space_changed():
+            return False
+        print(f"[DOMAIN] Embedding space changed for '{name}' (was {ctx.embedding_version}); rebuilding")
+        with self._lock:
+            if self._contexts.get(name) is ctx:
+                del self._contexts[name]
+            ctx.stale = True
+            idle = not ctx.in_flight
+        if idle:
+            ctx.close()
+        return True
+
+    @contextmanager
+    def use(self, name: str = None):
+        """Hold a domain context for the duration of a request (protects it from eviction)."""
+        ctx = self.get(name)
+        with self._lock:
+            ctx.in_flight += 1
+        try:
+            yield ctx
+        finally:
+            with self._lock:
+                ctx.in_flight -= 1
+                ctx.last_used = time.monotonic()
+                retired = getattr(ctx, "stale", False) and not ctx.in_flight
+            if retired:
+                ctx.close()
+
+    def _pop_evictable(self, keep: str) -> list[DomainContext]:
+        """Remove idle and over-cap contexts (caller holds the lock); returns them for closing."""
+        now = time.monotonic()
+        evicted = []
+        for name, ctx in list(self._contexts.items()):
+            if name != keep and not ctx.in_flight and now - ctx.last_used > self.idle_evict_sec:
+                evicted.append(self._contexts.pop(name))
+        for name, ctx in list(self._contexts.items()):
+            if len(self._contexts) <= self.max_warm:
+                break
+            if name != keep and not ctx.in_flight:
+                evicted.append(self._contexts.pop(name))
+        return evicted
+
+    def evict_idle(self) -> int:
+        """Close contexts idle longer than idle_evict_sec; returns how many."""
+        with self._lock:
+            now = time.monotonic()
+            stale = [n for n, c in self._contexts.items()
+                     if not c.in_flight and now - c.last_used > self.idle_evict_sec]
+            evicted = [self._contexts.pop(n) for n in stale]
+        for ctx in evicted:
+            ctx.close()
+        return len(evicted)
+
+    def evict(self, name: str) -> bool:
+        with self._lock:
+            ctx = self._contexts.pop(name, None)
+        if ctx is not None:
+            ctx.close()
+        return ctx is not None
+
+    def warm(self, names: list[str] = None):
+        """Pre-warm domains (all configured domains up to max_warm by default)."""
+        for name in (names or list(self.domains)[:self.max_warm]):
+            self.get(name)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "schema": ctx.domain.schema,
+                    "embedding_version": getattr(ctx, "embedding_version", None),
+                    "in_flight": ctx.in_flight,
+                    "idle_sec": round(now - ctx.last_used, 1),
+                    "caches": {k: len(v) if hasattr(v, "__len__") else None for k, v in ctx.caches.items()},
+                    "retrieval_cache": getattr(getattr(ctx, "retrieval_cache", None), "stats", None),
+                    "cluster_routing": getattr(getattr(ctx, "cluster_router", None), "stats", None),
+                    "query_embedding_cache": dict(embedding_cache.stats, size=len(embedding_cache)),
+                }
+                for name, ctx in self._contexts.items()
+            }
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def default_registry(agent_factory=None) -> DomainRegistry:
+    """The process-wide registry, shared by the agent and the default-domain tools."""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = DomainRegistry(agent_factory=agent_factory)
+        elif agent_factory is not None and _default_registry.agent_factory is None:
+            _default_registry.agent_factory = agent_factory
+    return _default_registry
@@ -2,7 +2,6 @@
 
 import logging
 from llama_index.core import Settings
-from llama_index.llms.ollama import Ollama
 from llama_index.core.tools import QueryEngineTool, FunctionTool
 import os
 
@@ -21,24 +20,15 @@ except (ImportError, AttributeError):
 logging.basicConfig(level=logging.DEBUG)
 Settings.debug = True
 
-from .metadata_tool import metadata_query_tool
-from .reranker_agent import reranked_query_tool
+from .domain_router import default_registry
+from src.common.llm_pool import llm_endpoints, pooled_llm
 
 # Use local Ollama models
 LLM_MODEL = os.getenv("LLM_MODEL", "qwen2.5:7b")  # Match actual model name
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 
-llm = Ollama(
-    model=LLM_MODEL,
-    base_url=OLLAMA_BASE_URL,
-    temperature=0.1,
-    request_timeout=120.0,
-)
-
-tools = [
-    metadata_query_tool,
-    reranked_query_tool
-]
+# Interactive priority on the shared endpoint pool: ingest-time bulk calls never starve queries
+llm = pooled_llm(LLM_MODEL, llm_endpoints(default_url=OLLAMA_BASE_URL), temperature=0.1)
 
 system_prompt = (
     "You are an expert Legal RAG Agent. Your goal is to answer questions by "
@@ -47,64 +37,78 @@ system_prompt = (
     "The final answer must be based only on the retrieved information."
 )
 
-# Create agent based on what's available
-if AGENT_TYPE == "ReActAgent":
-    try:
-        # Try creating ReActAgent with AgentRunner pattern
-        from llama_index.core.agent import AgentRunner, ReActAgentWorker
-        
-        agent_worker = ReActAgentWorker.from_tools(
-            tools=tools,
-            llm=llm,
-            verbose=True,
-        )
-        final_orchestrator_agent = AgentRunner(agent_worker)
-        print("[INFO] Created ReActAgent using AgentRunner pattern")
-        
-    except Exception as e:
-        print(f"[WARNING] Could not create ReActAgent: {e}")
-        # Fallback to direct ReActAgent instantiation
+def build_orchestrator_agent(tools):
+    """Create the orchestrator agent over ``tools`` using whichever agent API is available."""
+    if AGENT_TYPE == "ReActAgent":
         try:
-            final_orchestrator_agent = ReActAgent(
+            # Try creating ReActAgent with AgentRunner pattern
+            from llama_index.core.agent import AgentRunner, ReActAgentWorker
+
+            agent_worker = ReActAgentWorker.from_tools(
                 tools=tools,
                 llm=llm,
                 verbose=True,
             )
-        except Exception as e2:
-            print(f"[ERROR] Both ReActAgent methods failed: {e2}")
-            raise
-
-elif AGENT_TYPE == "AgentRunner":
-    agent_worker = ReActAgentWorker.from_tools(
-        tools=tools,
-        llm=llm,
-        verbose=True,
-    )
-    final_orchestrator_agent = AgentRunner(agent_worker)
-
-else:  # FunctionCalling
-    agent_worker = FunctionCallingAgentWorker.from_tools(
-        tools=tools,
-        llm=llm,
-        verbose=True,
-        system_prompt=system_prompt,
-    )
-    final_orchestrator_agent = AgentRunner(agent_worker)
+            print("[INFO] Created ReActAgent using AgentRunner pattern")
+            return AgentRunner(agent_worker)
+
+        except Exception as e:
+            print(f"[WARNING] Could not create ReActAgent: {e}")
+            # Fallback to direct ReActAgent instantiation
+            try:
+                return ReActAgent(
+                    tools=tools,
+                    llm=llm,
+                    verbose=True,
+                )
+            except Exception as e2:
+                print(f"[ERROR] Both ReActAgent methods failed: {e2}")
+                raise
+
+    elif AGENT_TYPE == "AgentRunner":
+        agent_worker = ReActAgentWorker.from_tools(
+            tools=tools,
+            llm=llm,
+            verbose=True,
+        )
+        return AgentRunner(agent_worker)
+
+    else:  # FunctionCalling
+        agent_worker = FunctionCallingAgentWorker.from_tools(
+            tools=tools,
+            llm=llm,
+            verbose=True,
+            system_prompt=system_prompt,
+        )
+        return AgentRunner(agent_worker)
+
+
+# Every domain's agent, the default domain's included, comes from the registry:
+# contexts are bound to the domain's active embedding space and rebuilt after a cutover
+domain_registry = default_registry(agent_factory=build_orchestrator_agent)
 
 print(f"[INFO] Using agent type: {AGENT_TYPE}")
 
 
-async def execute_agent_query_async(user_query: str, timeout: float = 60.0):
+async def execute_agent_query_async(user_query: str, timeout: float = 60.0, domain: str = None):
     """
     Execute a query through the orchestrator agent (async version).
     
     Args:
         user_query: User's natural language question
         timeout: Maximum time to wait for response (seconds)
+        domain: Domain (tenant) to route to; None uses the default domain
         
     Returns:
         Agent's response as a string
     """
+    with domain_registry.use(domain or None) as ctx:
+        print(f"[DOMAIN] '{ctx.domain.name}' on embedding space {ctx.embedding_version}")
+        return await _run_agent_query(ctx.agent, user_query, timeout)
+
+
+async def _run_agent_query(agent, user_query: str, timeout: float):
+    """Run one query through ``agent`` with a timeout; returns the answer as a string."""
     import asyncio
     
     print(f"\n[ORCHESTRATOR] Starting query for: {user_query}")
@@ -116,7 +120,7 @@ async def execute_agent_query_async(user_query: str, timeout: float = 60.0):
         # Run with timeout
         async def run_with_timeout():
             # The agent needs 'user_msg' parameter, not 'input'
-            handler = final_orchestrator_agent.run(user_msg=user_query)
+            handler = agent.run(user_msg=user_query)
             
             # Collect all events
             result = None
@@ -158,19 +162,20 @@ async def execute_agent_query_async(user_query: str, timeout: float = 60.0):
         raise
 
 
-def execute_agent_query(user_query: str, timeout: float = 60.0):
+def execute_agent_query(user_query: str, timeout: float = 60.0, domain: str = None):
     """
     Synchronous wrapper for the async agent query.
     
     Args:
         user_query: User's natural language question
         timeout: Maximum time to wait for response (seconds)
+        domain: Domain (tenant) to route to; None uses the default domain
         
     Returns:
         Agent's response as a string
     """
     import asyncio
-    return asyncio.run(execute_agent_query_async(user_query, timeout))
+    return asyncio.run(execute_agent_query_async(user_query, timeout, domain))
 
 
 if __name__ == "__main__":
@@ -179,7 +184,7 @@ if __name__ == "__main__":
     )
     
     try:
-        final_result = execute_agent_query(test_query)
+        final_result = execute_agent_query(test_query, domain=os.getenv("DOMAIN"))
         print("\n--- FINAL SYNTHESIS ---")
         print(final_result)
     except Exception as e:
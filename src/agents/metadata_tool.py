@@ -5,71 +5,52 @@ import json
 import yaml
 from pathlib import Path
 
-# --- LOAD CONFIG FROM YAML ---
-def load_domain_config(config_path: str = None) -> dict:
-    """Load domain configuration from YAML file."""
-    if config_path is None:
-        # Try to find config in common locations
-        possible_paths = [
-            Path("config/domain_config.yaml"),
-            Path("domain_config.yaml"),
-            Path("config.yaml"),
-        ]
-        for path in possible_paths:
-            if path.exists():
-                config_path = path
-                break
-        
-        if config_path is None:
-            raise FileNotFoundError(
-                "Could not find domain_config.yaml. "
-                "Please specify CONFIG_PATH environment variable or place config in: "
-                f"{[str(p) for p in possible_paths]}"
-            )
-    
-    with open(config_path, 'r') as f:
-        return yaml.safe_load(f)
+from src.common.config import load_domain_config
+from src.common.domains import default_domain_name, load_domains, scoped_engine
 
 # Load configuration
 config_path = os.getenv("CONFIG_PATH")
 config = load_domain_config(config_path)
 
-# Extract values from config
-DB_URI = config.get("metadata_db_uri")
-if not DB_URI:
-    raise ValueError(
-        "metadata_db_uri is not set in domain_config.yaml. "
-        "Please add it to your configuration file."
-    )
+# One entry per tenant; a flat config is a single domain in the public schema
+DOMAINS = load_domains(config)
+DEFAULT_DOMAIN = DOMAINS[default_domain_name(config, DOMAINS)]
 
+# Extract values for the default domain
+DB_URI = DEFAULT_DOMAIN.metadata_db_uri
 TABLE_NAME = "document_metadata_catalog"
-ENDPOINT_LIST = config.get("data_endpoints", [])
-DOCUMENT_LIMIT = config.get("document_limit", 100)
-RETRIEVAL_K = config.get("retrieval_k", 5)
+ENDPOINT_LIST = DEFAULT_DOMAIN.data_endpoints
+DOCUMENT_LIMIT = DEFAULT_DOMAIN.document_limit
+RETRIEVAL_K = DEFAULT_DOMAIN.retrieval_k
 
-if not ENDPOINT_LIST:
-    raise ValueError(
-        "data_endpoints is not set in domain_config.yaml. "
-        "Please add at least one data endpoint."
-    )
+for _domain in DOMAINS.values():
+    if not _domain.data_endpoints:
+        raise ValueError(
+            f"data_endpoints is not set for domain '{_domain.name}' in domain_config.yaml. "
+            "Please add at least one data endpoint."
+        )
 
 ENDPOINT_LIST_STR = "\n - ".join(ENDPOINT_LIST)
 
 # Create engine after validation
-engine = create_engine(DB_URI)
+engine = scoped_engine(DB_URI, DEFAULT_DOMAIN.schema)
 
 
-def metadata_query(user_query: str) -> str:
+def metadata_query(user_query: str, db_engine=None, limit: int = None) -> str:
     """
     Execute a SQL query based on user query (natural language),
     then return a JSON string or list of document IDs.
     
     Args:
         user_query: Natural language query about documents
+        db_engine: Domain-scoped engine (defaults to the default domain)
+        limit: Document limit (defaults to the default domain's)
         
     Returns:
         JSON-encoded list of document IDs matching the query
     """
+    db_engine = db_engine or engine
+    limit = limit or DOCUMENT_LIMIT
     # WARNING: This is a naive example. For production:
     # 1. Use proper LLM -> SQL translation
     # 2. Add query validation and sanitization
@@ -79,23 +60,24 @@ def metadata_query(user_query: str) -> str:
     try:
         # Apply document limit from config
         sql = text(
-            f"SELECT id FROM {TABLE_NAME} "
+            f"SELECT id, canonical_doc_id FROM {TABLE_NAME} "
             f"WHERE topic LIKE :topic "
             f"LIMIT :limit"
         )
         params = {
             "topic": f"%{user_query}%",
-            "limit": DOCUMENT_LIMIT
+            "limit": limit
         }
         
-        with engine.connect() as conn:
+        with db_engine.connect() as conn:
             result = conn.execute(sql, params)
-            ids = [row[0] for row in result]
+            # Near-duplicates may only be embedded under their canonical id
+            ids = list(dict.fromkeys(i for row in result for i in row if i))
         
         return json.dumps({
             "ids": ids,
             "count": len(ids),
-            "limit": DOCUMENT_LIMIT
+            "limit": limit
         })
     
     except Exception as e:
@@ -106,13 +88,24 @@ def metadata_query(user_query: str) -> str:
         })
 
 
-metadata_query_tool = FunctionTool.from_defaults(
-    fn=metadata_query,
-    name="metadata_query_tool",
-    description=(
-        f"Query document metadata in the SQL database to filter doc IDs. "
-        f"Input is a natural language question about topic, date, jurisdiction, etc. "
-        f"Returns a JSON-encoded list of document IDs (max {DOCUMENT_LIMIT} results). "
-        f"Data sources: {ENDPOINT_LIST_STR}"
-    ),
-)
\ No newline at end of file
+def make_metadata_query_tool(domain=DEFAULT_DOMAIN, db_engine=None) -> FunctionTool:
+    """Build the metadata filter tool bound to one domain's catalog."""
+    db_engine = db_engine or engine
+
+    def domain_metadata_query(user_query: str) -> str:
+        return metadata_query(user_query, db_engine=db_engine, limit=domain.document_limit)
+
+    endpoints = "\n - ".join(domain.data_endpoints)
+    return FunctionTool.from_defaults(
+        fn=domain_metadata_query,
+        name="metadata_query_tool",
+        description=(
+            f"Query document metadata in the SQL database to filter doc IDs. "
+            f"Input is a natural language question about topic, date, jurisdiction, etc. "
+            f"Returns a JSON-encoded list of document IDs (max {domain.document_limit} results). "
+            f"Data sources: {endpoints}"
+        ),
+    )
+
+
+metadata_query_tool = make_metadata_query_tool()
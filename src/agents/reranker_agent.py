@@ -1,60 +1,104 @@
 # /src/agents/reranker_agent.py (Updated for modern llama-index)
 
-from llama_index.core.tools import QueryEngineTool
+from llama_index.core.tools import FunctionTool
 from llama_index.core.postprocessor import SimilarityPostprocessor
+from llama_index.core.query_engine import RetrieverQueryEngine
 from .semantic_retriever_agent import index, create_filtered_query_engine
+from src.common.config import load_global_config
+from src.common.context_packing import ContextPacker
+from src.common.model_client import MODEL_WORKER_RERANKER, WorkerReranker
+from src.common.near_duplicates import NearDuplicateCollapser
+
+GLOBAL_CONFIG = load_global_config()
+
+# Copies and revisions of one filing should not fill the reranker's top_n
+collapser = NearDuplicateCollapser(
+    threshold=float(GLOBAL_CONFIG.get("near_duplicate_threshold", 0.85)),
+    duplicate_weight=float(GLOBAL_CONFIG.get("near_duplicate_weight", 0.5)),
+    shingle_size=int(GLOBAL_CONFIG.get("minhash_shingle_size", 5)),
+)
+
+# Only query-relevant, non-redundant sentences of the reranked nodes reach the LLM
+CONTEXT_PACKING = bool(GLOBAL_CONFIG.get("context_packing", True))
+packer = ContextPacker(
+    token_budget=int(GLOBAL_CONFIG.get("context_token_budget", 1500)),
+    redundancy_threshold=float(GLOBAL_CONFIG.get("context_redundancy_threshold", 0.7)),
+)
 
 # --- 1. Reranker ---
 # Note: FlagEmbeddingReranker requires a separate package installation
 # For now, using SimilarityPostprocessor as a fallback
 # To use FlagEmbeddingReranker, run: uv add llama-index-postprocessor-flag-embedding-reranker
+# With model_worker_rerank, query processes share one copy of the model held
+# by the model worker (st worker, src/common/model_worker.py) instead
+MODEL_WORKER_RERANK = bool(GLOBAL_CONFIG.get("model_worker_rerank", False))
 
-try:
-    from llama_index.postprocessor.flag_embedding_reranker import FlagEmbeddingReranker
-    
-    reranker = FlagEmbeddingReranker(
-        model="BAAI/bge-reranker-base",
-        top_n=5,
-    )
-except ImportError:
-    print("Warning: FlagEmbeddingReranker not available. Using SimilarityPostprocessor instead.")
-    print("To install: uv add llama-index-postprocessor-flag-embedding-reranker")
-    
-    # Fallback to similarity-based reranking
-    reranker = SimilarityPostprocessor(similarity_cutoff=0.7)
+if MODEL_WORKER_RERANK:
+    reranker = WorkerReranker(model=MODEL_WORKER_RERANKER, top_n=5)
+else:
+    try:
+        from llama_index.postprocessor.flag_embedding_reranker import FlagEmbeddingReranker
+
+        reranker = FlagEmbeddingReranker(
+            model="BAAI/bge-reranker-base",
+            top_n=5,
+        )
+    except ImportError:
+        print("Warning: FlagEmbeddingReranker not available. Using SimilarityPostprocessor instead.")
+        print("To install: uv add llama-index-postprocessor-flag-embedding-reranker")
 
+        # Fallback to similarity-based reranking
+        reranker = SimilarityPostprocessor(similarity_cutoff=0.7)
 
-def create_reranked_query_engine(doc_ids: list[str], query_str: str):
+
+def create_reranked_query_engine(doc_ids: list[str], query_str: str,
+                                 target_index=None, schema: str = "public", space=None, cache=None,
+                                 router=None, summary_index=None):
     """
     Create a query engine with metadata filtering and reranking.
     
     Args:
         doc_ids: List of document IDs from metadata filtering
         query_str: User's query string
+        target_index: Domain index (defaults to the default domain's context in the shared registry,
+            on its active embedding space)
+        schema: Domain schema for SQL-side retrieval
+        space: Embedding space target_index was opened on
+        cache: The domain's RetrievalCache
+        router: The domain's ClusterRouter
+        summary_index: The domain's document/section summary index
         
     Returns:
         Query response with reranked results
     """
     if not doc_ids:
         return "No documents found matching the strict metadata criteria."
+    if target_index is None:
+        # Default domain: resolved like any other, so it follows embedding space cutovers
+        from .domain_router import default_registry
 
-    # 1. Get the filtered query engine
-    filtered_engine = create_filtered_query_engine(doc_ids)
-    
-    # 2. Create retriever from index with filters
-    retriever = index.as_retriever(
-        similarity_top_k=50,
-        filters=filtered_engine.retriever.get_filters() if hasattr(filtered_engine, 'retriever') else None
-    )
+        with default_registry().use() as ctx:
+            return create_reranked_query_engine(
+                doc_ids, query_str, target_index=ctx.index, schema=ctx.domain.schema, space=ctx.space,
+                cache=ctx.retrieval_cache, router=ctx.cluster_router, summary_index=ctx.summary_index,
+            )
+
+    # 1. Get the filtered retriever (doc_id filter, storage-mode aware)
+    retriever = create_filtered_query_engine(doc_ids, query_str, target_index=target_index, schema=schema,
+                                             space=space, cache=cache, router=router,
+                                             summary_index=summary_index)
+    if retriever is None:
+        return "Vector index is not available."
 
-    # 3. Build Query Engine with reranker
-    reranked_query_engine = index.as_query_engine(
-        retriever=retriever,
-        node_postprocessors=[reranker],
+    # 2. Build Query Engine with reranker around that retriever
+    # (index.as_query_engine() would build its own unfiltered retriever)
+    reranked_query_engine = RetrieverQueryEngine.from_args(
+        retriever,
+        node_postprocessors=[collapser, reranker] + ([packer] if CONTEXT_PACKING else []),
         verbose=True
     )
 
-    # 4. Execute query
+    # 3. Execute query
     response = reranked_query_engine.query(query_str)
     return response
 
@@ -67,13 +111,30 @@ def reranked_query_wrapper(doc_ids: list[str], query_str: str) -> str:
     return str(response)
 
 
-reranked_query_tool = QueryEngineTool.from_defaults(
-    query_engine=None,  # Will be created dynamically
-    name="filtered_semantic_search",
-    description=(
-        "Use this tool ONLY AFTER the metadata filter has provided specific document IDs. "
-        "It performs a high-precision vector search on the filtered subset of legal documents "
-        "and synthesizes the final answer. "
-        "Requires two inputs: doc_ids (list of document IDs) and query_str (user's question)."
-    ),
-)
\ No newline at end of file
+RERANKED_TOOL_DESCRIPTION = (
+    "Use this tool ONLY AFTER the metadata filter has provided specific document IDs. "
+    "It performs a high-precision vector search on the filtered subset of legal documents "
+    "and synthesizes the final answer. "
+    "Requires two inputs: doc_ids (list of document IDs) and query_str (user's question)."
+)
+
+
+def make_reranked_query_tool(target_index=None, schema: str = "public", space=None, cache=None,
+                             router=None, summary_index=None) -> FunctionTool:
+    """Build the filtered search tool bound to one domain's index."""
+
+    def domain_reranked_query(doc_ids: list[str], query_str: str) -> str:
+        response = create_reranked_query_engine(doc_ids, query_str, target_index=target_index, schema=schema,
+                                                space=space, cache=cache, router=router,
+                                                summary_index=summary_index)
+        return str(response)
+
+    return FunctionTool.from_defaults(
+        fn=domain_reranked_query,
+        name="filtered_semantic_search",
+        description=RERANKED_TOOL_DESCRIPTION,
+    )
+
+
+# Default-domain tool: resolves the default domain's context (active embedding space) per call
+reranked_query_tool = make_reranked_query_tool()
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""
+/src/common/cluster_routing.py
+
+Cluster-routed retrieval.
+
+Ingestion already clusters documents (auto_cluster_documents) and tags
+every chunk with its ``cluster_id``, but retrieval used to search every
+vector. Now the centroid of each cluster (normalized mean of its
+documents' clustering embeddings) is stored on its ``document_clusters``
+row with the embedding space version it was computed in. At query time
+ClusterRouter compares the query embedding with the centroids and the
+vector search is restricted to the ``cluster_route_top_n`` nearest
+clusters:
+
+  pgvector  - ``metadata_->>'cluster_id' = ANY(...)``, backed by a b-tree
+              expression index on the chunk table
+  local     - the per-cluster row bitmaps LocalVectorIndex precomputes
+
+Routing is skipped (full search) when it is disabled, when a domain has no
+more clusters than ``top_n``, when the centroids belong to another
+embedding space (until re-ingest or ``st reembed`` recomputes them), or
+when the doc_id filter is already narrower than ``cluster_route_min_docs``.
+The recall/latency trade-off per ``top_n`` is measured by
+``st bench --route-top-n``.
+
+The first ingest of a domain runs k-means with about sqrt(documents)
+clusters (``n_clusters`` overrides it). Later ingests keep those clusters:
+new documents join the cluster with the nearest stored centroid
+(assign_clusters) and the centroids move to the running mean, so chunks
+already stored keep a valid ``cluster_id``.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import threading
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.common.config import load_global_config
+
+GLOBAL_CONFIG = load_global_config()
+CLUSTER_ROUTING = bool(GLOBAL_CONFIG.get("cluster_routing", True))
+CLUSTER_ROUTE_TOP_N = int(GLOBAL_CONFIG.get("cluster_route_top_n", 3))
+CLUSTER_ROUTE_MIN_DOCS = int(GLOBAL_CONFIG.get("cluster_route_min_docs", 200))
+
+
+def cluster_centroids(embeddings, clusters: dict) -> dict:
+    """
+    Normalized mean embedding per cluster.
+
+    Args:
+        embeddings: One embedding per document, in document order
+        clusters: {cluster_id: [document index, ...]} as auto_cluster_documents returns
+
+    Returns:
+        {cluster_id: float32 unit vector}
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    centroids = {}
+    for cluster_id, indices in clusters.items():
+        mean = matrix[list(indices)].mean(axis=0)
+        centroids[int(cluster_id)] = (mean / (np.linalg.norm(mean) or 1.0)).astype(np.float32)
+    return centroids
+
+
+def save_centroids(conn, centroids: dict, embedding_version: str):
+    """Store centroids on existing document_clusters rows."""
+    conn.execute(
+        text("UPDATE document_clusters SET centroid = :centroid, centroid_dim = :dim, "
+             "embedding_version = :version, updated_at = NOW() WHERE cluster_id = :id"),
+        [{"id": int(cid), "centroid": vec.astype(np.float32).tobytes(), "dim": int(vec.size),
+          "version": embedding_version}
+         for cid, vec in centroids.items()],
+    )
+
+
+def load_centroids(conn, embedding_version: str, dim: int = None) -> tuple[list, np.ndarray | None, list]:
+    """
+    Stored centroids of one embedding space.
+
+    Returns:
+        (cluster ids, centroid matrix or None, doc_count per cluster), in cluster_id order
+    """
+    dim_clause = "AND centroid_dim = :dim " if dim is not None else ""
+    rows = conn.execute(
+        text("SELECT cluster_id, centroid, doc_count FROM document_clusters "
+             f"WHERE centroid IS NOT NULL AND embedding_version = :version {dim_clause}"
+             "ORDER BY cluster_id"),
+        {"dim": dim, "version": embedding_version},
+    ).all()
+    matrix = np.stack([np.frombuffer(r.centroid, dtype=np.float32) for r in rows]) if rows else None
+    return [r.cluster_id for r in rows], matrix, [r.doc_count or 0 for r in rows]
+
+
+def assign_clusters(embeddings, cluster_ids: list, centroid_matrix: np.ndarray, doc_counts: list) -> tuple[dict, dict]:
+    """
+    Put documents in the existing cluster with the nearest centroid.
+
+    Args:
+        embeddings: One embedding per new document
+        cluster_ids: Stored cluster ids, matching the matrix rows
+        centroid_matrix: Stored unit centroids
+        doc_counts: Documents already in each cluster (weights of the running mean)
+
+    Returns:
+        ({cluster_id: [document index, ...]}, {cluster_id: updated unit centroid}) for the
+        clusters that received documents
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    nearest = np.argmax((matrix / np.where(norms == 0, 1.0, norms)) @ centroid_matrix.T, axis=1)
+    clusters, centroids = {}, {}
+    for row in np.unique(nearest):
+        indices = np.flatnonzero(nearest == row).tolist()
+        cluster_id = int(cluster_ids[row])
+        total = centroid_matrix[row] * max(doc_counts[row], 1) + matrix[indices].sum(axis=0)
+        clusters[cluster_id] = indices
+        centroids[cluster_id] = (total / (np.linalg.norm(total) or 1.0)).astype(np.float32)
+    return clusters, centroids
+
+
+def nearest_clusters(centroid_matrix: np.ndarray, cluster_ids: list, query, top_n: int) -> list:
+    """The ``top_n`` cluster ids whose centroids are most similar to ``query``."""
+    query = np.asarray(query, dtype=np.float32)
+    scores = centroid_matrix @ (query / (np.linalg.norm(query) or 1.0))
+    top_n = min(top_n, len(cluster_ids))
+    top = np.argpartition(-scores, top_n - 1)[:top_n]
+    return [cluster_ids[i] for i in top[np.argsort(-scores[top])]]
+
+
+class ClusterRouter:
+    """
+    One domain's centroids, reloaded when the index generation moves.
+
+    Args:
+        metadata_engine: Domain-scoped metadata engine (document_clusters)
+        space_version: Active embedding space; centroids from other spaces are ignored
+        dim: Embedding dimension of the space
+        top_n: Clusters searched per query
+        min_docs: Route only when the doc_id filter admits at least this many documents
+    """
+
+    def __init__(self, metadata_engine, space_version: str, dim: int, top_n: int = CLUSTER_ROUTE_TOP_N,
+                 min_docs: int = CLUSTER_ROUTE_MIN_DOCS, enabled: bool = CLUSTER_ROUTING):
+        self.metadata_engine = metadata_engine
+        self.space_version = space_version
+        self.dim = dim
+        self.top_n = top_n
+        self.min_docs = min_docs
+        self.enabled = enabled
+        self.cluster_ids = []
+        self.matrix = None
+        self._generation = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.stats = {"routed": 0, "unrouted": 0}
+
+    def _load(self):
+        try:
+            with self.metadata_engine.connect() as conn:
+                self.cluster_ids, self.matrix, _ = load_centroids(conn, self.space_version, self.dim)
+        except SQLAlchemyError:
+            self.cluster_ids, self.matrix = [], None
+
+    def route(self, query_embedding, generation=None, doc_count: int = None):
+        """
+        Cluster ids to search for this query, or None to search everything.
+
+        Args:
+            query_embedding: The query's embedding in the domain's active space
+            generation: Current index generation; centroids reload when it changes
+            doc_count: Size of the doc_id filter, if any
+        """
+        if not self.enabled or (doc_count is not None and doc_count < self.min_docs):
+            self.stats["unrouted"] += 1
+            return None
+        if not self._loaded or generation != self._generation:
+            with self._lock:
+                if not self._loaded or generation != self._generation:
+                    self._load()
+                    self._generation, self._loaded = generation, True
+        if self.matrix is None or len(self.cluster_ids) <= self.top_n:
+            self.stats["unrouted"] += 1
+            return None
+        self.stats["routed"] += 1
+        return nearest_clusters(self.matrix, self.cluster_ids, query_embedding, self.top_n)
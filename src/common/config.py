@@ -0,0 +1,68 @@
+"""
+/src/common/config.py
+
+Loaders for config/global_config.yaml and config/domain_config.yaml,
+shared by ingestion and the agents.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import yaml
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+
+@lru_cache(maxsize=None)
+def load_global_config(config_path: str = None) -> dict:
+    """
+    Load global configuration from YAML.
+
+    Looks at GLOBAL_CONFIG_PATH, then config/global_config.yaml under the
+    current directory, then under the project root. Returns an empty dict
+    if none exist so callers can fall back to their own defaults.
+    """
+    if config_path is None:
+        config_path = os.getenv("GLOBAL_CONFIG_PATH")
+    if config_path is None:
+        for path in (Path("config/global_config.yaml"), PROJECT_ROOT / "config/global_config.yaml"):
+            if path.exists():
+                config_path = path
+                break
+        else:
+            return {}
+
+    with open(config_path, 'r') as f:
+        return yaml.safe_load(f) or {}
+
+
+def load_domain_config(config_path: str = None) -> dict:
+    """Load domain configuration from YAML file."""
+    if config_path is None:
+        # Try to find config in common locations
+        possible_paths = [
+            Path("config/domain_config.yaml"),
+            Path("domain_config.yaml"),
+            Path("config.yaml"),
+            PROJECT_ROOT / "config/domain_config.yaml",
+        ]
+        for path in possible_paths:
+            if path.exists():
+                config_path = path
+                break
+        
+        if config_path is None:
+            raise FileNotFoundError(
+                "Could not find domain_config.yaml. "
+                "Please specify CONFIG_PATH environment variable or place config in: "
+                f"{[str(p) for p in possible_paths]}"
+            )
+    
+    with open(config_path, 'r') as f:
+        return yaml.safe_load(f)
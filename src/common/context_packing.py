@@ -0,0 +1,139 @@
+"""
+/src/common/context_packing.py
+
+Context packing between the reranker and the response synthesizer.
+
+Reranked nodes used to reach the synthesizer whole, so prompt size (and
+synthesis latency on a local 7B model) grew with chunk size rather than
+with how much of each chunk answers the question. ContextPacker keeps
+only the query-relevant sentences:
+
+  1. every node is split into sentences (the chunker's sentence rule)
+  2. each sentence is scored by IDF-weighted overlap with the query terms,
+     scaled by the node's rank, so a strong match in the top node beats
+     the same match further down
+  3. sentences repeated across nodes (same normalized text, or word-set
+     Jaccard >= ``redundancy_threshold`` with a kept sentence) are dropped
+  4. sentences are taken best-first until ``token_budget`` tokens are used
+
+Kept sentences go back into their nodes in original order. Nodes are
+copied, never edited, because retrieval results may be shared through the
+query cache. A node with no query term at all still offers its first
+sentence at a low score, so a highly ranked node is not lost to a
+vocabulary mismatch.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import math
+import re
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore
+
+from src.ingest.chunking import SENTENCE_RE, TokenCounter, normalized_hash
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+what which who whom whose when where why how do does did can could should would may might must shall
+""".split())
+
+
+def terms(text: str) -> set[str]:
+    return {w for w in WORD_RE.findall(text.lower()) if w not in STOPWORDS and len(w) > 1}
+
+
+def split_sentences(text: str) -> list[str]:
+    sentences = []
+    for paragraph in text.split("\n"):
+        sentences.extend(s.strip() for s in SENTENCE_RE.split(paragraph) if s.strip())
+    return sentences
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """
+    Trim reranked nodes to their query-relevant, non-redundant sentences within a token budget.
+
+    Nodes left with no sentences are dropped. ``stats`` holds the token
+    counts of the last call (before and after packing).
+    """
+
+    token_budget: int = Field(default=1500)
+    redundancy_threshold: float = Field(default=0.7)
+    rank_decay: float = Field(default=0.15)
+    _counter: TokenCounter = PrivateAttr(default_factory=TokenCounter)
+    _stats: dict = PrivateAttr(default_factory=dict)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    @property
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        if not nodes or query_bundle is None:
+            return nodes
+        query_terms = terms(query_bundle.query_str)
+
+        # (node index, position, sentence, terms)
+        sentences = [
+            (i, pos, s, terms(s))
+            for i, n in enumerate(nodes)
+            for pos, s in enumerate(split_sentences(n.node.get_content()))
+        ]
+        if not sentences:
+            return nodes
+        tokens = self._counter.count_many([s for _, _, s, _ in sentences])
+        df = {}
+        for *_, words in sentences:
+            for w in words & query_terms:
+                df[w] = df.get(w, 0) + 1
+        idf = {w: math.log(1 + len(sentences) / c) for w, c in df.items()}
+
+        scored = []
+        for (i, pos, sentence, words), n_tokens in zip(sentences, tokens):
+            lexical = sum(idf.get(w, 0.0) for w in words & query_terms) / math.sqrt(max(len(words), 1))
+            weight = 1.0 / (1.0 + self.rank_decay * i)
+            scored.append((lexical * weight, i, pos, sentence, words, n_tokens))
+        best_per_node = {}
+        for score, i, *_ in scored:
+            best_per_node[i] = max(best_per_node.get(i, 0.0), score)
+        # Lead sentence of a node that matched nothing, ranked below every real match
+        scored = [
+            (score if score > 0 else (1e-6 / (1 + i) if pos == 0 and not best_per_node[i] else 0.0),
+             i, pos, sentence, words, n_tokens)
+            for score, i, pos, sentence, words, n_tokens in scored
+        ]
+
+        used, kept, seen_hashes, kept_words = 0, {}, set(), []
+        for score, i, pos, sentence, words, n_tokens in sorted(scored, key=lambda s: (-s[0], s[1], s[2])):
+            if score <= 0 or used + n_tokens > self.token_budget:
+                continue
+            h = normalized_hash(sentence)
+            if h in seen_hashes or any(
+                len(words & other) / max(len(words | other), 1) >= self.redundancy_threshold
+                for other in kept_words
+            ):
+                continue
+            seen_hashes.add(h)
+            kept_words.append(words)
+            kept.setdefault(i, []).append((pos, sentence))
+            used += n_tokens
+
+        packed = []
+        for i, n in enumerate(nodes):
+            if i not in kept:
+                continue
+            node = n.node.model_copy()
+            node.set_content(" ".join(s for _, s in sorted(kept[i])))
+            packed.append(NodeWithScore(node=node, score=n.score))
+        self._stats = {"nodes_in": len(nodes), "nodes_out": len(packed),
+                       "tokens_in": sum(tokens), "tokens_out": used}
+        return packed
@@ -0,0 +1,243 @@
+"""
+/src/common/embedding_spaces.py
+
+Versioned embedding spaces.
+
+An embedding space is one embedding model + dimension and the vectors it
+produced: a pgvector table in rag_db (``document_vectors`` for the original
+space, ``document_vectors_<version>`` after that) or a local index
+directory. The ``embedding_spaces`` table in metadata_catalog (per domain
+schema) records every space and which one is ``active``. Ingestion writes
+to and queries read from the active space only.
+
+A model migration builds a new space next to the active one
+(src/ingest/reembed.py), then cuts over by flipping ``status`` in a single
+transaction. Query processes notice the new version on their next check and
+rebuild their domain context; anything cached is namespaced by version.
+
+Until a migration has been run, the registry holds one space built from
+global_config.yaml (embedding_model_uri / embedding_dim / embedding_version),
+so single-space deployments need no setup.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.common.config import load_global_config
+
+BASE_VECTOR_TABLE = "document_vectors"
+SPACE_STATUSES = ("building", "ready", "active", "retired")
+
+
+class SpaceChangedError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class EmbeddingSpace:
+    version: str
+    model: str
+    dim: int
+    provider: str = "ollama"
+    table_name: str = BASE_VECTOR_TABLE
+    status: str = "active"
+
+    def local_dir(self, base) -> Path:
+        """Local index directory for this space under a domain's index dir."""
+        base = Path(base).expanduser()
+        return base if self.table_name == BASE_VECTOR_TABLE else base / f"space_{self.version}"
+
+
+def space_table_name(version: str) -> str:
+    slug = re.sub(r"[^a-z0-9_]", "_", version.lower())
+    return f"{BASE_VECTOR_TABLE}_{slug}"
+
+
+def default_space(config: dict = None) -> EmbeddingSpace:
+    """The space global_config.yaml describes (used before any migration)."""
+    config = load_global_config() if config is None else config
+    model = config.get("embedding_model_uri", "nomic-embed-text")
+    provider = config.get("embedding_provider", "ollama")
+    return EmbeddingSpace(
+        version=str(config.get("embedding_version", "v1")),
+        model=model if ":" in model or provider != "ollama" else f"{model}:latest",
+        dim=int(config.get("embedding_dim", 768)),
+        provider=provider,
+    )
+
+
+def make_embed_model(space: EmbeddingSpace, base_url: str, **kwargs):
+    """
+    LlamaIndex embedding model for a space.
+
+    ``huggingface_local`` spaces are embedded by the shared model worker
+    (st worker), which holds the sentence-transformers model once per host.
+    """
+    if space.provider == "huggingface_local":
+        from src.common.model_client import WorkerEmbedding
+
+        return WorkerEmbedding(model_name=space.model, **kwargs)
+    if space.provider != "ollama":
+        raise ValueError(f"Embedding provider '{space.provider}' is not supported yet (space {space.version})")
+    from llama_index.embeddings.ollama import OllamaEmbedding
+
+    return OllamaEmbedding(model_name=space.model, base_url=base_url, **kwargs)
+
+
+def ensure_space_table(metadata_engine, schema: str = "public"):
+    """Create the registry and seed it with the configured space if empty."""
+    seed = default_space()
+    with metadata_engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.embedding_spaces (
+                version TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                provider TEXT NOT NULL DEFAULT 'ollama',
+                table_name TEXT NOT NULL,
+                status TEXT NOT NULL,
+                rows_embedded INTEGER DEFAULT 0,
+                cursor TEXT,
+                created_at TIMESTAMP DEFAULT NOW(),
+                activated_at TIMESTAMP
+            )
+        """))
+        conn.execute(text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS idx_one_active_space "
+            f"ON {schema}.embedding_spaces ((true)) WHERE status = 'active'"
+        ))
+        conn.execute(
+            text(f"""
+                INSERT INTO {schema}.embedding_spaces (version, model, dim, provider, table_name, status, activated_at)
+                SELECT :version, :model, :dim, :provider, :table_name, 'active', NOW()
+                WHERE NOT EXISTS (SELECT 1 FROM {schema}.embedding_spaces)
+            """),
+            {"version": seed.version, "model": seed.model, "dim": seed.dim,
+             "provider": seed.provider, "table_name": seed.table_name},
+        )
+
+
+def _row_to_space(row) -> EmbeddingSpace:
+    return EmbeddingSpace(version=row.version, model=row.model, dim=row.dim, provider=row.provider,
+                          table_name=row.table_name, status=row.status)
+
+
+def get_space(metadata_engine, version: str):
+    with metadata_engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT version, model, dim, provider, table_name, status FROM embedding_spaces "
+                 "WHERE version = :version"),
+            {"version": version},
+        ).first()
+    return _row_to_space(row) if row else None
+
+
+def list_spaces(metadata_engine) -> list[dict]:
+    with metadata_engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT version, model, dim, table_name, status, rows_embedded, created_at, activated_at "
+            "FROM embedding_spaces ORDER BY created_at"
+        ))
+        return [dict(r._mapping) for r in rows]
+
+
+def active_space(metadata_engine) -> EmbeddingSpace:
+    """
+    The space queries and ingestion should use.
+
+    Falls back to the configured default when the registry is missing or
+    unreachable, so a fresh install behaves as before.
+    """
+    try:
+        with metadata_engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT version, model, dim, provider, table_name, status FROM embedding_spaces "
+                "WHERE status = 'active'"
+            )).first()
+    except SQLAlchemyError:
+        row = None
+    return _row_to_space(row) if row else default_space()
+
+
+def register_space(metadata_engine, version: str, model: str, dim: int, provider: str = "ollama") -> EmbeddingSpace:
+    """Add a new space in ``building`` state (or return the existing unfinished one)."""
+    existing = get_space(metadata_engine, version)
+    if existing is not None:
+        if existing.status in ("active", "retired"):
+            raise ValueError(f"Embedding space {version} already exists with status '{existing.status}'")
+        return existing
+    space = EmbeddingSpace(version=version, model=model, dim=dim, provider=provider,
+                           table_name=space_table_name(version), status="building")
+    with metadata_engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO embedding_spaces (version, model, dim, provider, table_name, status) "
+                 "VALUES (:version, :model, :dim, :provider, :table_name, 'building')"),
+            {"version": version, "model": model, "dim": dim, "provider": provider, "table_name": space.table_name},
+        )
+    return space
+
+
+def save_progress(metadata_engine, version: str, cursor: str, rows_embedded: int, status: str = None):
+    with metadata_engine.begin() as conn:
+        conn.execute(
+            text("UPDATE embedding_spaces SET cursor = :cursor, rows_embedded = :rows, "
+                 "status = COALESCE(:status, status) WHERE version = :version"),
+            {"cursor": cursor, "rows": rows_embedded, "status": status, "version": version},
+        )
+
+
+def load_progress(metadata_engine, version: str) -> tuple[str, int]:
+    with metadata_engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT cursor, rows_embedded FROM embedding_spaces WHERE version = :version"),
+            {"version": version},
+        ).first()
+    return (row.cursor, row.rows_embedded or 0) if row else (None, 0)
+
+
+def check_active(conn, version: str):
+    """
+    Raise SpaceChangedError unless ``version`` is still the active space.
+
+    Locks the active row until ``conn``'s transaction ends, so a cutover
+    waits for a write that passed this check to commit.
+    """
+    active = conn.execute(text("SELECT version FROM embedding_spaces WHERE status = 'active' FOR SHARE")).scalar()
+    if active is not None and active != version:
+        raise SpaceChangedError(f"Embedding space {version} was retired (active space is now {active})")
+
+
+def cut_over(metadata_engine, version: str, before_commit=None) -> EmbeddingSpace:
+    """
+    Make ``version`` the active space, retiring the current one, in one transaction.
+
+    Args:
+        metadata_engine: Domain-scoped metadata engine
+        version: Space to activate; must be 'ready'
+        before_commit: Optional callable(conn) run in the same transaction
+            (guards that may raise, the new space's cluster centroids)
+    """
+    with metadata_engine.begin() as conn:
+        status = conn.execute(
+            text("SELECT status FROM embedding_spaces WHERE version = :version FOR UPDATE"),
+            {"version": version},
+        ).scalar()
+        if status != "ready":
+            raise ValueError(f"Embedding space {version} is '{status}', not 'ready'; finish the re-embed first")
+        if before_commit is not None:
+            before_commit(conn)
+        conn.execute(text("UPDATE embedding_spaces SET status = 'retired' WHERE status = 'active'"))
+        conn.execute(
+            text("UPDATE embedding_spaces SET status = 'active', activated_at = NOW() WHERE version = :version"),
+            {"version": version},
+        )
+    return get_space(metadata_engine, version)
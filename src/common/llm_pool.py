@@ -0,0 +1,459 @@
+"""
+/src/common/llm_pool.py
+
+LLM client pool over several Ollama endpoints.
+
+Every LLM call (document classification and cluster naming at ingest,
+agent reasoning and synthesis at query time) used to go to one Ollama
+client, one request at a time. PooledOllama is a LlamaIndex LLM whose
+requests are spread over ``llm_endpoints``:
+
+  routing     - each request goes to the healthy endpoint with the fewest
+                outstanding requests (ties rotate)
+  capacity    - at most ``max_concurrency`` requests per endpoint; callers
+                wait for a slot instead of piling onto one server
+  priority    - ``interactive`` requests (queries) take any free slot;
+                ``bulk`` requests (ingest) never take the last
+                ``reserved_interactive`` slots and yield to waiting
+                interactive requests. A pool only sees its own process,
+                so bulk requests also take one of ``bulk_slots_per_host``
+                host-wide slots (file locks under ``bulk_lock_dir``):
+                several ingests or batch runs on one host can't fill
+                every endpoint slot that query processes need
+  health      - a background thread polls ``/api/tags``; connection errors
+                and 5xx responses mark an endpoint down at once, and the
+                request fails over to the next endpoint (when all are down,
+                they are still tried rather than failing every request
+                until the next health check)
+  batching    - complete_many() runs a list of prompts concurrently
+                through the pool (ingest-time classification/naming)
+
+Requests are plain HTTP against Ollama's /api/generate and /api/chat, so
+the pool can be exercised against local stub servers.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import asyncio
+import fcntl
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Sequence
+
+import requests
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponseAsyncGen,
+    MessageRole,
+)
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms import CompletionResponse, CompletionResponseGen, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from requests.adapters import HTTPAdapter
+
+from src.common.config import load_global_config
+
+PRIORITIES = ("interactive", "bulk")
+DEFAULT_BULK_LOCK_DIR = "~/.swamp-thing/llm_bulk"
+
+
+class NoHealthyEndpoint(RuntimeError):
+    pass
+
+
+class HostSlots:
+    """
+    At most ``slots`` holders at once across every process on this host.
+
+    Each slot is an exclusive flock on one file in ``directory``; the kernel
+    drops it when its holder exits, so a crashed ingest never leaks a slot.
+    """
+
+    def __init__(self, directory, slots: int, poll_sec: float = 0.05):
+        self.directory = Path(directory).expanduser()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.slots = slots
+        self.poll_sec = poll_sec
+
+    def _try_lock(self):
+        for i in range(self.slots):
+            handle = open(self.directory / f"slot{i}.lock", "a")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return handle
+            except BlockingIOError:
+                handle.close()
+        return None
+
+    @contextmanager
+    def hold(self, timeout: float = None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        handle = self._try_lock()
+        while handle is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"No host-wide bulk LLM slot free within {timeout}s ({self.directory})")
+            time.sleep(self.poll_sec)
+            handle = self._try_lock()
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            handle.close()
+
+
+class Endpoint:
+    """One Ollama server and its live state."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.served = 0
+        self.last_error = None
+
+    def snapshot(self) -> dict:
+        return {"url": self.url, "healthy": self.healthy, "outstanding": self.outstanding,
+                "served": self.served, "failures": self.failures, "last_error": self.last_error}
+
+
+class EndpointPool:
+    """
+    Least-outstanding routing with per-endpoint capacity, priorities and health checks.
+
+    Args:
+        urls: Ollama base URLs
+        max_concurrency: Requests in flight per endpoint
+        reserved_interactive: Slots (pool-wide) bulk requests may not take
+        health_check_sec: Seconds between /api/tags polls (0 disables the thread)
+        timeout: Read timeout per request, in seconds
+        connect_timeout: Connect timeout per request, in seconds
+        bulk_slots_per_host: Bulk requests in flight across all processes on this host (0: no host limit)
+        bulk_lock_dir: Directory of the host-wide bulk slot lock files
+    """
+
+    def __init__(self, urls: Sequence[str], max_concurrency: int = 2, reserved_interactive: int = 1,
+                 health_check_sec: float = 15, timeout: float = 120, connect_timeout: float = 3,
+                 bulk_slots_per_host: int = 0, bulk_lock_dir=DEFAULT_BULK_LOCK_DIR):
+        if not urls:
+            raise ValueError("EndpointPool needs at least one endpoint URL")
+        self.endpoints = [Endpoint(u) for u in dict.fromkeys(urls)]
+        self.max_concurrency = max_concurrency
+        self.reserved_interactive = min(reserved_interactive, len(self.endpoints) * max_concurrency - 1)
+        self.timeout = (connect_timeout, timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=max_concurrency * 2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.bulk_slots = HostSlots(bulk_lock_dir, bulk_slots_per_host) if bulk_slots_per_host > 0 else None
+        self._cond = threading.Condition()
+        self._waiting = {p: 0 for p in PRIORITIES}
+        self._rotation = itertools.count()
+        self._stop = threading.Event()
+        self._health_thread = None
+        if health_check_sec > 0:
+            self._health_thread = threading.Thread(
+                target=self._health_loop, args=(health_check_sec,), name="llm-health", daemon=True
+            )
+            self._health_thread.start()
+
+    # --- routing ---
+
+    def _free_slots(self) -> int:
+        healthy = [e for e in self.endpoints if e.healthy] or self.endpoints
+        return sum(self.max_concurrency - e.outstanding for e in healthy)
+
+    def _pick(self, exclude) -> Endpoint | None:
+        usable = [e for e in self.endpoints if e not in exclude]
+        # With every endpoint down, keep trying them rather than failing until the next health check
+        healthy = [e for e in usable if e.healthy] or usable
+        candidates = [e for e in healthy if e.outstanding < self.max_concurrency]
+        if not candidates:
+            return None
+        offset = next(self._rotation)
+        rotated = candidates[offset % len(candidates):] + candidates[:offset % len(candidates)]
+        return min(rotated, key=lambda e: e.outstanding)
+
+    def _can_take(self, priority: str) -> bool:
+        if priority == "interactive":
+            return True
+        return not self._waiting["interactive"] and self._free_slots() > self.reserved_interactive
+
+    def acquire(self, priority: str = "interactive", exclude=(), timeout: float = None) -> Endpoint:
+        """Block until an endpoint slot is free for ``priority``; raise once every endpoint was excluded."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {PRIORITIES}, got '{priority}'")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    if all(e in exclude for e in self.endpoints):
+                        raise NoHealthyEndpoint(
+                            "No LLM endpoint left to try: "
+                            + ", ".join(f"{e.url} ({e.last_error})" for e in self.endpoints)
+                        )
+                    endpoint = self._pick(exclude) if self._can_take(priority) else None
+                    if endpoint is not None:
+                        endpoint.outstanding += 1
+                        return endpoint
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"No LLM slot free within {timeout}s ({priority})")
+                    # Health changes are noticed by the periodic wake-up
+                    self._cond.wait(min(remaining, 1.0) if remaining is not None else 1.0)
+            finally:
+                self._waiting[priority] -= 1
+
+    def release(self, endpoint: Endpoint, error: str = None):
+        with self._cond:
+            endpoint.outstanding -= 1
+            if error is None:
+                endpoint.served += 1
+                endpoint.failures = 0
+                endpoint.healthy = True
+            else:
+                endpoint.failures += 1
+                endpoint.last_error = error
+                endpoint.healthy = False
+                print(f"⚠️  LLM endpoint {endpoint.url} marked down: {error}")
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: str = "interactive", exclude=()):
+        endpoint = self.acquire(priority, exclude)
+        error = None
+        try:
+            yield endpoint
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = f"{type(e).__name__}"
+            raise
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code >= 500:
+                error = f"HTTP {e.response.status_code}"
+            raise
+        finally:
+            self.release(endpoint, error)
+
+    def post(self, path: str, payload: dict, priority: str = "interactive") -> requests.Response:
+        """POST to the least-loaded healthy endpoint, failing over on connection errors and 5xx."""
+        host_slot = self.bulk_slots.hold() if priority == "bulk" and self.bulk_slots else nullcontext()
+        with host_slot:
+            return self._post(path, payload, priority)
+
+    def _post(self, path: str, payload: dict, priority: str) -> requests.Response:
+        tried, last_error = [], None
+        for _ in range(len(self.endpoints)):
+            try:
+                with self.slot(priority, exclude=tried) as endpoint:
+                    tried.append(endpoint)
+                    response = self.session.post(f"{endpoint.url}{path}", json=payload, timeout=self.timeout)
+                    response.raise_for_status()
+                    return response
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = e
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code < 500:
+                    raise
+                last_error = e
+            except NoHealthyEndpoint:
+                break
+        raise NoHealthyEndpoint(f"All LLM endpoints failed for {path}: {last_error}")
+
+    # --- health ---
+
+    def check(self):
+        """Probe every endpoint once and update its health."""
+        for endpoint in self.endpoints:
+            try:
+                ok = self.session.get(f"{endpoint.url}/api/tags", timeout=(self.timeout[0], 5)).ok
+                error = None if ok else "health check failed"
+            except requests.RequestException as e:
+                ok, error = False, type(e).__name__
+            with self._cond:
+                if ok and not endpoint.healthy:
+                    print(f"✅ LLM endpoint {endpoint.url} is back")
+                endpoint.healthy = ok
+                endpoint.last_error = error or endpoint.last_error
+                self._cond.notify_all()
+
+    def _health_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            self.check()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"endpoints": [e.snapshot() for e in self.endpoints], "waiting": dict(self._waiting)}
+
+    def close(self):
+        self._stop.set()
+        self.session.close()
+
+
+class PooledOllama(CustomLLM):
+    """
+    Ollama LLM served through an EndpointPool.
+
+    ``priority`` tags every request this instance makes; use
+    ``llm.with_priority("bulk")`` for a view of the same pool at another priority.
+    """
+
+    model: str = Field(default="qwen2.5:7b")
+    temperature: float = Field(default=0.1)
+    context_window: int = Field(default=8192)
+    num_output: int = Field(default=512)
+    priority: str = Field(default="interactive")
+    _pool: EndpointPool = PrivateAttr()
+
+    def __init__(self, pool: EndpointPool, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._pool = pool
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "PooledOllama"
+
+    @property
+    def pool(self) -> EndpointPool:
+        return self._pool
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=self.context_window, num_output=self.num_output,
+                           model_name=self.model, is_chat_model=True)
+
+    def with_priority(self, priority: str) -> "PooledOllama":
+        return PooledOllama(self._pool, model=self.model, temperature=self.temperature,
+                            context_window=self.context_window, num_output=self.num_output, priority=priority)
+
+    def _options(self, kwargs: dict) -> dict:
+        return {"temperature": kwargs.pop("temperature", self.temperature), "num_ctx": self.context_window}
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        body = self._pool.post("/api/generate", {
+            "model": self.model, "prompt": prompt, "stream": False, "options": self._options(kwargs),
+        }, priority=self.priority).json()
+        return CompletionResponse(text=body.get("response", ""), raw=body)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        response = self.complete(prompt, formatted=formatted, **kwargs)
+        yield CompletionResponse(text=response.text, delta=response.text, raw=response.raw)
+
+    @llm_chat_callback()
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        body = self._pool.post("/api/chat", {
+            "model": self.model,
+            "messages": [{"role": m.role.value, "content": m.content or ""} for m in messages],
+            "stream": False,
+            "options": self._options(kwargs),
+        }, priority=self.priority).json()
+        message = body.get("message") or {}
+        return ChatResponse(
+            message=ChatMessage(role=MessageRole(message.get("role", "assistant")), content=message.get("content", "")),
+            raw=body,
+        )
+
+    @llm_chat_callback()
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        response = self.chat(messages, **kwargs)
+        yield ChatResponse(message=response.message, delta=response.message.content, raw=response.raw)
+
+    # Waiting for a slot must not block the agent's event loop
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return await asyncio.to_thread(self.complete, prompt, formatted, **kwargs)
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return await asyncio.to_thread(self.chat, messages, **kwargs)
+
+    async def astream_complete(self, prompt: str, formatted: bool = False,
+                               **kwargs: Any) -> CompletionResponseAsyncGen:
+        response = await self.acomplete(prompt, formatted, **kwargs)
+
+        async def gen() -> CompletionResponseAsyncGen:
+            yield CompletionResponse(text=response.text, delta=response.text, raw=response.raw)
+
+        return gen()
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        response = await self.achat(messages, **kwargs)
+
+        async def gen() -> ChatResponseAsyncGen:
+            yield ChatResponse(message=response.message, delta=response.message.content, raw=response.raw)
+
+        return gen()
+
+
+def complete_many(llm, prompts: list[str], max_workers: int = None) -> list[str]:
+    """
+    Complete ``prompts`` concurrently, in order.
+
+    With a PooledOllama the pool bounds concurrency per endpoint (and, at
+    bulk priority, the host-wide bulk slots); any other LLM is called
+    ``max_workers`` (default 1) at a time.
+    """
+    if not prompts:
+        return []
+    if max_workers is None:
+        pool = getattr(llm, "pool", None)
+        max_workers = len(pool.endpoints) * pool.max_concurrency if isinstance(pool, EndpointPool) else 1
+        if isinstance(pool, EndpointPool) and llm.priority == "bulk" and pool.bulk_slots:
+            max_workers = min(max_workers, pool.bulk_slots.slots)
+    if max_workers <= 1:
+        return [llm.complete(p).text for p in prompts]
+    with ThreadPoolExecutor(min(max_workers, len(prompts)), thread_name_prefix="llm") as executor:
+        return [r.text for r in executor.map(llm.complete, prompts)]
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def llm_endpoints(config: dict = None, default_url: str = None) -> list[str]:
+    """LLM_ENDPOINTS (comma-separated) or configured ``llm_endpoints``, falling back to one URL."""
+    config = load_global_config() if config is None else config
+    if os.getenv("LLM_ENDPOINTS"):
+        return [u.strip() for u in os.getenv("LLM_ENDPOINTS").split(",") if u.strip()]
+    urls = config.get("llm_endpoints") or [default_url or config.get("ollama_base_url", "http://localhost:11434")]
+    return [urls] if isinstance(urls, str) else list(urls)
+
+
+def pooled_llm(model: str, urls: Sequence[str] = None, priority: str = "interactive",
+               temperature: float = 0.1, config: dict = None, **kwargs) -> PooledOllama:
+    """
+    PooledOllama on the process-wide pool for ``urls`` (created on first use).
+
+    Args:
+        model: Ollama model tag
+        urls: Endpoint URLs (default: llm_endpoints from global_config.yaml)
+        priority: interactive or bulk
+        temperature: Sampling temperature
+        config: Global config dict (default: loaded from global_config.yaml)
+    """
+    config = load_global_config() if config is None else config
+    urls = tuple(urls or llm_endpoints(config))
+    with _pools_lock:
+        pool = _pools.get(urls)
+        if pool is None:
+            pool = _pools[urls] = EndpointPool(
+                urls,
+                max_concurrency=int(config.get("llm_max_concurrency_per_endpoint", 2)),
+                reserved_interactive=int(config.get("llm_reserved_interactive_slots", 1)),
+                health_check_sec=float(config.get("llm_health_check_sec", 15)),
+                timeout=float(config.get("llm_request_timeout_sec", 120)),
+                bulk_slots_per_host=int(config.get("llm_bulk_slots_per_host", 1)),
+                bulk_lock_dir=os.getenv("LLM_BULK_LOCK_DIR", config.get("llm_bulk_lock_dir", DEFAULT_BULK_LOCK_DIR)),
+            )
+    return PooledOllama(pool, model=model, temperature=temperature, priority=priority, **kwargs)
@@ -0,0 +1,595 @@
+"""
+/src/common/local_vector_store.py
+
+In-process vector index for single-node deployments, no Postgres required.
+
+Everything lives in one directory and is opened with np.memmap, so loading
+an existing index costs a few file opens regardless of its size:
+
+  index.json          dim, row count, graph degree
+  vectors.f32         (n, dim) float32, L2-normalized, append-only
+  graph.i32           (n, M) neighbor lists of a navigable small-world graph
+  records.jsonl       serialized nodes, one per row
+  offsets.i64         byte offset of each row in records.jsonl
+  doc_codes.i32       per-row doc_id code (vocabulary in doc_vocab.json)
+  cluster_codes.i32   per-row cluster_id code (vocabulary in cluster_vocab.json)
+  cluster_bitmaps.npy packed row bitmap per cluster, rebuilt on append
+  tombstones.u8       1 for deleted rows
+
+Cluster filters read the precomputed bitmaps. Documents are too numerous
+for one persisted bitmap each, so doc_id bitmaps are derived from the code
+column on demand and cached. Selective filters are answered by exact scan
+of the matching rows; broad ones by beam search over the graph.
+
+Appends are incremental: new rows are linked into the existing graph
+without rebuilding it. One writer per directory; any number of readers.
+Readers open the index read-only and reopen it when the writer commits
+(index.json is rewritten last, so a reader never sees a half-linked batch).
+A batch interrupted before that leaves rows past the header's count; the
+next writable open truncates them and unlinks them from the graph, so
+appends resume at the committed row count.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import heapq
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Sequence
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+NO_CLUSTER = -1
+
+
+class LocalVectorIndex:
+    """Memory-mapped float32 matrix with a persisted ANN graph and filter bitmaps."""
+
+    def __init__(self, path, dim: int = None, m: int = 16, ef_construction: int = 64,
+                 ef_search: int = 64, brute_force_limit: int = 20_000, read_only: bool = False):
+        """
+        Open (or create) an index directory.
+
+        Args:
+            path: Index directory
+            dim: Vector dimension, required when creating a new index
+            m: Graph degree (neighbors kept per row)
+            ef_construction: Beam width used when linking new rows
+            ef_search: Default beam width for queries
+            brute_force_limit: Candidate sets at or below this size are scanned exactly
+            read_only: Map every file read-only and never create the directory (query processes)
+        """
+        self.path = Path(path).expanduser()
+        self.read_only = read_only
+        if not read_only:
+            self.path.mkdir(parents=True, exist_ok=True)
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.brute_force_limit = brute_force_limit
+        self._lock = threading.RLock()
+        self._doc_bitmaps = OrderedDict()
+
+        header_path = self.path / "index.json"
+        self._stamp = self._header_stamp()
+        if header_path.exists():
+            self.header = json.loads(header_path.read_text())
+        else:
+            if dim is None:
+                raise ValueError(f"No index at {self.path}; pass dim to create one")
+            self.header = {"dim": dim, "count": 0, "m": m, "version": 1}
+            if not read_only:
+                self._write_header()
+
+        self.doc_vocab = self._read_json("doc_vocab.json", {})
+        self.cluster_vocab = self._read_json("cluster_vocab.json", {})
+        self._records = None
+        if not read_only:
+            self._truncate_uncommitted()
+        self._open()
+
+    # --- persistence helpers ---
+
+    @property
+    def dim(self) -> int:
+        return self.header["dim"]
+
+    @property
+    def count(self) -> int:
+        return self.header["count"]
+
+    @property
+    def m(self) -> int:
+        return self.header["m"]
+
+    def _read_json(self, name: str, default):
+        p = self.path / name
+        return json.loads(p.read_text()) if p.exists() else default
+
+    def _write_json(self, name: str, value):
+        tmp = self.path / f"{name}.tmp"
+        tmp.write_text(json.dumps(value))
+        tmp.replace(self.path / name)
+
+    def _write_header(self):
+        self._write_json("index.json", self.header)
+        self._stamp = self._header_stamp()
+
+    def _header_stamp(self):
+        try:
+            st = (self.path / "index.json").stat()
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def stale(self) -> bool:
+        """True when another process has committed rows since this index was opened."""
+        return self._header_stamp() != self._stamp
+
+    def _map(self, name: str, dtype, shape, mode="r"):
+        if shape[0] == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self.path / name, dtype=dtype, mode=mode, shape=shape)
+
+    def _open(self):
+        # Plain ndarray views over the maps: same pages, without np.memmap's
+        # per-indexing overhead in the graph search loops
+        n = self.count
+        mode = "r" if self.read_only else "r+"
+        self._graph_map = self._map("graph.i32", np.int32, (n, self.m), mode=mode)
+        self._tombstone_map = self._map("tombstones.u8", np.uint8, (n,), mode=mode)
+        self.vectors = np.asarray(self._map("vectors.f32", np.float32, (n, self.dim)))
+        self.graph = np.asarray(self._graph_map)
+        self.offsets = np.asarray(self._map("offsets.i64", np.int64, (n,)))
+        self.doc_codes = np.asarray(self._map("doc_codes.i32", np.int32, (n,)))
+        self.cluster_codes = np.asarray(self._map("cluster_codes.i32", np.int32, (n,)))
+        self.tombstones = np.asarray(self._tombstone_map)
+        bitmaps = self.path / "cluster_bitmaps.npy"
+        self.cluster_bitmaps = np.load(bitmaps, mmap_mode="r") if bitmaps.exists() and n else None
+        if self._records is not None:
+            self._records.close()
+        records = self.path / "records.jsonl"
+        self._records = open(records, "rb") if records.exists() else None
+        self._doc_bitmaps.clear()
+
+    def _row_bytes(self) -> dict:
+        """Bytes per row of every per-row file."""
+        return {
+            "vectors.f32": 4 * self.dim,
+            "graph.i32": 4 * self.m,
+            "offsets.i64": 8,
+            "doc_codes.i32": 4,
+            "cluster_codes.i32": 4,
+            "tombstones.u8": 1,
+        }
+
+    def _truncate_uncommitted(self):
+        """Drop rows an interrupted add wrote past the committed count."""
+        n = self.count
+        torn = False
+        for name, row_bytes in self._row_bytes().items():
+            p = self.path / name
+            if p.exists() and p.stat().st_size > n * row_bytes:
+                os.truncate(p, n * row_bytes)
+                torn = True
+        records = self.path / "records.jsonl"
+        if records.exists():
+            end = 0
+            if n:
+                offset = int(np.fromfile(self.path / "offsets.i64", dtype=np.int64, count=1, offset=8 * (n - 1))[0])
+                with open(records, "rb") as f:
+                    f.seek(offset)
+                    end = offset + len(f.readline())
+            if records.stat().st_size > end:
+                os.truncate(records, end)
+                torn = True
+        if torn and n:
+            # Committed rows may already link to the dropped ones
+            graph = np.memmap(self.path / "graph.i32", dtype=np.int32, mode="r+", shape=(n, self.m))
+            graph[graph >= n] = -1
+            graph.flush()
+            del graph
+        if torn:
+            print(f"⚠️  Dropped rows of an interrupted batch from {self.path}; index is back at {n} rows")
+
+    @staticmethod
+    def _append(path: Path, array: np.ndarray):
+        with open(path, "ab") as f:
+            f.write(np.ascontiguousarray(array).tobytes())
+
+    # --- writes ---
+
+    def add(self, vectors, records: list[dict], doc_ids: list[str], cluster_ids: list = None) -> range:
+        """
+        Append rows and link them into the graph.
+
+        Args:
+            vectors: (b, dim) array-like of embeddings
+            records: JSON-serializable payload per row
+            doc_ids: doc_id per row (used for filtering and delete)
+            cluster_ids: Optional cluster_id per row
+
+        Returns:
+            Row numbers assigned to the new rows
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        b = len(vectors)
+        if cluster_ids is None:
+            cluster_ids = [None] * b
+        self._check_writable()
+
+        with self._lock:
+            start = self.count
+            doc_codes = np.array([self.doc_vocab.setdefault(str(d), len(self.doc_vocab)) for d in doc_ids],
+                                 dtype=np.int32)
+            cluster_codes = np.array(
+                [NO_CLUSTER if c is None else self.cluster_vocab.setdefault(str(c), len(self.cluster_vocab))
+                 for c in cluster_ids],
+                dtype=np.int32,
+            )
+
+            records_path = self.path / "records.jsonl"
+            offset = records_path.stat().st_size if records_path.exists() else 0
+            offsets = np.empty(b, dtype=np.int64)
+            with open(records_path, "ab") as f:
+                for i, record in enumerate(records):
+                    line = (json.dumps(record) + "\n").encode()
+                    offsets[i] = offset
+                    offset += len(line)
+                    f.write(line)
+
+            self._append(self.path / "vectors.f32", vectors)
+            self._append(self.path / "graph.i32", np.full((b, self.m), -1, dtype=np.int32))
+            self._append(self.path / "offsets.i64", offsets)
+            self._append(self.path / "doc_codes.i32", doc_codes)
+            self._append(self.path / "cluster_codes.i32", cluster_codes)
+            self._append(self.path / "tombstones.u8", np.zeros(b, dtype=np.uint8))
+
+            self.header["count"] = start + b
+            self._write_json("doc_vocab.json", self.doc_vocab)
+            self._write_json("cluster_vocab.json", self.cluster_vocab)
+            self._open()
+
+            self._link_batch(start, start + b)
+            self._graph_map.flush()
+            self._rebuild_cluster_bitmaps()
+            self._write_header()
+        return range(start, start + b)
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ValueError(f"Index at {self.path} was opened read-only")
+
+    def _link_batch(self, start: int, end: int):
+        """Link rows [start, end) into the graph."""
+        if end <= self.brute_force_limit:
+            # Small index: exact candidates among earlier rows, one matmul per block
+            for lo in range(start, end, 1024):
+                hi = min(lo + 1024, end)
+                scores = self.vectors[lo:hi] @ self.vectors[:hi].T
+                scores[np.arange(hi - lo)[:, None] <= np.arange(hi)[None, :] - lo] = -np.inf
+                for i, row in enumerate(range(lo, hi)):
+                    k = min(3 * self.m, row)
+                    if k:
+                        pool = np.argpartition(-scores[i, :row], k - 1)[:k]
+                        pool = pool[np.argsort(-scores[i, pool])]
+                        self._link(row, pool)
+        else:
+            for row in range(start, end):
+                hits = self._beam_search(self.vectors[row], self.ef_construction, limit=row)
+                self._link(row, np.array([r for _, r in hits], dtype=np.int64))
+
+    def _select(self, vec: np.ndarray, pool: np.ndarray) -> np.ndarray:
+        """
+        HNSW neighbor-selection heuristic over ``pool`` (sorted nearest first).
+
+        A candidate is kept only if it is closer to ``vec`` than to every
+        neighbor already kept, which preserves long-range links between
+        clusters; remaining slots are filled with the nearest leftovers.
+        """
+        if len(pool) <= self.m:
+            return pool
+        cand = self.vectors[pool]
+        to_vec = (cand @ vec).tolist()
+        gram = (cand @ cand.T).tolist()
+        kept = []
+        for i in range(len(pool)):
+            if not kept or to_vec[i] > max(gram[i][j] for j in kept):
+                kept.append(i)
+                if len(kept) == self.m:
+                    break
+        if len(kept) < self.m:
+            taken = set(kept)
+            kept.extend([i for i in range(len(pool)) if i not in taken][:self.m - len(kept)])
+        return pool[kept]
+
+    def _link(self, row: int, pool: np.ndarray):
+        """Connect ``row`` to the best of ``pool`` (nearest first), both directions."""
+        vec = self.vectors[row]
+        nearest = self._select(vec, pool)
+        self.graph[row, :len(nearest)] = nearest
+        for nbr in nearest:
+            links = self.graph[nbr]
+            free = np.flatnonzero(links < 0)
+            if free.size:
+                links[free[0]] = row
+                continue
+            merged = np.append(links, row).astype(np.int64)
+            sims = self.vectors[merged] @ self.vectors[nbr]
+            if sims[-1] <= sims[:-1].min():
+                continue  # farther than every existing link
+            merged = merged[np.argsort(-sims)]
+            links[:] = self._select(self.vectors[nbr], merged)
+
+    def _rebuild_cluster_bitmaps(self):
+        n_clusters = len(self.cluster_vocab)
+        if not n_clusters:
+            self.cluster_bitmaps = None
+            return
+        codes = np.asarray(self.cluster_codes)
+        bitmaps = np.stack([np.packbits(codes == c) for c in range(n_clusters)])
+        # Replace rather than rewrite in place: readers keep mapping the old file
+        tmp = self.path / "cluster_bitmaps.npy.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, bitmaps)
+        tmp.replace(self.path / "cluster_bitmaps.npy")
+        self.cluster_bitmaps = np.load(self.path / "cluster_bitmaps.npy", mmap_mode="r")
+
+    def delete_docs(self, doc_ids: list[str]) -> int:
+        """Tombstone every row belonging to ``doc_ids``; returns rows deleted."""
+        self._check_writable()
+        with self._lock:
+            mask = self.doc_mask(doc_ids)
+            if mask is None:
+                return 0
+            hits = np.flatnonzero(mask & (self.tombstones == 0))
+            self.tombstones[hits] = 1
+            self._tombstone_map.flush()
+            return int(hits.size)
+
+    # --- filters ---
+
+    def doc_mask(self, doc_ids: list[str]):
+        """Boolean row mask for ``doc_ids`` (None if none are indexed)."""
+        codes = [self.doc_vocab[d] for d in map(str, doc_ids) if d in self.doc_vocab]
+        if not codes:
+            return None
+        key = tuple(sorted(codes))
+        mask = self._doc_bitmaps.get(key)
+        if mask is None:
+            mask = np.isin(self.doc_codes, codes)
+            self._doc_bitmaps[key] = mask
+            if len(self._doc_bitmaps) > 256:
+                self._doc_bitmaps.popitem(last=False)
+        else:
+            self._doc_bitmaps.move_to_end(key)
+        return mask
+
+    def cluster_mask(self, cluster_ids: list):
+        """Boolean row mask for ``cluster_ids`` from the precomputed bitmaps."""
+        codes = [self.cluster_vocab[c] for c in map(str, cluster_ids) if c in self.cluster_vocab]
+        if not codes or self.cluster_bitmaps is None:
+            return None
+        packed = np.bitwise_or.reduce(self.cluster_bitmaps[codes], axis=0)
+        return np.unpackbits(packed, count=self.count).astype(bool)
+
+    # --- reads ---
+
+    def record(self, row: int) -> dict:
+        # One shared file handle: seek + read must not interleave across threads
+        with self._lock:
+            self._records.seek(int(self.offsets[row]))
+            line = self._records.readline()
+        return json.loads(line)
+
+    def _beam_search(self, query: np.ndarray, ef: int, limit: int = None, allowed=None) -> list[tuple]:
+        """Greedy best-first graph search; returns [(score, row)] best first."""
+        n = self.count if limit is None else limit
+        visited = np.zeros(n, dtype=bool)
+        # Evenly spaced sample rows act as a coarse top layer: start from the best few
+        sample = np.unique(np.linspace(0, n - 1, num=min(256, n)).astype(np.int64))
+        sample_scores = self.vectors[sample] @ query
+        best = np.argsort(-sample_scores)[:16]
+        entries, entry_scores = sample[best], sample_scores[best]
+        visited[entries] = True
+
+        candidates = [(-float(s), int(r)) for s, r in zip(entry_scores, entries)]
+        heapq.heapify(candidates)
+        results = []  # min-heap of (score, row), accepted rows only
+        for s, r in zip(entry_scores, entries):
+            if allowed is None or allowed[r]:
+                heapq.heappush(results, (float(s), int(r)))
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            neg, row = heapq.heappop(candidates)
+            if len(results) >= ef and -neg < results[0][0]:
+                break
+            links = self.graph[row]
+            links = links[(links >= 0) & (links < n)]
+            links = links[~visited[links]]
+            if not links.size:
+                continue
+            visited[links] = True
+            scores = self.vectors[links] @ query
+            floor = results[0][0] if len(results) >= ef else -np.inf
+            for s, r in zip(scores.tolist(), links.tolist()):
+                if s <= floor:
+                    continue
+                heapq.heappush(candidates, (-s, r))
+                if allowed is None or allowed[r]:
+                    heapq.heappush(results, (s, r))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+                    floor = results[0][0] if len(results) >= ef else -np.inf
+        return sorted(results, reverse=True)
+
+    def _exact(self, query: np.ndarray, k: int, rows: np.ndarray = None) -> list[tuple]:
+        if rows is None:
+            scores = self.vectors @ query
+            rows = np.arange(self.count)
+        else:
+            scores = self.vectors[rows] @ query
+        if not len(rows):
+            return []
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(rows[i])) for i in top]
+
+    def search(self, query, k: int, mask=None, ef: int = None, exact: bool = False) -> list[tuple]:
+        """
+        Top-k rows by cosine similarity.
+
+        Args:
+            query: Query embedding
+            k: Number of results
+            mask: Optional boolean row mask (from doc_mask/cluster_mask)
+            ef: Beam width override
+            exact: Force a full scan (ground truth for recall measurements)
+
+        Returns:
+            List of (score, row) best first
+        """
+        if not self.count:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        allowed = self.tombstones == 0
+        if mask is not None:
+            allowed = allowed & mask
+        n_allowed = int(allowed.sum())
+
+        if exact or n_allowed <= self.brute_force_limit:
+            rows = None if n_allowed == self.count else np.flatnonzero(allowed)
+            return self._exact(query, k, rows)
+
+        hits = self._beam_search(query, max(ef or self.ef_search, k), allowed=allowed)
+        if len(hits) < k:
+            return self._exact(query, k, np.flatnonzero(allowed))
+        return hits[:k]
+
+    def close(self):
+        if self._records is not None:
+            self._records.close()
+            self._records = None
+
+
+class LocalVectorStore(BasePydanticVectorStore):
+    """
+    LlamaIndex vector store backed by LocalVectorIndex.
+
+    Supports EQ / IN metadata filters on ``doc_id`` and ``cluster_id``.
+    A ``read_only`` store (query processes) reopens its index before a query
+    when the writer has committed rows since it was opened.
+    """
+
+    stores_text: bool = True
+    persist_dir: str
+    read_only: bool = False
+    _index: LocalVectorIndex = PrivateAttr()
+    _index_kwargs: dict = PrivateAttr()
+
+    def __init__(self, persist_dir: str, embed_dim: int = 768, read_only: bool = False, **index_kwargs: Any):
+        super().__init__(persist_dir=str(persist_dir), read_only=read_only)
+        self._index_kwargs = dict(index_kwargs, dim=embed_dim, read_only=read_only)
+        self._index = LocalVectorIndex(persist_dir, **self._index_kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalVectorStore"
+
+    @property
+    def client(self) -> LocalVectorIndex:
+        return self._index
+
+    def refresh(self) -> bool:
+        """Reopen the index if it changed on disk; True when it was reopened."""
+        if not self._index.stale():
+            return False
+        # Swap in a fresh index: queries already running keep the old, consistent one
+        self._index = LocalVectorIndex(self.persist_dir, **self._index_kwargs)
+        return True
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> list[str]:
+        if not nodes:
+            return []
+        records, doc_ids, cluster_ids = [], [], []
+        for node in nodes:
+            records.append({
+                "node_id": node.node_id,
+                "metadata": node_to_metadata_dict(node, remove_text=False, flat_metadata=False),
+            })
+            doc_ids.append(node.metadata.get("doc_id") or node.ref_doc_id or node.node_id)
+            cluster_ids.append(node.metadata.get("cluster_id"))
+        self._index.add([n.get_embedding() for n in nodes], records, doc_ids, cluster_ids)
+        return [n.node_id for n in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._index.delete_docs([ref_doc_id])
+
+    def delete_nodes(self, node_ids: list[str] | None = None, filters: MetadataFilters | None = None,
+                     **delete_kwargs: Any) -> None:
+        """Delete by ``doc_id`` filter (rows are tombstoned per document, not per node)."""
+        if node_ids:
+            raise ValueError("LocalVectorStore deletes by doc_id filter, not by node id")
+        doc_ids = []
+        for f in (filters.filters if filters else []):
+            if f.key != "doc_id" or f.operator not in (FilterOperator.EQ, FilterOperator.IN):
+                raise ValueError(f"LocalVectorStore can only delete by doc_id EQ/IN, not '{f.key}' {f.operator}")
+            doc_ids.extend(f.value if isinstance(f.value, list) else [f.value])
+        if doc_ids:
+            self._index.delete_docs(doc_ids)
+
+    def _filter_mask(self, filters: MetadataFilters | None, index: LocalVectorIndex = None):
+        index = index or self._index
+        if filters is None:
+            return None
+        mask = None
+        for f in filters.filters:
+            values = f.value if isinstance(f.value, list) else [f.value]
+            if f.operator not in (FilterOperator.EQ, FilterOperator.IN):
+                raise ValueError(f"LocalVectorStore does not support operator {f.operator}")
+            if f.key == "doc_id":
+                part = index.doc_mask(values)
+            elif f.key == "cluster_id":
+                part = index.cluster_mask(values)
+            else:
+                raise ValueError(f"LocalVectorStore can only filter on doc_id or cluster_id, not '{f.key}'")
+            part = np.zeros(index.count, dtype=bool) if part is None else part
+            mask = part if mask is None else mask & part
+        return mask
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if self.read_only:
+            self.refresh()
+        index = self._index
+        mask = self._filter_mask(query.filters, index)
+        if mask is not None and not mask.any():
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        hits = index.search(query.query_embedding, query.similarity_top_k, mask=mask)
+        nodes, similarities, ids = [], [], []
+        for score, row in hits:
+            record = index.record(row)
+            nodes.append(metadata_dict_to_node(record["metadata"]))
+            similarities.append(score)
+            ids.append(record["node_id"])
+        return VectorStoreQueryResult(nodes=nodes, similarities=similarities, ids=ids)
@@ -0,0 +1,253 @@
+"""
+/src/common/model_client.py
+
+Client side of the shared model worker (src/common/model_worker.py).
+
+Query processes used to load their own copy of the cross-encoder reranker
+(and any local embedding model) at import. With ``model_worker_rerank`` on,
+they send (query, passage) pairs and texts to one ``st worker`` process
+over a Unix socket instead; it holds each model once and batches requests
+from every client together.
+
+  WorkerClient     - framed request/response over the socket, one
+                     persistent connection per thread, reconnecting once
+                     on a dropped connection
+  WorkerReranker   - drop-in for FlagEmbeddingReranker (node postprocessor,
+                     ``_model.compute_score`` for batch reranking)
+  WorkerEmbedding  - LlamaIndex embedding for ``embedding_provider:
+                     huggingface_local`` spaces
+
+Frames are a 4-byte header length, a 4-byte payload length, a JSON header
+and a raw float32 payload (scores, embeddings), so vectors cross the socket
+without JSON encoding.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+from src.common.config import load_global_config
+
+GLOBAL_CONFIG = load_global_config()
+MODEL_WORKER_SOCKET = Path(os.getenv("MODEL_WORKER_SOCKET", GLOBAL_CONFIG.get(
+    "model_worker_socket", "~/.swamp-thing/model_worker.sock"))).expanduser()
+MODEL_WORKER_TIMEOUT_SEC = float(GLOBAL_CONFIG.get("model_worker_timeout_sec", 30))
+MODEL_WORKER_RERANKER = GLOBAL_CONFIG.get("model_worker_reranker_model", "BAAI/bge-reranker-base")
+
+FRAME = struct.Struct("!II")
+
+
+class ModelWorkerError(RuntimeError):
+    pass
+
+
+def _recv_exact(sock, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("model worker closed the connection")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def send_frame(sock, header: dict, payload: bytes = b""):
+    head = json.dumps(header).encode()
+    sock.sendall(FRAME.pack(len(head), len(payload)) + head + payload)
+
+
+def recv_frame(sock) -> tuple[dict, bytes]:
+    head_len, payload_len = FRAME.unpack(_recv_exact(sock, FRAME.size))
+    header = json.loads(_recv_exact(sock, head_len))
+    return header, _recv_exact(sock, payload_len) if payload_len else b""
+
+
+def pack_array(array) -> tuple[list, bytes]:
+    array = np.ascontiguousarray(array, dtype=np.float32)
+    return list(array.shape), array.tobytes()
+
+
+def unpack_array(shape: list, payload: bytes) -> np.ndarray:
+    return np.frombuffer(payload, dtype=np.float32).reshape(shape)
+
+
+class WorkerClient:
+    """
+    Connection to a model worker, safe to share between threads.
+
+    Args:
+        socket_path: The worker's Unix socket
+        timeout: Seconds to wait for one reply (batching delay included)
+    """
+
+    def __init__(self, socket_path=MODEL_WORKER_SOCKET, timeout: float = MODEL_WORKER_TIMEOUT_SEC):
+        self.socket_path = Path(socket_path).expanduser()
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(str(self.socket_path))
+                break
+            except BlockingIOError:
+                # Listen backlog full: the worker is accepting a burst of connections
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise ModelWorkerError(f"Model worker at {self.socket_path} is not accepting connections")
+                time.sleep(0.01)
+            except OSError as e:
+                sock.close()
+                raise ModelWorkerError(f"No model worker at {self.socket_path} ({e}); start one with: st worker") from e
+        self._local.sock = sock
+        return sock
+
+    def close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def call(self, header: dict, payload: bytes = b"") -> tuple[dict, bytes]:
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None) or self._connect()
+            try:
+                send_frame(sock, header, payload)
+                reply, data = recv_frame(sock)
+                break
+            except (ConnectionError, BrokenPipeError) as e:
+                # The worker restarted since this thread last used it
+                self.close()
+                if attempt:
+                    raise ModelWorkerError(f"Model worker connection failed: {e}") from e
+            except OSError:
+                self.close()
+                raise
+        if "error" in reply:
+            raise ModelWorkerError(reply["error"])
+        return reply, data
+
+    def rerank(self, model: str, pairs: list) -> np.ndarray:
+        """Cross-encoder scores for (query, passage) pairs."""
+        if not pairs:
+            return np.zeros(0, dtype=np.float32)
+        reply, data = self.call({"op": "rerank", "model": model, "pairs": [list(p) for p in pairs]})
+        return unpack_array(reply["shape"], data)
+
+    def embed(self, model: str, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        reply, data = self.call({"op": "embed", "model": model, "texts": list(texts)})
+        return unpack_array(reply["shape"], data)
+
+    def stats(self) -> dict:
+        return self.call({"op": "stats"})[0]["stats"]
+
+
+class RemoteCrossEncoder:
+    """``compute_score`` over the worker, as FlagReranker exposes it (used by batch reranking)."""
+
+    def __init__(self, client: WorkerClient, model: str):
+        self.client = client
+        self.model = model
+
+    def compute_score(self, pairs, batch_size: int = None):
+        # The worker batches by its own max_batch
+        return self.client.rerank(self.model, pairs)
+
+
+class WorkerReranker(BaseNodePostprocessor):
+    """
+    Cross-encoder reranking through the shared model worker.
+
+    When the worker can't be reached, nodes keep their retrieval order
+    (truncated to top_n) and a warning is printed once, so queries still
+    answer while the worker restarts.
+    """
+
+    model: str = Field(default=MODEL_WORKER_RERANKER)
+    top_n: int = Field(default=5)
+    socket_path: str = Field(default=str(MODEL_WORKER_SOCKET))
+    _model: Any = PrivateAttr()
+    _warned: bool = PrivateAttr(default=False)
+
+    def __init__(self, client: WorkerClient = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._model = RemoteCrossEncoder(client or WorkerClient(self.socket_path), self.model)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "WorkerReranker"
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        if not nodes:
+            return []
+        pairs = [(query_bundle.query_str, n.node.get_content(metadata_mode=MetadataMode.EMBED)) for n in nodes]
+        try:
+            scores = np.atleast_1d(self._model.compute_score(pairs))
+        except (ModelWorkerError, OSError) as e:
+            if not self._warned:
+                print(f"⚠️  Reranking skipped: {e}")
+                self._warned = True
+            return nodes[: self.top_n]
+        self._warned = False
+        rescored = [NodeWithScore(node=n.node, score=float(s)) for n, s in zip(nodes, scores)]
+        return sorted(rescored, key=lambda n: -n.score)[: self.top_n]
+
+
+class WorkerEmbedding(BaseEmbedding):
+    """Embeddings from a local (sentence-transformers) model held by the shared model worker."""
+
+    socket_path: str = Field(default=str(MODEL_WORKER_SOCKET))
+    query_instruction: str | None = Field(default=None)
+    text_instruction: str | None = Field(default=None)
+    _client: WorkerClient = PrivateAttr()
+
+    def __init__(self, client: WorkerClient = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._client = client or WorkerClient(self.socket_path)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "WorkerEmbedding"
+
+    def _embed(self, texts: list[str], instruction: str | None) -> list[list[float]]:
+        if instruction:
+            texts = [f"{instruction} {t}" for t in texts]
+        return self._client.embed(self.model_name, texts).tolist()
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._embed([query], self.query_instruction)[0]
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._embed([text], self.text_instruction)[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts, self.text_instruction)
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return self._get_query_embedding(query)
+
+    async def _aget_text_embedding(self, text: str) -> list[float]:
+        return self._get_text_embedding(text)
@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+"""
+/src/common/model_worker.py
+
+Shared local inference worker for reranking and local embeddings.
+
+    st worker [--backend onnx --quantize avx2] [--preload]
+    st worker --stats
+
+One process loads each model once and serves every query process on the
+host over a Unix socket (framing in src/common/model_client.py). Requests
+for the same model are batched dynamically: a batch closes when it holds
+``max_batch`` items or when its oldest request has waited ``max_wait_ms``,
+so a lone interactive query pays at most a few milliseconds, while
+concurrent queries and ``st query --batch`` fill whole forward passes.
+
+Models load on first request (``--preload`` loads the configured reranker
+at start). Backends:
+
+  torch  - FlagReranker for the reranker (the scores FlagEmbeddingReranker
+           gives), sentence-transformers for embeddings
+  onnx   - sentence-transformers' ONNX Runtime backend, exported once under
+           model_worker_onnx_dir; ``quantize`` adds a dynamically
+           int8-quantized copy for CPUs (avx2, avx512, avx512_vnni, arm64)
+
+Per model the worker tracks queue depth (now and peak), batch sizes, queue
+wait and compute time; ``st worker --stats`` prints them from a running
+worker, and the worker logs a summary every ``report_sec``.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+
+import numpy as np
+
+from src.common.config import load_global_config
+from src.common.model_client import (
+    MODEL_WORKER_RERANKER,
+    MODEL_WORKER_SOCKET,
+    ModelWorkerError,
+    WorkerClient,
+    pack_array,
+    recv_frame,
+    send_frame,
+)
+
+GLOBAL_CONFIG = load_global_config()
+MODEL_WORKER_BACKEND = os.getenv("MODEL_WORKER_BACKEND", GLOBAL_CONFIG.get("model_worker_backend", "torch"))
+MODEL_WORKER_QUANTIZE = GLOBAL_CONFIG.get("model_worker_quantize") or None
+MODEL_WORKER_ONNX_DIR = Path(GLOBAL_CONFIG.get("model_worker_onnx_dir", "~/.swamp-thing/onnx")).expanduser()
+MODEL_WORKER_MAX_BATCH = int(GLOBAL_CONFIG.get("model_worker_max_batch", 64))
+MODEL_WORKER_MAX_WAIT_MS = float(GLOBAL_CONFIG.get("model_worker_max_wait_ms", 5))
+MODEL_WORKER_REPORT_SEC = float(GLOBAL_CONFIG.get("model_worker_report_sec", 60))
+BACKENDS = ("torch", "onnx")
+QUANTIZATION_CONFIGS = ("avx2", "avx512", "avx512_vnni", "arm64")
+
+
+class DynamicBatcher:
+    """
+    Coalesces requests for one model into batched calls on a single thread.
+
+    Args:
+        name: Label used in stats ('rerank:<model>' / 'embed:<model>')
+        fn: ``fn(items) -> array`` with one result row per item
+        max_batch: Items per call (a larger request is split across calls)
+        max_wait_ms: How long the oldest queued request may wait for company
+    """
+
+    def __init__(self, name: str, fn, max_batch: int = MODEL_WORKER_MAX_BATCH,
+                 max_wait_ms: float = MODEL_WORKER_MAX_WAIT_MS, history: int = 1000):
+        self.name = name
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = deque()
+        self._queued_items = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.counts = {"requests": 0, "items": 0, "batches": 0, "errors": 0, "peak_queue_depth": 0}
+        self._batch_sizes = deque(maxlen=history)
+        self._waits_ms = deque(maxlen=history)
+        self._compute_ms = deque(maxlen=history)
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, items: list) -> Future:
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise ModelWorkerError(f"{self.name} is shutting down")
+            self._queue.append((items, future, time.monotonic()))
+            self._queued_items += len(items)
+            self.counts["requests"] += 1
+            self.counts["peak_queue_depth"] = max(self.counts["peak_queue_depth"], self._queued_items)
+            self._cond.notify()
+        return future
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _take(self) -> list:
+        """Wait for the next batch: whole requests, up to max_batch items or max_wait after the oldest."""
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return []
+            deadline = self._queue[0][2] + self.max_wait
+            while self._queued_items < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, size = [], 0
+            while self._queue and (not batch or size + len(self._queue[0][0]) <= self.max_batch):
+                request = self._queue.popleft()
+                batch.append(request)
+                size += len(request[0])
+            self._queued_items -= size
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if not batch:
+                return
+            items = [item for request_items, _, _ in batch for item in request_items]
+            started = time.monotonic()
+            try:
+                results = np.concatenate([
+                    np.atleast_1d(np.asarray(self.fn(items[i:i + self.max_batch]), dtype=np.float32))
+                    for i in range(0, len(items), self.max_batch)
+                ]) if items else np.zeros(0, dtype=np.float32)
+            except Exception as e:
+                self.counts["errors"] += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.monotonic()
+            with self._cond:
+                self.counts["batches"] += 1
+                self.counts["items"] += len(items)
+                self._batch_sizes.append(len(items))
+                self._compute_ms.append(1000 * (finished - started))
+                self._waits_ms.extend(1000 * (started - enqueued) for _, _, enqueued in batch)
+            offset = 0
+            for request_items, future, _ in batch:
+                future.set_result(results[offset:offset + len(request_items)])
+                offset += len(request_items)
+
+    @property
+    def stats(self) -> dict:
+        with self._cond:
+            sizes, waits, compute = (np.array(d) for d in (self._batch_sizes, self._waits_ms, self._compute_ms))
+            counts = dict(self.counts, queue_depth=self._queued_items, queued_requests=len(self._queue))
+        summary = lambda a: {"mean": round(float(a.mean()), 2), "p50": round(float(np.percentile(a, 50)), 2),
+                             "p95": round(float(np.percentile(a, 95)), 2), "max": round(float(a.max()), 2)} \
+            if a.size else {}
+        return dict(counts, batch_size=summary(sizes), wait_ms=summary(waits), compute_ms=summary(compute))
+
+
+# --- model loading ---
+
+def _onnx_model(cls, name: str, quantize: str | None, onnx_dir: Path):
+    """``cls`` (CrossEncoder / SentenceTransformer) on ONNX Runtime, exported (and quantized) once."""
+    target = onnx_dir / name.replace("/", "__")
+    file_name = f"onnx/model_qint8_{quantize}.onnx" if quantize else "onnx/model.onnx"
+    if not (target / file_name).exists():
+        print(f"   Exporting {name} to ONNX{f' (int8, {quantize})' if quantize else ''} in {target}...")
+        model = cls(name, backend="onnx")
+        model.save_pretrained(str(target))
+        if quantize:
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+
+            export_dynamic_quantized_onnx_model(model, quantize, str(target))
+    return cls(str(target), backend="onnx", model_kwargs={"file_name": file_name})
+
+
+def load_reranker(name: str, backend: str = MODEL_WORKER_BACKEND, quantize: str = MODEL_WORKER_QUANTIZE,
+                  onnx_dir: Path = MODEL_WORKER_ONNX_DIR):
+    """``fn(pairs) -> scores`` for a cross-encoder."""
+    if backend == "onnx":
+        from sentence_transformers import CrossEncoder
+
+        model = _onnx_model(CrossEncoder, name, quantize, onnx_dir)
+        return lambda pairs: model.predict(pairs, batch_size=len(pairs), convert_to_numpy=True)
+    from FlagEmbedding import FlagReranker
+
+    model = FlagReranker(name, use_fp16=False)
+    return lambda pairs: model.compute_score(pairs, batch_size=len(pairs))
+
+
+def load_embedder(name: str, backend: str = MODEL_WORKER_BACKEND, quantize: str = MODEL_WORKER_QUANTIZE,
+                  onnx_dir: Path = MODEL_WORKER_ONNX_DIR):
+    """``fn(texts) -> vectors`` for a sentence-transformers model."""
+    from sentence_transformers import SentenceTransformer
+
+    model = _onnx_model(SentenceTransformer, name, quantize, onnx_dir) if backend == "onnx" \
+        else SentenceTransformer(name)
+    return lambda texts: model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+
+class ModelWorker:
+    """
+    The models served by this process, one DynamicBatcher each, loaded on first request.
+
+    Args:
+        backend: torch or onnx
+        quantize: int8 quantization config for onnx (None: full precision)
+        max_batch: Items per forward pass
+        max_wait_ms: Batching window
+        loaders: {'rerank': load_reranker, 'embed': load_embedder}, replaceable for tests
+    """
+
+    def __init__(self, backend: str = MODEL_WORKER_BACKEND, quantize: str = MODEL_WORKER_QUANTIZE,
+                 max_batch: int = MODEL_WORKER_MAX_BATCH, max_wait_ms: float = MODEL_WORKER_MAX_WAIT_MS,
+                 onnx_dir: Path = MODEL_WORKER_ONNX_DIR, loaders: dict = None):
+        if backend not in BACKENDS:
+            raise ValueError(f"model_worker_backend must be one of {', '.join(BACKENDS)}, got '{backend}'")
+        if quantize and (backend != "onnx" or quantize not in QUANTIZATION_CONFIGS):
+            raise ValueError(f"model_worker_quantize needs the onnx backend and one of "
+                             f"{', '.join(QUANTIZATION_CONFIGS)}, got '{quantize}'")
+        self.backend = backend
+        self.quantize = quantize
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.onnx_dir = onnx_dir
+        self.loaders = loaders or {"rerank": load_reranker, "embed": load_embedder}
+        self.batchers = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._loading = {}
+
+    def batcher(self, op: str, model: str) -> DynamicBatcher:
+        key = f"{op}:{model}"
+        batcher = self.batchers.get(key)
+        if batcher is not None:
+            return batcher
+        with self._lock:
+            load_lock = self._loading.setdefault(key, threading.Lock())
+        # Only requests for this model wait while it loads
+        with load_lock:
+            if key not in self.batchers:
+                started = time.monotonic()
+                fn = self.loaders[op](model, self.backend, self.quantize, self.onnx_dir)
+                self.batchers[key] = DynamicBatcher(key, fn, self.max_batch, self.max_wait_ms)
+                print(f"✅ Loaded {key} ({self.backend}{f', int8 {self.quantize}' if self.quantize else ''}) "
+                      f"in {time.monotonic() - started:.1f}s")
+        return self.batchers[key]
+
+    def handle(self, header: dict) -> tuple[dict, bytes]:
+        op = header.get("op")
+        if op == "stats":
+            return {"stats": self.stats}, b""
+        if op == "rerank":
+            items = [tuple(p) for p in header["pairs"]]
+        elif op == "embed":
+            items = header["texts"]
+        else:
+            raise ModelWorkerError(f"Unknown op '{op}'")
+        result = self.batcher(op, header["model"]).submit(items).result()
+        shape, payload = pack_array(result)
+        return {"shape": shape}, payload
+
+    @property
+    def stats(self) -> dict:
+        return {"backend": self.backend, "quantize": self.quantize, "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait_ms, "uptime_sec": round(time.time() - self.started),
+                "models": {key: b.stats for key, b in list(self.batchers.items())}}
+
+    def close(self):
+        for batcher in list(self.batchers.values()):
+            batcher.close()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # One persistent connection per client thread
+        while True:
+            try:
+                header, _ = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                reply, payload = self.server.worker.handle(header)
+            except Exception as e:
+                reply, payload = {"error": f"{type(e).__name__}: {e}"}, b""
+            try:
+                send_frame(self.request, reply, payload)
+            except OSError:
+                return
+
+
+class WorkerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Every thread of every query process may connect at once
+    request_queue_size = socket.SOMAXCONN
+
+    def __init__(self, socket_path: Path, worker: ModelWorker):
+        socket_path = Path(socket_path).expanduser()
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if socket_path.exists():
+            try:
+                WorkerClient(socket_path, timeout=2).stats()
+            except (ModelWorkerError, OSError):
+                socket_path.unlink()  # left behind by a worker that died
+            else:
+                raise SystemExit(f"A model worker is already serving {socket_path}")
+        self.worker = worker
+        super().__init__(str(socket_path), _Handler)
+        os.chmod(socket_path, 0o660)
+
+    def server_close(self):
+        super().server_close()
+        Path(self.server_address).unlink(missing_ok=True)
+
+
+def report(worker: ModelWorker, every_sec: float, stop: threading.Event):
+    while not stop.wait(every_sec):
+        for key, s in worker.stats["models"].items():
+            print(f"   {key}: queue {s['queue_depth']} (peak {s['peak_queue_depth']}), {s['requests']} requests, "
+                  f"{s['batches']} batches, mean batch {s['batch_size'].get('mean', 0)}, "
+                  f"p95 wait {s['wait_ms'].get('p95', 0)} ms, p95 compute {s['compute_ms'].get('p95', 0)} ms")
+
+
+def print_stats(socket_path: Path):
+    try:
+        stats = WorkerClient(socket_path, timeout=5).stats()
+    except (ModelWorkerError, OSError) as e:
+        raise SystemExit(f"❌ {e}")
+    print(json.dumps(stats, indent=2))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Shared reranker / embedding worker")
+    parser.add_argument("--socket", type=Path, default=MODEL_WORKER_SOCKET)
+    parser.add_argument("--backend", choices=BACKENDS, default=MODEL_WORKER_BACKEND)
+    parser.add_argument("--quantize", choices=QUANTIZATION_CONFIGS, default=MODEL_WORKER_QUANTIZE,
+                        help="int8 dynamic quantization for the onnx backend")
+    parser.add_argument("--max-batch", type=int, default=MODEL_WORKER_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MODEL_WORKER_MAX_WAIT_MS)
+    parser.add_argument("--report-sec", type=float, default=MODEL_WORKER_REPORT_SEC,
+                        help="seconds between metric summaries (0: off)")
+    parser.add_argument("--preload", action="store_true", help=f"load {MODEL_WORKER_RERANKER} at start")
+    parser.add_argument("--stats", action="store_true", help="print a running worker's metrics and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.stats:
+        print_stats(args.socket)
+        return
+    worker = ModelWorker(args.backend, args.quantize, args.max_batch, args.max_wait_ms)
+    if args.preload:
+        worker.batcher("rerank", MODEL_WORKER_RERANKER)
+    server = WorkerServer(args.socket, worker)
+    stop = threading.Event()
+    if args.report_sec > 0:
+        threading.Thread(target=report, args=(worker, args.report_sec, stop), daemon=True).start()
+    print(f"✅ Model worker on {args.socket} ({args.backend}, max batch {args.max_batch}, "
+          f"window {args.max_wait_ms:g} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        worker.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+/src/common/near_duplicates.py
+
+Near-duplicate document detection with MinHash signatures and LSH banding.
+
+Each document is reduced to a fixed-size MinHash signature over word
+shingles. The signature is cut into bands; documents sharing any band hash
+are candidates, and candidates whose estimated Jaccard similarity reaches
+the threshold are linked to the same canonical doc_id. Signatures and band
+hashes live in metadata_catalog (document_minhash, document_lsh_bands), so
+each new document costs one indexed lookup per band no matter how large the
+catalog grows.
+
+At query time NearDuplicateCollapser keeps one node per near-identical text
+within a canonical document group, so copies and minor revisions of the
+same filing don't crowd out other context.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import hashlib
+import re
+import zlib
+
+import numpy as np
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from pydantic import Field
+from sqlalchemy import bindparam, text
+
+# Largest prime below 2**32; (a * h + b) stays within uint64
+_PRIME = np.uint64(4294967291)
+_WORD_RE = re.compile(r"\w+")
+_SHINGLE_BLOCK = 8192
+
+
+def shingles(text: str, size: int = 5) -> set[int]:
+    """32-bit hashes of the word ``size``-grams of lower-cased text."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {zlib.crc32(" ".join(words).encode())} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + size]).encode()) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def optimal_bands(num_perm: int, threshold: float) -> tuple[int, int]:
+    """(bands, rows) dividing num_perm whose S-curve midpoint is closest to threshold."""
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+class MinHasher:
+    """MinHash signatures and LSH band keys for a fixed permutation family."""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, threshold: float = 0.85, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.a = rng.randint(1, int(_PRIME), size=num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.randint(0, int(_PRIME), size=num_perm, dtype=np.uint64)[:, None]
+        self.bands, self.rows = optimal_bands(num_perm, threshold)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(shingles(text, self.shingle_size), dtype=np.uint64)
+        sig = np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint64)
+        # Block the shingles so long documents don't allocate num_perm x n_shingles at once
+        for start in range(0, len(hashes), _SHINGLE_BLOCK):
+            block = hashes[start:start + _SHINGLE_BLOCK] % _PRIME
+            np.minimum(sig, ((self.a * block + self.b) % _PRIME).min(axis=1), out=sig)
+        return sig.astype(np.uint32)
+
+    def band_keys(self, sig: np.ndarray) -> list[int]:
+        """One signed 64-bit hash per band (fits a BIGINT column)."""
+        keys = []
+        for band in range(self.bands):
+            chunk = sig[band * self.rows:(band + 1) * self.rows].tobytes()
+            digest = hashlib.blake2b(chunk, digest_size=8, person=band.to_bytes(2, "little")).digest()
+            keys.append(int.from_bytes(digest, "little", signed=True))
+        return keys
+
+    @staticmethod
+    def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+        """Estimated Jaccard similarity of the two documents."""
+        return float(np.mean(sig_a == sig_b))
+
+
+def ensure_dedup_tables(metadata_engine, schema: str = "public"):
+    """Create the MinHash signature and LSH band tables."""
+    with metadata_engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.document_minhash (
+                doc_id TEXT PRIMARY KEY,
+                signature BYTEA NOT NULL,
+                num_perm INTEGER NOT NULL,
+                canonical_doc_id TEXT NOT NULL,
+                similarity REAL,
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.document_lsh_bands (
+                band SMALLINT NOT NULL,
+                band_hash BIGINT NOT NULL,
+                doc_id TEXT NOT NULL,
+                PRIMARY KEY (band, band_hash, doc_id)
+            )
+        """))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_lsh_doc ON {schema}.document_lsh_bands(doc_id)"
+        ))
+
+
+class NearDuplicateIndex:
+    """
+    LSH index over document signatures, persisted in metadata_catalog.
+
+    assign() resolves a batch of documents to canonical doc_ids. Earlier
+    documents (already in the catalog, then earlier in the batch) win, so
+    re-ingesting the same lake keeps canonical ids stable.
+    """
+
+    def __init__(self, metadata_engine, hasher: MinHasher = None):
+        self.engine = metadata_engine
+        self.hasher = hasher or MinHasher()
+
+    def _stored_candidates(self, conn, keyed: dict[str, list[int]]) -> dict[str, set[str]]:
+        """doc_ids in the catalog sharing a band with each new document."""
+        owners = {}
+        for doc_id, keys in keyed.items():
+            for band, key in enumerate(keys):
+                owners.setdefault((band, key), set()).add(doc_id)
+        if not owners:
+            return {}
+        pairs = list(owners)
+        rows = conn.execute(
+            text("""
+                SELECT l.band, l.band_hash, l.doc_id
+                FROM document_lsh_bands l
+                JOIN unnest(CAST(:bands AS SMALLINT[]), CAST(:hashes AS BIGINT[])) AS q(band, band_hash)
+                  ON l.band = q.band AND l.band_hash = q.band_hash
+            """),
+            {"bands": [p[0] for p in pairs], "hashes": [p[1] for p in pairs]},
+        )
+        candidates = {}
+        for band, key, stored_id in rows:
+            for doc_id in owners.get((band, key), ()):
+                if stored_id != doc_id:
+                    candidates.setdefault(doc_id, set()).add(stored_id)
+        return candidates
+
+    def _stored_signatures(self, conn, doc_ids: set[str]) -> dict[str, tuple[np.ndarray, str]]:
+        if not doc_ids:
+            return {}
+        rows = conn.execute(
+            text("SELECT doc_id, signature, num_perm, canonical_doc_id FROM document_minhash "
+                 "WHERE doc_id IN :ids").bindparams(bindparam("ids", expanding=True)),
+            {"ids": list(doc_ids)},
+        )
+        return {
+            doc_id: (np.frombuffer(sig, dtype=np.uint32), canonical)
+            for doc_id, sig, num_perm, canonical in rows
+            if num_perm == self.hasher.num_perm
+        }
+
+    def assign(self, texts: dict[str, str]) -> dict[str, tuple[str, float]]:
+        """
+        Map doc_id -> (canonical_doc_id, similarity) and persist signatures.
+
+        Args:
+            texts: Document text keyed by doc_id, in ingestion order
+
+        Returns:
+            Canonical assignment per doc_id; canonical documents map to themselves
+            with similarity 1.0
+        """
+        hasher = self.hasher
+        sigs = {doc_id: hasher.signature(body) for doc_id, body in texts.items()}
+        keyed = {doc_id: hasher.band_keys(sig) for doc_id, sig in sigs.items()}
+        result = {}
+
+        with self.engine.begin() as conn:
+            stored_candidates = self._stored_candidates(conn, keyed)
+            stored = self._stored_signatures(conn, set().union(*stored_candidates.values()))
+            # Documents earlier in this batch, bucketed the same way
+            buckets = {}
+
+            for doc_id, sig in sigs.items():
+                best, best_sim = doc_id, 0.0
+                for other in stored_candidates.get(doc_id, ()):
+                    if other not in stored:
+                        continue
+                    other_sig, other_canonical = stored[other]
+                    sim = hasher.similarity(sig, other_sig)
+                    if sim >= hasher.threshold and sim > best_sim:
+                        best, best_sim = other_canonical, sim
+                for band, key in enumerate(keyed[doc_id]):
+                    for other in buckets.get((band, key), ()):
+                        sim = hasher.similarity(sig, sigs[other])
+                        if sim >= hasher.threshold and sim > best_sim:
+                            best, best_sim = result[other][0], sim
+                    buckets.setdefault((band, key), []).append(doc_id)
+                # A document re-ingested after its duplicates resolves back to itself
+                result[doc_id] = (doc_id, 1.0) if best == doc_id else (best, best_sim)
+
+            conn.execute(
+                text("DELETE FROM document_lsh_bands WHERE doc_id IN :ids")
+                .bindparams(bindparam("ids", expanding=True)),
+                {"ids": list(sigs)},
+            )
+            conn.execute(
+                text("INSERT INTO document_lsh_bands (band, band_hash, doc_id) VALUES (:band, :hash, :doc_id) "
+                     "ON CONFLICT DO NOTHING"),
+                [{"band": band, "hash": key, "doc_id": doc_id}
+                 for doc_id, keys in keyed.items() for band, key in enumerate(keys)],
+            )
+            conn.execute(
+                text("""
+                    INSERT INTO document_minhash (doc_id, signature, num_perm, canonical_doc_id, similarity)
+                    VALUES (:doc_id, :signature, :num_perm, :canonical, :similarity)
+                    ON CONFLICT (doc_id) DO UPDATE SET
+                        signature = EXCLUDED.signature,
+                        num_perm = EXCLUDED.num_perm,
+                        canonical_doc_id = EXCLUDED.canonical_doc_id,
+                        similarity = EXCLUDED.similarity,
+                        updated_at = NOW()
+                """),
+                [{"doc_id": doc_id, "signature": sigs[doc_id].tobytes(), "num_perm": hasher.num_perm,
+                  "canonical": canonical, "similarity": sim}
+                 for doc_id, (canonical, sim) in result.items()],
+            )
+        return result
+
+
+class NearDuplicateCollapser(BaseNodePostprocessor):
+    """
+    Collapse near-identical retrieved chunks from the same canonical document.
+
+    Nodes carrying ``canonical_doc_id`` metadata that differs from their own
+    ``doc_id`` (duplicates embedded under the ``downweight`` policy) have
+    their score multiplied by ``duplicate_weight`` first. Then, within each
+    canonical group, a node is dropped when its shingle Jaccard similarity to
+    a higher-scoring kept node reaches ``threshold``.
+    """
+
+    threshold: float = Field(default=0.85)
+    duplicate_weight: float = Field(default=0.5)
+    shingle_size: int = Field(default=5)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NearDuplicateCollapser"
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        for n in nodes:
+            meta = n.node.metadata
+            canonical = meta.get("canonical_doc_id")
+            if canonical and canonical != meta.get("doc_id") and n.score is not None:
+                n.score *= self.duplicate_weight
+        ranked = sorted(nodes, key=lambda n: n.score if n.score is not None else float("-inf"), reverse=True)
+
+        kept, kept_shingles = [], {}
+        for n in ranked:
+            meta = n.node.metadata
+            group = meta.get("canonical_doc_id") or meta.get("doc_id") or n.node.node_id
+            sh = shingles(n.node.get_content(), self.shingle_size)
+            if any(jaccard(sh, other) >= self.threshold for other in kept_shingles.get(group, [])):
+                continue
+            kept_shingles.setdefault(group, []).append(sh)
+            kept.append(n)
+        return kept
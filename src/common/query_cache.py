@@ -0,0 +1,263 @@
+"""
+/src/common/query_cache.py
+
+In-process caches for the query path.
+
+A ReAct loop often repeats the same ``filtered_semantic_search`` call, and
+concurrent users ask the same questions; each repeat used to re-embed the
+query through Ollama and re-run the vector search. Two caches sit in front
+of that work:
+
+  query embeddings  - keyed by (embedding space version, query hash), shared
+                      by every domain on the same space
+  retrieval results - keyed by (query hash, sorted doc_id filter, top_k,
+                      index version), one per domain
+
+Both are LRU with a TTL and single-flight: concurrent misses on one key
+wait for a single computation instead of each calling Ollama / Postgres.
+
+The index version is ``<embedding version>:<generation>``. Ingestion bumps
+the domain's ``index_generation`` row in the same transaction that commits
+each batch (src/ingest/jobs.py); query processes re-read it at most every
+index_generation_check_sec, and a new generation empties the result cache.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.common.config import load_global_config
+
+GLOBAL_CONFIG = load_global_config()
+QUERY_CACHE_ENABLED = bool(GLOBAL_CONFIG.get("query_cache_enabled", True))
+QUERY_EMBEDDING_CACHE_SIZE = int(GLOBAL_CONFIG.get("query_embedding_cache_size", 4096))
+QUERY_EMBEDDING_CACHE_TTL_SEC = float(GLOBAL_CONFIG.get("query_embedding_cache_ttl_sec", 3600))
+RETRIEVAL_CACHE_SIZE = int(GLOBAL_CONFIG.get("retrieval_cache_size", 1024))
+RETRIEVAL_CACHE_TTL_SEC = float(GLOBAL_CONFIG.get("retrieval_cache_ttl_sec", 300))
+INDEX_GENERATION_CHECK_SEC = float(GLOBAL_CONFIG.get("index_generation_check_sec", 2))
+
+
+def query_hash(query_str: str) -> str:
+    """
+    Whitespace-insensitive hash of a query string.
+
+    Case is kept: embedding models are case-sensitive ("US" / "us"), and
+    retrieval results follow the embedding, so neither key folds it.
+    """
+    return hashlib.sha256(" ".join(query_str.split()).encode()).hexdigest()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry expiry and single-flight fills.
+
+    Args:
+        maxsize: Entries kept before the least recently used is dropped
+        ttl: Seconds an entry stays valid
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evicted": 0}
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._put(key, value)
+
+    def _put(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value for ``key``, computing it once on a miss.
+
+        Callers that miss while another thread is computing the same key
+        wait for that result. A failed computation is not cached; its
+        exception is raised in every waiting caller.
+        """
+        with self._lock:
+            value = self._get(key)
+            if value is not None:
+                self.stats["hits"] += 1
+                return value
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = self._inflight[key] = {"done": threading.Event(), "value": None, "error": None}
+                owner = True
+                self.stats["misses"] += 1
+            else:
+                owner = False
+                self.stats["coalesced"] += 1
+
+        if not owner:
+            flight["done"].wait()
+            if flight["error"] is not None:
+                raise flight["error"]
+            return flight["value"]
+
+        try:
+            value = compute()
+            flight["value"] = value
+        except BaseException as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self._lock:
+                if flight["error"] is None:
+                    self._put(key, flight["value"])
+                del self._inflight[key]
+            flight["done"].set()
+        return value
+
+
+# One per process: embeddings depend only on the model, not the domain
+embedding_cache = TTLCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL_SEC)
+
+
+def cached_query_embedding(embed_model, query_str: str, space_version: str):
+    """Query embedding through the process-wide cache."""
+    if not QUERY_CACHE_ENABLED:
+        return embed_model.get_query_embedding(query_str)
+    key = (space_version, getattr(embed_model, "model_name", None), query_hash(query_str))
+    return embedding_cache.get_or_compute(key, lambda: embed_model.get_query_embedding(query_str))
+
+
+def cached_query_embeddings(embed_model, queries: list[str], space_version: str, batch_size: int = 64) -> list:
+    """
+    Embeddings for many queries: cache hits are reused, misses are embedded
+    ``batch_size`` at a time and stored in the process-wide cache.
+
+    Batches go through the text-embedding API, which only equals the query
+    embedding when the model adds no query instruction; otherwise queries
+    are embedded one at a time.
+    """
+    model_name = getattr(embed_model, "model_name", None)
+    keys = [(space_version, model_name, query_hash(q)) for q in queries]
+    results = [embedding_cache.get(k) if QUERY_CACHE_ENABLED else None for k in keys]
+    missing = [i for i, r in enumerate(results) if r is None]
+    if getattr(embed_model, "query_instruction", None):
+        for i in missing:
+            results[i] = cached_query_embedding(embed_model, queries[i], space_version)
+        return results
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        for i, vector in zip(batch, embed_model.get_text_embedding_batch([queries[i] for i in batch])):
+            results[i] = vector
+            if QUERY_CACHE_ENABLED:
+                embedding_cache.put(keys[i], vector)
+    return results
+
+
+# --- index generation (bumped by ingestion) ---
+
+def ensure_generation_table(metadata_engine, schema: str = "public"):
+    with metadata_engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.index_generation (
+                id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                generation BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """))
+        conn.execute(text(f"INSERT INTO {schema}.index_generation (id) VALUES (TRUE) ON CONFLICT DO NOTHING"))
+
+
+def bump_generation(conn):
+    """Advance the domain's index generation inside the caller's transaction."""
+    conn.execute(text("UPDATE index_generation SET generation = generation + 1, updated_at = NOW()"))
+
+
+def read_generation(metadata_engine) -> int:
+    try:
+        with metadata_engine.connect() as conn:
+            return int(conn.execute(text("SELECT generation FROM index_generation")).scalar() or 0)
+    except SQLAlchemyError:
+        return 0
+
+
+class RetrievalCache:
+    """
+    One domain's retrieval results, dropped whenever ingestion moves the index on.
+
+    Args:
+        metadata_engine: Domain-scoped engine holding index_generation (None: never invalidated)
+        space_version: Embedding space the domain's index was opened on
+        maxsize: Cached result lists
+        ttl: Seconds a result list stays valid
+        check_sec: Minimum seconds between index_generation reads
+    """
+
+    def __init__(self, metadata_engine=None, space_version: str = "v1", maxsize: int = RETRIEVAL_CACHE_SIZE,
+                 ttl: float = RETRIEVAL_CACHE_TTL_SEC, check_sec: float = INDEX_GENERATION_CHECK_SEC):
+        self.metadata_engine = metadata_engine
+        self.space_version = space_version
+        self.results = TTLCache(maxsize, ttl)
+        self.check_sec = check_sec
+        self.generation = 0
+        self._checked = float("-inf")  # read on first use, not at construction
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.results)
+
+    @property
+    def stats(self) -> dict:
+        return dict(self.results.stats, generation=self.generation, size=len(self.results))
+
+    def index_version(self) -> str:
+        if self.metadata_engine is not None and time.monotonic() - self._checked >= self.check_sec:
+            with self._lock:
+                if time.monotonic() - self._checked >= self.check_sec:
+                    generation = read_generation(self.metadata_engine)
+                    if generation != self.generation:
+                        self.results.clear()
+                        self.generation = generation
+                    self._checked = time.monotonic()
+        return f"{self.space_version}:{self.generation}"
+
+    def key(self, query_str: str, doc_ids, top_k: int) -> tuple:
+        return (query_hash(query_str), tuple(sorted(map(str, doc_ids or ()))), top_k, self.index_version())
+
+    def get_or_retrieve(self, query_str: str, doc_ids, top_k: int, retrieve):
+        if not QUERY_CACHE_ENABLED:
+            return retrieve()
+        return self.results.get_or_compute(self.key(query_str, doc_ids, top_k), retrieve)
@@ -0,0 +1,222 @@
+"""
+/src/common/vector_storage.py
+
+Reduced-precision vector storage for first-pass search.
+
+The full float32 ``embedding`` column is always kept. Depending on
+``vector_storage_mode`` a compact copy is written next to it and indexed:
+
+  full        - no extra column, search the float32 vectors directly
+  halfvec     - float16 copy (HALFVEC), half the index size
+  binary      - 1 bit per dimension (BIT, Hamming distance), 1/32 the size
+  matryoshka  - first ``matryoshka_dim`` dimensions, renormalized, as HALFVEC
+
+Non-full modes search the compact column for ``rescore_candidates`` rows and
+re-score only those with the full-precision embedding. Requires pgvector
+>= 0.7 (halfvec, bit, binary_quantize, subvector, l2_normalize).
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+STORAGE_MODES = ("full", "halfvec", "binary", "matryoshka")
+
+# Column name, column type, index opclass and the SQL expression that derives
+# the compact value from a full-precision vector (the table column or a
+# query parameter).
+_MODE_SPECS = {
+    "halfvec": {
+        "column": "embedding_half",
+        "type": "HALFVEC({dim})",
+        "opclass": "halfvec_cosine_ops",
+        "operator": "<=>",
+        "expr": "CAST({vec} AS halfvec({dim}))",
+    },
+    "binary": {
+        "column": "embedding_bin",
+        "type": "BIT({dim})",
+        "opclass": "bit_hamming_ops",
+        "operator": "<~>",
+        "expr": "CAST(binary_quantize({vec}) AS bit({dim}))",
+    },
+    "matryoshka": {
+        "column": "embedding_mrl",
+        "type": "HALFVEC({mrl_dim})",
+        "opclass": "halfvec_cosine_ops",
+        "operator": "<=>",
+        "expr": "CAST(l2_normalize(subvector({vec}, 1, {mrl_dim})) AS halfvec({mrl_dim}))",
+    },
+}
+
+
+def pg_table_name(table_name: str) -> str:
+    """PGVectorStore stores ``table_name`` as ``data_<table_name>``."""
+    return table_name if table_name.startswith("data_") else f"data_{table_name}"
+
+
+def pg_store_params(vector_db_uri: str) -> dict:
+    """PGVectorStore.from_params connection arguments for a domain's ``vector_db_uri``."""
+    url = make_url(vector_db_uri)
+    return {
+        "database": url.database,
+        "host": url.host or "localhost",
+        "port": str(url.port or 5432),
+        "user": url.username,
+        "password": url.password,
+    }
+
+
+def open_pg_vector_store(vector_db_uri: str, table_name: str, schema: str, embed_dim: int):
+    """PGVectorStore for ``table_name`` in ``schema`` of the database at ``vector_db_uri``."""
+    from llama_index.vector_stores.postgres import PGVectorStore
+
+    return PGVectorStore.from_params(
+        **pg_store_params(vector_db_uri), table_name=table_name, schema_name=schema, embed_dim=embed_dim,
+    )
+
+
+def index_name(table: str, suffix: str) -> str:
+    """
+    Index name for ``table``, which may be schema-qualified.
+
+    An index name cannot carry a schema (the index is created in its table's
+    schema), so the prefix is dropped; unqualified tables keep the names
+    their indexes already have.
+    """
+    return f"{table.rsplit('.', 1)[-1]}_{suffix}"
+
+
+def vector_literal(vec) -> str:
+    """Format a vector as a pgvector text literal."""
+    return "[" + ",".join(f"{float(x):.7g}" for x in vec) + "]"
+
+
+def _spec(mode: str) -> dict:
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Unknown vector_storage_mode '{mode}'. Options: {', '.join(STORAGE_MODES)}")
+    return _MODE_SPECS.get(mode)
+
+
+def ensure_quantized_column(engine, table: str, mode: str, dim: int, mrl_dim: int = 256):
+    """Add and index the compact column for ``mode`` (no-op for ``full``)."""
+    spec = _spec(mode)
+    if spec is None:
+        return
+    col_type = spec["type"].format(dim=dim, mrl_dim=mrl_dim)
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {spec['column']} {col_type}"))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {index_name(table, spec['column'] + '_hnsw')} "
+            f"ON {table} USING hnsw ({spec['column']} {spec['opclass']})"
+        ))
+
+
+def populate_quantized_column(engine, table: str, mode: str, dim: int, mrl_dim: int = 256) -> int:
+    """
+    Derive the compact representation for rows that don't have one yet.
+
+    Returns the number of rows written.
+    """
+    spec = _spec(mode)
+    if spec is None:
+        return 0
+    expr = spec["expr"].format(vec="embedding", dim=dim, mrl_dim=mrl_dim)
+    with engine.begin() as conn:
+        result = conn.execute(text(
+            f"UPDATE {table} SET {spec['column']} = {expr} "
+            f"WHERE {spec['column']} IS NULL AND embedding IS NOT NULL"
+        ))
+        return result.rowcount
+
+
+def ensure_cluster_index(engine, table: str):
+    """B-tree index on the chunk's cluster_id, so cluster-routed searches skip other clusters' rows."""
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {table.replace('.', '_')}_cluster_id "
+            f"ON {table} ((metadata_->>'cluster_id'))"
+        ))
+
+
+def two_stage_search(
+    engine,
+    table: str,
+    query_embedding,
+    mode: str,
+    top_k: int,
+    candidates: int,
+    dim: int,
+    mrl_dim: int = 256,
+    doc_ids: list[str] | None = None,
+    cluster_ids: list | None = None,
+) -> list[tuple]:
+    """
+    Compact first pass, full-precision re-score.
+
+    Returns rows of (node_id, text, metadata_, score) ordered by cosine
+    similarity on the full embedding. ``cluster_ids`` restricts the search
+    to those clusters' rows (see src/common/cluster_routing.py).
+    """
+    spec = _spec(mode)
+    params = {"q": vector_literal(query_embedding), "k": top_k, "c": max(candidates, top_k)}
+    conditions = []
+    if doc_ids:
+        conditions.append("metadata_->>'doc_id' = ANY(:doc_ids)")
+        params["doc_ids"] = list(doc_ids)
+    if cluster_ids:
+        conditions.append("metadata_->>'cluster_id' = ANY(:cluster_ids)")
+        params["cluster_ids"] = [str(c) for c in cluster_ids]
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    q_full = "CAST(:q AS vector)"
+    if spec is None:
+        sql = (
+            f"SELECT node_id, text, metadata_, 1 - (embedding <=> {q_full}) AS score "
+            f"FROM {table} {where} ORDER BY embedding <=> {q_full} LIMIT :k"
+        )
+    else:
+        q_compact = spec["expr"].format(vec=q_full, dim=dim, mrl_dim=mrl_dim)
+        sql = (
+            f"WITH candidates AS ("
+            f"  SELECT node_id, text, metadata_, embedding FROM {table} {where}"
+            f"  ORDER BY {spec['column']} {spec['operator']} {q_compact} LIMIT :c"
+            f") "
+            f"SELECT node_id, text, metadata_, 1 - (embedding <=> {q_full}) AS score "
+            f"FROM candidates ORDER BY embedding <=> {q_full} LIMIT :k"
+        )
+    with engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(text(sql), params)]
+
+
+# --- NumPy equivalents (used by the benchmarks and the local backend) ---
+
+def quantize_matrix(matrix: np.ndarray, mode: str, mrl_dim: int = 256) -> np.ndarray:
+    """Compact copy of a row-normalized float32 matrix for ``mode``."""
+    _spec(mode)
+    if mode == "halfvec":
+        return matrix.astype(np.float16)
+    if mode == "binary":
+        return np.packbits(matrix > 0, axis=1)
+    if mode == "matryoshka":
+        head = matrix[:, :mrl_dim]
+        norms = np.linalg.norm(head, axis=1, keepdims=True)
+        return (head / np.where(norms == 0, 1, norms)).astype(np.float16)
+    return matrix
+
+
+def first_pass_scores(compact: np.ndarray, query: np.ndarray, mode: str, mrl_dim: int = 256) -> np.ndarray:
+    """Similarity of ``query`` to every compact row (higher is closer)."""
+    if mode == "binary":
+        q_bits = np.packbits(query > 0)
+        # Negated Hamming distance via popcount of XOR
+        return -np.unpackbits(np.bitwise_xor(compact, q_bits), axis=1).sum(axis=1, dtype=np.int32)
+    if mode == "matryoshka":
+        head = query[:mrl_dim]
+        query = head / (np.linalg.norm(head) or 1.0)
+    return compact.astype(np.float32) @ query.astype(np.float32)
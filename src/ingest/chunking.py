@@ -0,0 +1,242 @@
+"""
+/src/ingest/chunking.py
+
+Structure-aware chunking for ingestion.
+
+Documents are split at headings (markdown, ARTICLE / Section / §, numbered
+headings, short all-caps lines) into sections, and sections into clause and
+paragraph units. Units are packed into chunks of at most ``chunk_size``
+tokens (separators included) with ``chunk_overlap`` tokens of trailing units repeated at the start
+of the next chunk. Chunks never cross a section boundary, so overlap is only
+spent where it preserves context.
+
+Token counts come from the tokenizer LlamaIndex already caches, batched
+across threads (tiktoken releases the GIL) and memoized per unit, since legal
+corpora repeat the same clauses many times. Chunks whose normalized text was
+already seen (boilerplate, repeated notices) are dropped before embedding.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from llama_index.core.schema import NodeRelationship, TextNode
+from llama_index.core.utils import get_tokenizer
+
+HEADING_PATTERNS = [
+    r"#{1,6}\s+\S.*",                                                   # markdown
+    r"(ARTICLE|Article|SECTION|Section|CHAPTER|Chapter|PART|Part|"
+    r"SCHEDULE|Schedule|EXHIBIT|Exhibit|APPENDIX|Appendix)\s+[\dIVXLC]+[.:]?(\s+\S.*)?",
+    r"§+\s*\d+(\.\d+)*.*",                                              # § 12.3
+    r"\d+(\.\d+)*[.)]?\s+[A-Z][^.!?]{0,80}",                            # 4.2 Termination
+    r"[A-Z][A-Z0-9 ,&'\-]{3,60}",                                       # DEFINITIONS
+]
+HEADING_RE = re.compile(r"^\s*(?:" + "|".join(HEADING_PATTERNS) + r")\s*$")
+CLAUSE_RE = re.compile(r"^\s*(\([a-z]{1,3}\)|\([ivxlc]+\)|[a-z]\)|\d+\))\s+")
+SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+(?=[A-Z(\"'])")
+NORMALIZE_RE = re.compile(r"[\W_]+")
+UNIT_SEPARATOR = "\n\n"
+
+# Metadata added to chunks that should not influence embeddings or prompts
+CHUNK_META_KEYS = ["chunk_hash", "chunk_index", "section"]
+
+
+class TokenCounter:
+    """Memoized, batched token counting on the shared LlamaIndex tokenizer."""
+
+    def __init__(self, tokenizer=None, workers: int = None, max_cache: int = 200_000):
+        self.tokenizer = tokenizer or get_tokenizer()
+        # get_tokenizer() returns partial(Encoding.encode); reach the Encoding
+        # for its multithreaded batch API
+        encoding = getattr(getattr(self.tokenizer, "func", None), "__self__", None)
+        self._batch = getattr(encoding, "encode_ordinary_batch", None)
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.max_cache = max_cache
+        self._cache = {}
+
+    def count(self, text: str) -> int:
+        return self.count_many([text])[0]
+
+    def count_many(self, texts: list[str]) -> list[int]:
+        missing = list({t for t in texts if t not in self._cache})
+        if missing:
+            if self._batch is not None:
+                counts = [len(t) for t in self._batch(missing, num_threads=self.workers)]
+            elif len(missing) > 64 and self.workers > 1:
+                with ThreadPoolExecutor(self.workers) as pool:
+                    counts = [len(t) for t in pool.map(self.tokenizer, missing, chunksize=64)]
+            else:
+                counts = [len(self.tokenizer(t)) for t in missing]
+            if len(self._cache) + len(missing) > self.max_cache:
+                self._cache.clear()
+            self._cache.update(zip(missing, counts))
+        return [self._cache[t] for t in texts]
+
+
+def normalized_hash(text: str) -> str:
+    """Hash of text with case, punctuation and whitespace differences removed."""
+    return hashlib.sha1(NORMALIZE_RE.sub(" ", text.lower()).strip().encode()).hexdigest()
+
+
+def split_sections(text: str) -> list[tuple[str, list[str]]]:
+    """
+    Split text into (heading, units) sections.
+
+    Units are paragraphs, with clause markers like ``(a)`` / ``(iv)`` starting
+    a new unit even without a blank line.
+    """
+    sections = []
+    heading, units, current = "", [], []
+
+    def flush_unit():
+        if current:
+            units.append(" ".join(current))
+            current.clear()
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            flush_unit()
+            continue
+        if HEADING_RE.match(stripped) and len(stripped) <= 120:
+            flush_unit()
+            if units:
+                sections.append((heading, units))
+            heading, units = stripped.lstrip("#").strip(), []
+            continue
+        if CLAUSE_RE.match(stripped):
+            flush_unit()
+        current.append(stripped)
+    flush_unit()
+    if units:
+        sections.append((heading, units))
+    return sections
+
+
+class StructureAwareChunker:
+    """Split documents into section-bounded, overlap-aware, deduplicated chunks."""
+
+    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 100, dedupe: bool = True,
+                 counter: TokenCounter = None):
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.dedupe = dedupe
+        self.counter = counter or TokenCounter()
+        self.separator_tokens = self.counter.count(UNIT_SEPARATOR)
+        self.seen_hashes = set()
+        self.stats = {"documents": 0, "sections": 0, "chunks": 0, "duplicates_dropped": 0}
+
+    def _fit_units(self, units: list[str]) -> list[str]:
+        """Break units larger than chunk_size into sentences (or hard token windows)."""
+        counts = self.counter.count_many(units)
+        fitted = []
+        for unit, n in zip(units, counts):
+            if n <= self.chunk_size:
+                fitted.append(unit)
+                continue
+            for sentence in SENTENCE_RE.split(unit):
+                if self.counter.count(sentence) <= self.chunk_size:
+                    fitted.append(sentence)
+                else:
+                    fitted.extend(self._windows(sentence.split(), " "))
+        return fitted
+
+    def _windows(self, parts: list[str], joiner: str) -> list[str]:
+        """Longest runs of ``parts`` that fit chunk_size tokens (binary search per window)."""
+        def tokens(end, start):
+            # Tokenizer called directly: these one-off spans would only churn the unit cache
+            return len(self.counter.tokenizer(joiner.join(parts[start:end])))
+
+        windows, start = [], 0
+        while start < len(parts):
+            lo, hi = start + 1, len(parts)
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if tokens(mid, start) <= self.chunk_size:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            piece = joiner.join(parts[start:lo])
+            if joiner and lo == start + 1 and tokens(lo, start) > self.chunk_size:
+                windows.extend(self._windows(list(piece), ""))  # one oversized word: split by characters
+            else:
+                windows.append(piece)
+            start = lo
+        return windows
+
+    def _pack(self, units: list[str]) -> list[str]:
+        """Greedy packing with trailing-unit overlap; separators count toward chunk_size."""
+        units = self._fit_units(units)
+        counts = self.counter.count_many(units)
+        sep = self.separator_tokens
+        chunks, window, window_tokens = [], [], 0
+        for unit, n in zip(units, counts):
+            if window and window_tokens + sep + n > self.chunk_size:
+                chunks.append(UNIT_SEPARATOR.join(u for u, _ in window))
+                # Carry whole trailing units, up to chunk_overlap tokens
+                carried, carried_tokens = [], 0
+                for u, c in reversed(window):
+                    cost = c + (sep if carried else 0)
+                    if (carried_tokens + cost > self.chunk_overlap
+                            or carried_tokens + cost + sep + n > self.chunk_size):
+                        break
+                    carried.insert(0, (u, c))
+                    carried_tokens += cost
+                window, window_tokens = carried, carried_tokens
+            window_tokens += n + (sep if window else 0)
+            window.append((unit, n))
+        if window:
+            chunks.append(UNIT_SEPARATOR.join(u for u, _ in window))
+        return chunks
+
+    def chunk_document(self, document) -> list[TextNode]:
+        doc_id = document.metadata.get("doc_id") or document.doc_id
+        nodes = []
+        sections = split_sections(document.text)
+        self.stats["documents"] += 1
+        self.stats["sections"] += len(sections)
+
+        for heading, units in sections:
+            for chunk in self._pack(units):
+                chunk_hash = normalized_hash(chunk)
+                if self.dedupe and chunk_hash in self.seen_hashes:
+                    self.stats["duplicates_dropped"] += 1
+                    continue
+                self.seen_hashes.add(chunk_hash)
+
+                metadata = dict(document.metadata)
+                metadata.update({"section": heading, "chunk_index": len(nodes), "chunk_hash": chunk_hash})
+                node = TextNode(
+                    id_=hashlib.sha256(f"{doc_id}:{chunk_hash}".encode()).hexdigest()[:32],
+                    text=chunk,
+                    metadata=metadata,
+                    excluded_embed_metadata_keys=list(document.excluded_embed_metadata_keys) + CHUNK_META_KEYS,
+                    excluded_llm_metadata_keys=list(document.excluded_llm_metadata_keys) + CHUNK_META_KEYS,
+                )
+                node.relationships[NodeRelationship.SOURCE] = document.as_related_node_info()
+                nodes.append(node)
+        self.stats["chunks"] += len(nodes)
+        return nodes
+
+    def chunk_documents(self, documents) -> list[TextNode]:
+        nodes = []
+        for document in documents:
+            nodes.extend(self.chunk_document(document))
+        return nodes
+
+
+def baseline_chunk_count(documents, chunk_size: int = 512) -> int:
+    """Chunks the previous pipeline produced (LlamaIndex default splitter at chunk_size)."""
+    from llama_index.core.node_parser import SentenceSplitter
+
+    # SentenceSplitter's default overlap is 200 tokens; it rejects overlap >= chunk_size
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=min(200, chunk_size // 2))
+    return len(splitter.get_nodes_from_documents(documents))
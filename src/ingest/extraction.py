@@ -0,0 +1,225 @@
+"""
+/src/ingest/extraction.py
+
+Document text extraction for ingestion.
+
+Heavy formats (PDF, Office, RTF, ...) are sent to a parser service instead
+of being parsed in-process on one thread:
+
+  tika   - Apache Tika server (``PUT <url>/tika``, plain text back),
+           e.g. ``java -jar tika-server-standard.jar`` on localhost:9998
+  proxy  - the configured document_parser_url (multipart POST, JSON
+           ``{"text": ...}`` or plain text back)
+  local  - LlamaIndex's in-process readers, for every format
+
+Requests share one keep-alive session sized to the concurrency limit, with
+connect/read timeouts and retries on connection errors and 502/503/504.
+Extracted text is cached by the SHA-256 of the file contents (and parser
+kind), so re-ingesting an unchanged PDF never re-parses it, wherever it was
+fetched from. The cache also covers the local parser, so heavy formats are
+parsed once per content hash in every mode. Light formats (txt, md, ...)
+are always read locally and not cached.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import mimetypes
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import requests
+from llama_index.core import Document, SimpleDirectoryReader
+from llama_index.core.readers.file.base import default_file_metadata_func
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.ingest.endpoints import file_sha256
+
+PARSER_KINDS = ("tika", "proxy", "local")
+DEFAULT_SERVICE_FORMATS = (".pdf", ".doc", ".docx", ".ppt", ".pptx", ".xls", ".xlsx", ".rtf", ".odt", ".epub")
+# Kept out of embeddings and prompts, as SimpleDirectoryReader does
+FILE_METADATA_EXCLUDED = ["file_name", "file_type", "file_size", "creation_date",
+                          "last_modified_date", "last_accessed_date"]
+
+
+class ParserServiceError(RuntimeError):
+    pass
+
+
+class TextCache:
+    """Extracted text on disk, keyed by content hash and parser kind."""
+
+    def __init__(self, root):
+        self.root = Path(root).expanduser()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, sha: str, kind: str) -> Path:
+        return self.root / sha[:2] / f"{sha}.{kind}.txt"
+
+    def get(self, sha: str, kind: str):
+        path = self._path(sha, kind)
+        return path.read_text(encoding="utf-8") if path.exists() else None
+
+    def put(self, sha: str, kind: str, text: str):
+        path = self._path(sha, kind)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, path)
+
+
+class ParserClient:
+    """Keep-alive HTTP client for a Tika server or the document parser proxy."""
+
+    def __init__(self, url: str, kind: str = "tika", timeout: float = 120, concurrency: int = 4,
+                 connect_timeout: float = 5, retries: int = 2):
+        if kind not in ("tika", "proxy"):
+            raise ValueError(f"ParserClient kind must be 'tika' or 'proxy', got '{kind}'")
+        self.url = url.rstrip("/")
+        self.kind = kind
+        self.timeout = (connect_timeout, timeout)
+        self.session = requests.Session()
+        retry = Retry(total=retries, connect=retries, read=0, backoff_factor=0.5,
+                      status_forcelist=(502, 503, 504), allowed_methods=None)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def extract(self, path: Path) -> str:
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        # Read up front so a retried request resends the full body
+        body = path.read_bytes()
+        if self.kind == "tika":
+            response = self.session.put(
+                f"{self.url}/tika", data=body, timeout=self.timeout,
+                headers={"Accept": "text/plain", "Content-Type": content_type},
+            )
+        else:
+            response = self.session.post(
+                self.url, files={"file": (path.name, body, content_type)}, timeout=self.timeout,
+            )
+        if response.status_code >= 400:
+            raise ParserServiceError(f"{self.kind} returned HTTP {response.status_code} for {path.name}")
+        if "json" in response.headers.get("Content-Type", ""):
+            body = response.json()
+            return body.get("text") or body.get("content") or ""
+        response.encoding = response.encoding or "utf-8"
+        return response.text
+
+    def close(self):
+        self.session.close()
+
+
+class Extractor:
+    """
+    Turn staged files into Documents, in parallel, through the text cache.
+
+    Heavy formats become one Document per file; light formats keep
+    whatever the LlamaIndex reader produces.
+
+    Args:
+        parser_kind: tika, proxy or local
+        parser_url: Tika server base URL or document_parser_url
+        timeout: Read timeout per file, in seconds (parser_timeout_sec)
+        concurrency: Files extracted at once (and HTTP connections kept alive)
+        cache_dir: Extracted-text cache directory
+        service_formats: Extensions sent to the parser service
+        fallback_local: Parse locally when the service fails for a file
+    """
+
+    def __init__(self, parser_kind: str = "local", parser_url: str = None, timeout: float = 120,
+                 concurrency: int = 4, cache_dir="~/.swamp-thing/text_cache",
+                 service_formats=DEFAULT_SERVICE_FORMATS, fallback_local: bool = True):
+        if parser_kind not in PARSER_KINDS:
+            raise ValueError(f"parser_kind must be one of {PARSER_KINDS}, got '{parser_kind}'")
+        self.kind = parser_kind
+        self.client = ParserClient(parser_url, parser_kind, timeout, concurrency) if parser_kind != "local" else None
+        self.concurrency = concurrency
+        self.cache = TextCache(cache_dir)
+        self.service_formats = {ext.lower() for ext in service_formats}
+        self.fallback_local = fallback_local
+        self.stats = {"files": 0, "cache_hits": 0, "service": 0, "local": 0, "fallbacks": 0, "failed": 0}
+
+    @staticmethod
+    def _metadata(staged) -> dict:
+        metadata = default_file_metadata_func(str(staged.path))
+        metadata["file_name"] = staged.name
+        metadata["file_path"] = staged.uri
+        return metadata
+
+    def _local(self, staged) -> list[Document]:
+        return SimpleDirectoryReader(
+            input_files=[staged.path], file_metadata=lambda _: self._metadata(staged)
+        ).load_data()
+
+    def extract(self, staged) -> tuple[list[Document], str]:
+        """Documents for one staged file, and how they were produced."""
+        suffix = Path(staged.name).suffix.lower()
+        if suffix not in self.service_formats:
+            return self._local(staged), "local"
+
+        sha = file_sha256(staged.path)
+        kind, source = self.kind, "cache_hits"
+        text = self.cache.get(sha, kind)
+        if text is None:
+            if self.client is None:
+                text, source = self._local_text(staged), "local"
+            else:
+                try:
+                    text, source = self.client.extract(staged.path), "service"
+                except (requests.RequestException, ParserServiceError) as e:
+                    if not self.fallback_local:
+                        raise
+                    print(f"⚠️  Parser service failed for {staged.name} ({e}); parsing locally")
+                    kind = "local"
+                    text, source = self._local_text(staged), "fallbacks"
+            self.cache.put(sha, kind, text)
+
+        metadata = self._metadata(staged)
+        metadata["content_sha256"] = sha
+        excluded = FILE_METADATA_EXCLUDED + ["content_sha256"]
+        return [Document(text=text, metadata=metadata, excluded_embed_metadata_keys=list(excluded),
+                         excluded_llm_metadata_keys=list(excluded))], source
+
+    def _local_text(self, staged) -> str:
+        """In-process parse of a heavy format as one text (readers split PDFs per page)."""
+        return "\n\n".join(doc.text for doc in self._local(staged))
+
+    def extract_stream(self, staged_files):
+        """
+        Yield (staged, documents) as extractions finish.
+
+        At most 2x ``concurrency`` files are in flight, so a long listing
+        is never read ahead into memory.
+        """
+        max_pending = self.concurrency * 2
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix="extract") as pool:
+            pending = {}
+
+            def drain(until: int):
+                while len(pending) > until:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        staged = pending.pop(future)
+                        self.stats["files"] += 1
+                        try:
+                            documents, source = future.result()
+                        except Exception as e:
+                            self.stats["failed"] += 1
+                            print(f"⚠️  Failed to extract {staged.name}: {e}")
+                            continue
+                        self.stats[source] += 1
+                        yield staged, documents
+
+            for staged in staged_files:
+                pending[pool.submit(self.extract, staged)] = staged
+                yield from drain(max_pending - 1)
+            yield from drain(0)
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
@@ -0,0 +1,188 @@
+"""
+/src/ingest/jobs.py
+
+Resumable ingestion jobs.
+
+Every ingest run is a row in ``ingest_jobs`` (metadata_catalog, domain
+schema). Before any vectors are written the job stores its plan: each
+document's catalog id, cluster and canonical id, plus the cluster names.
+Documents are then embedded in batches; a batch's vectors are upserted
+first (existing vectors for its documents are deleted, and node ids are
+derived from chunk hashes), then its catalog rows and checkpoint row commit
+in one metadata transaction. A catalog row therefore never points at
+missing vectors, and a crash costs at most the batch in flight.
+
+``st ingest --resume`` reloads the latest unfinished job's plan, skipping
+clustering and the LLM calls behind it, and embeds only documents not yet
+checkpointed.
+
+A job embeds into the space that was active when it started. Each batch
+commit checks that space is still active (src/common/embedding_spaces.py),
+and ``st reembed cutover`` refuses to run while a job is running, so no
+batch lands in a space that has already been retired.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import json
+
+from sqlalchemy import text
+
+from src.common.embedding_spaces import check_active
+from src.common.query_cache import bump_generation, ensure_generation_table
+
+UNFINISHED = ("running", "failed")
+
+
+def ensure_job_tables(metadata_engine, schema: str = "public"):
+    """Create the job and checkpoint tables."""
+    with metadata_engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.ingest_jobs (
+                job_id SERIAL PRIMARY KEY,
+                domain TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                params JSONB,
+                plan JSONB,
+                docs_total INTEGER DEFAULT 0,
+                docs_done INTEGER DEFAULT 0,
+                chunks_done INTEGER DEFAULT 0,
+                batches_done INTEGER DEFAULT 0,
+                error TEXT,
+                started_at TIMESTAMP DEFAULT NOW(),
+                updated_at TIMESTAMP DEFAULT NOW(),
+                finished_at TIMESTAMP
+            )
+        """))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.ingest_job_batches (
+                job_id INTEGER NOT NULL REFERENCES {schema}.ingest_jobs(job_id) ON DELETE CASCADE,
+                batch_no INTEGER NOT NULL,
+                doc_ids TEXT[] NOT NULL,
+                chunk_count INTEGER NOT NULL,
+                committed_at TIMESTAMP DEFAULT NOW(),
+                PRIMARY KEY (job_id, batch_no)
+            )
+        """))
+    ensure_generation_table(metadata_engine, schema)
+
+
+def running_jobs(conn) -> list:
+    """(job_id, domain, updated_at) of every job marked running."""
+    return conn.execute(
+        text("SELECT job_id, domain, updated_at FROM ingest_jobs WHERE status = 'running' ORDER BY job_id")
+    ).all()
+
+
+class IngestJob:
+    """One ingest run: its plan, checkpoints and status."""
+
+    def __init__(self, engine, job_id: int, plan: dict = None, done_doc_ids: set = None,
+                 batches_done: int = 0, space_version: str = None):
+        self.engine = engine
+        self.job_id = job_id
+        self.plan = plan
+        self.done_doc_ids = done_doc_ids or set()
+        self.batches_done = batches_done
+        self.space_version = space_version
+
+    @classmethod
+    def start(cls, engine, domain: str, params: dict, space_version: str = None) -> "IngestJob":
+        """Open a new job; unfinished earlier jobs for the domain are marked superseded."""
+        with engine.begin() as conn:
+            conn.execute(
+                text("UPDATE ingest_jobs SET status = 'superseded', updated_at = NOW() "
+                     "WHERE domain = :domain AND status IN ('running', 'failed')"),
+                {"domain": domain},
+            )
+            job_id = conn.execute(
+                text("INSERT INTO ingest_jobs (domain, params) VALUES (:domain, CAST(:params AS JSONB)) "
+                     "RETURNING job_id"),
+                {"domain": domain, "params": json.dumps(params)},
+            ).scalar()
+        return cls(engine, job_id, space_version=space_version)
+
+    @classmethod
+    def latest_unfinished(cls, engine, domain: str, job_id: int = None, space_version: str = None):
+        """The job to resume (``job_id`` or the newest running/failed one), or None."""
+        with engine.connect() as conn:
+            row = conn.execute(
+                text("SELECT job_id, plan, status FROM ingest_jobs "
+                     "WHERE domain = :domain AND (:job_id IS NULL OR job_id = :job_id) "
+                     "ORDER BY job_id DESC LIMIT 1"),
+                {"domain": domain, "job_id": job_id},
+            ).first()
+            if row is None or row.status not in UNFINISHED or row.plan is None:
+                return None
+            batches = conn.execute(
+                text("SELECT doc_ids FROM ingest_job_batches WHERE job_id = :job_id"),
+                {"job_id": row.job_id},
+            ).all()
+        done = {doc_id for (doc_ids,) in batches for doc_id in doc_ids}
+        job = cls(engine, row.job_id, row.plan, done, len(batches), space_version)
+        with engine.begin() as conn:
+            conn.execute(
+                text("UPDATE ingest_jobs SET status = 'running', error = NULL, updated_at = NOW() "
+                     "WHERE job_id = :job_id"),
+                {"job_id": job.job_id},
+            )
+        return job
+
+    def save_plan(self, plan: dict):
+        self.plan = plan
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("UPDATE ingest_jobs SET plan = CAST(:plan AS JSONB), docs_total = :total, "
+                     "updated_at = NOW() WHERE job_id = :job_id"),
+                {"plan": json.dumps(plan), "total": len(plan["docs"]), "job_id": self.job_id},
+            )
+
+    def commit_batch(self, doc_ids: list[str], chunk_count: int, write_metadata):
+        """
+        Commit a batch whose vectors are already stored.
+
+        Also advances the domain's index generation, which invalidates
+        query processes' retrieval caches (src/common/query_cache.py).
+        Raises SpaceChangedError, committing nothing, when the job's
+        embedding space was cut over since the job started.
+
+        Args:
+            doc_ids: Catalog ids in the batch
+            chunk_count: Vectors written for them
+            write_metadata: Callable(conn) writing the batch's catalog rows in the same transaction
+        """
+        with self.engine.begin() as conn:
+            if self.space_version is not None:
+                check_active(conn, self.space_version)
+            write_metadata(conn)
+            conn.execute(
+                text("INSERT INTO ingest_job_batches (job_id, batch_no, doc_ids, chunk_count) "
+                     "VALUES (:job_id, :batch_no, :doc_ids, :chunks)"),
+                {"job_id": self.job_id, "batch_no": self.batches_done, "doc_ids": list(doc_ids),
+                 "chunks": chunk_count},
+            )
+            conn.execute(
+                text("UPDATE ingest_jobs SET docs_done = docs_done + :docs, chunks_done = chunks_done + :chunks, "
+                     "batches_done = batches_done + 1, updated_at = NOW() WHERE job_id = :job_id"),
+                {"docs": len(doc_ids), "chunks": chunk_count, "job_id": self.job_id},
+            )
+            bump_generation(conn)
+        self.batches_done += 1
+        self.done_doc_ids.update(doc_ids)
+
+    def _finish(self, status: str, error: str = None):
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("UPDATE ingest_jobs SET status = :status, error = :error, updated_at = NOW(), "
+                     "finished_at = CASE WHEN :status = 'completed' THEN NOW() END WHERE job_id = :job_id"),
+                {"status": status, "error": error, "job_id": self.job_id},
+            )
+
+    def complete(self):
+        self._finish("completed")
+
+    def fail(self, error: str):
+        self._finish("failed", error[:2000])
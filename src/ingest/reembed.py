@@ -0,0 +1,448 @@
+"""
+/src/ingest/reembed.py
+
+Background re-embedding into a new embedding space, without downtime.
+
+    st reembed start --version v2 --model mxbai-embed-large --dim 1024 [--rate 20] [--cutover]
+    st reembed resume --version v2
+    st reembed cutover --version v2
+    st reembed status
+
+``start`` registers the space as ``building`` and copies every chunk of
+the active space into it: text and metadata are read in node_id order
+(pgvector) or row order (local index), re-embedded with the new model at no
+more than ``--rate`` chunks per second, and written to the new table or
+directory. Progress is saved after every batch, so ``resume`` picks up from
+the last committed cursor.
+
+Queries keep using the active space throughout. When the copy finishes, a
+sync pass embeds chunks ingested meanwhile and drops chunks deleted
+meanwhile, and the space becomes ``ready``. Document and section summaries
+(src/ingest/summaries.py) are few, so their companion store is brought over
+by the sync pass alone, at build and again at cutover. ``cutover`` re-runs the sync,
+recomputes the cluster routing centroids in the new space, then saves them
+and flips the active space in one transaction (see
+src/common/embedding_spaces.py). It refuses to run while an ingest job is
+running, since that job is still writing to the current space; ``--force``
+overrides a job left 'running' by a crash (its later batches then fail the
+space check and can be resumed into the new space).
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import argparse
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from llama_index.core.schema import MetadataMode
+from llama_index.core.vector_stores.types import FilterOperator, MetadataFilter, MetadataFilters
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+import numpy as np
+from sqlalchemy import create_engine, text
+
+from src.common.cluster_routing import save_centroids
+from src.common.config import load_domain_config, load_global_config
+from src.common.domains import default_domain_name, ensure_domain_schema, load_domains, scoped_engine
+from src.common.embedding_spaces import (
+    active_space,
+    cut_over,
+    ensure_space_table,
+    get_space,
+    list_spaces,
+    load_progress,
+    make_embed_model,
+    register_space,
+    save_progress,
+)
+from src.common.local_vector_store import LocalVectorIndex, LocalVectorStore
+from src.common.vector_storage import (
+    ensure_cluster_index,
+    ensure_quantized_column,
+    open_pg_vector_store,
+    pg_table_name,
+    populate_quantized_column,
+)
+from src.ingest.jobs import ensure_job_tables, running_jobs
+
+GLOBAL_CONFIG = load_global_config()
+OLLAMA_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", GLOBAL_CONFIG.get("vector_backend", "postgres"))
+LOCAL_INDEX_DIR = Path(os.getenv("LOCAL_INDEX_DIR", GLOBAL_CONFIG.get("local_index_dir", "~/.swamp-thing/index"))).expanduser()
+VECTOR_STORAGE_MODE = os.getenv("VECTOR_STORAGE_MODE", GLOBAL_CONFIG.get("vector_storage_mode", "full"))
+MATRYOSHKA_DIM = int(GLOBAL_CONFIG.get("matryoshka_dim", 256))
+REEMBED_RATE = float(GLOBAL_CONFIG.get("reembed_rate_per_sec", 20))
+REEMBED_BATCH_SIZE = int(GLOBAL_CONFIG.get("reembed_batch_size", GLOBAL_CONFIG.get("embedding_batch_size", 32)))
+
+
+class RateLimiter:
+    """Token bucket: acquire(n) blocks until n more items fit under ``rate`` per second."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.allowance = rate
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n: int = 1):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= n
+            if self.allowance < 0:
+                time.sleep(-self.allowance / self.rate)
+
+
+class PGSpace:
+    """A space's pgvector table (or its summaries table) in one domain schema."""
+
+    def __init__(self, space, schema: str, vector_db_uri: str, summaries: bool = False):
+        self.space = space
+        self.schema = schema
+        self.vector_db_uri = vector_db_uri
+        self.summaries = summaries
+        self.table_name = space.table_name + "_summaries" if summaries else space.table_name
+        self.engine = create_engine(vector_db_uri)
+        self.table = f"{schema}.{pg_table_name(self.table_name)}"
+        self._store = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = open_pg_vector_store(self.vector_db_uri, self.table_name, self.schema, self.space.dim)
+        return self._store
+
+    def exists(self) -> bool:
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT to_regclass(:t)"), {"t": self.table}).scalar() is not None
+
+    def read_after(self, cursor, limit: int):
+        """[(node_id, text, metadata)] after ``cursor`` in node_id order, and the next cursor."""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f"SELECT node_id, text, metadata_ FROM {self.table} "
+                     f"WHERE (:cursor IS NULL OR node_id > :cursor) ORDER BY node_id LIMIT :limit"),
+                {"cursor": cursor, "limit": limit},
+            ).all()
+        return [tuple(r) for r in rows], (rows[-1][0] if rows else cursor)
+
+    def read_ids(self, node_ids: list[str]):
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f"SELECT node_id, text, metadata_ FROM {self.table} WHERE node_id = ANY(:ids)"),
+                {"ids": list(node_ids)},
+            ).all()
+        return [tuple(r) for r in rows]
+
+    def node_ids(self) -> set[str]:
+        if not self.exists():
+            return set()
+        with self.engine.connect() as conn:
+            return {r[0] for r in conn.execute(text(f"SELECT node_id FROM {self.table}"))}
+
+    def write(self, nodes):
+        # Re-running a batch after a crash replaces instead of duplicating
+        if self.exists():
+            self.store.delete_nodes(node_ids=[n.node_id for n in nodes])
+        self.store.add(nodes)
+
+    def delete_ids(self, node_ids: set[str]):
+        if node_ids:
+            self.store.delete_nodes(node_ids=list(node_ids))
+
+    def centroids(self) -> dict:
+        """{cluster_id: mean chunk embedding} in this space."""
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                f"SELECT metadata_->>'cluster_id' AS cluster_id, AVG(embedding) AS centroid FROM {self.table} "
+                f"WHERE metadata_->>'cluster_id' IS NOT NULL GROUP BY 1"
+            )).all()
+        return {int(r.cluster_id): np.asarray(json.loads(str(r.centroid)), dtype=np.float32) for r in rows}
+
+    def finalize(self):
+        if self.summaries:
+            # Summaries are searched at full precision, without cluster routing
+            return
+        ensure_cluster_index(self.engine, self.table)
+        if VECTOR_STORAGE_MODE != "full":
+            ensure_quantized_column(self.engine, self.table, VECTOR_STORAGE_MODE, self.space.dim, MATRYOSHKA_DIM)
+            populate_quantized_column(self.engine, self.table, VECTOR_STORAGE_MODE, self.space.dim, MATRYOSHKA_DIM)
+
+
+class LocalSpace:
+    """A space's local index directory (or its summaries subdirectory) under one domain's index dir."""
+
+    def __init__(self, space, schema: str, summaries: bool = False):
+        base = LOCAL_INDEX_DIR if schema == "public" else LOCAL_INDEX_DIR / schema
+        self.space = space
+        self.dir = space.local_dir(base) / "summaries" if summaries else space.local_dir(base)
+        self._store = None
+        self._resumed = False
+
+    @property
+    def store(self) -> LocalVectorStore:
+        if self._store is None:
+            self._store = LocalVectorStore(self.dir, embed_dim=self.space.dim)
+        return self._store
+
+    def _live(self, index: LocalVectorIndex, start: int, stop: int):
+        for row in range(start, stop):
+            if not index.tombstones[row]:
+                record = index.record(row)
+                yield row, record["node_id"], record["metadata"]
+
+    def read_after(self, cursor, limit: int):
+        index = self.store.client
+        start = int(cursor) + 1 if cursor is not None else 0
+        rows, last = [], cursor
+        for row, node_id, metadata in self._live(index, start, index.count):
+            rows.append((node_id, None, metadata))
+            last = str(row)
+            if len(rows) >= limit:
+                break
+        return rows, last
+
+    def read_ids(self, node_ids: list[str]):
+        wanted = set(node_ids)
+        return [(nid, None, meta) for _, nid, meta in self._live(self.store.client, 0, self.store.client.count)
+                if nid in wanted]
+
+    def node_ids(self) -> set[str]:
+        if not (self.dir / "index.json").exists():
+            return set()
+        return {nid for _, nid, _ in self._live(self.store.client, 0, self.store.client.count)}
+
+    def centroids(self) -> dict:
+        """{cluster_id: mean chunk embedding} in this space."""
+        index = self.store.client
+        if not index.count:
+            return {}
+        live = ~index.tombstones.astype(bool)
+        centroids = {}
+        for cluster_id, code in index.cluster_vocab.items():
+            rows = live & (index.cluster_codes == code)
+            if rows.any():
+                centroids[int(cluster_id)] = index.vectors[rows].mean(axis=0)
+        return centroids
+
+    def write(self, nodes):
+        if not self._resumed:
+            # A batch committed to the index just before a crash, but not to the copy
+            # cursor, is the index's tail; the first batch after a restart must not append it twice
+            index = self.store.client
+            tail = {nid for _, nid, _ in self._live(index, max(0, index.count - len(nodes)), index.count)}
+            nodes = [n for n in nodes if n.node_id not in tail]
+            self._resumed = True
+        self.store.add(nodes)
+
+    def delete_ids(self, node_ids: set[str]):
+        # Local rows are tombstoned per document; the sync pass re-adds surviving chunks
+        doc_ids = {node.metadata.get("doc_id") for node in to_nodes(self.read_ids(list(node_ids)))}
+        doc_ids.discard(None)
+        if doc_ids:
+            self.store.delete_nodes(filters=MetadataFilters(
+                filters=[MetadataFilter(key="doc_id", value=sorted(doc_ids), operator=FilterOperator.IN)]
+            ))
+
+    def finalize(self):
+        self.store.client.close()
+        self._store = None
+
+
+def open_space(space, domain, summaries: bool = False):
+    if VECTOR_BACKEND == "local":
+        return LocalSpace(space, domain.schema, summaries)
+    return PGSpace(space, domain.schema, domain.vector_db_uri, summaries)
+
+
+def to_nodes(rows):
+    """Rebuild nodes from stored (node_id, text, metadata) rows."""
+    nodes = []
+    for node_id, node_text, metadata in rows:
+        if isinstance(metadata, str):
+            metadata = json.loads(metadata)
+        node = metadata_dict_to_node(metadata, text=node_text)
+        node.id_ = node_id
+        nodes.append(node)
+    return nodes
+
+
+def embed_and_write(nodes, embed_model, target, limiter: RateLimiter):
+    if not nodes:
+        return
+    limiter.acquire(len(nodes))
+    texts = [n.get_content(metadata_mode=MetadataMode.EMBED) for n in nodes]
+    for node, vector in zip(nodes, embed_model.get_text_embedding_batch(texts)):
+        node.embedding = vector
+    target.write(nodes)
+
+
+def copy_space(metadata_engine, source, target, embed_model, rate: float, batch_size: int):
+    """Copy every source chunk into the target space from the saved cursor."""
+    version = target.space.version
+    cursor, done = load_progress(metadata_engine, version)
+    limiter = RateLimiter(rate)
+    started, resumed_at = time.monotonic(), done
+    while True:
+        rows, next_cursor = source.read_after(cursor, batch_size)
+        if not rows:
+            break
+        nodes = to_nodes(rows)
+        embed_and_write(nodes, embed_model, target, limiter)
+        done += len(nodes)
+        cursor = next_cursor
+        save_progress(metadata_engine, version, cursor, done)
+        print(f"   {done} chunks re-embedded into {version} "
+              f"({(done - resumed_at) / max(time.monotonic() - started, 1e-9):.1f}/s)", end="\r")
+    print()
+    return done
+
+
+def sync_space(source, target, embed_model, rate: float, batch_size: int) -> tuple[int, int]:
+    """Embed chunks added to the source since the copy, drop chunks removed from it."""
+    source_ids, target_ids = source.node_ids(), target.node_ids()
+    stale = target_ids - source_ids
+    target.delete_ids(stale)
+    if isinstance(target, LocalSpace) and stale:
+        # Whole documents were tombstoned; recompute what is missing
+        target_ids = target.node_ids()
+    missing = sorted(source_ids - target_ids)
+    limiter = RateLimiter(rate)
+    for start in range(0, len(missing), batch_size):
+        embed_and_write(to_nodes(source.read_ids(missing[start:start + batch_size])), embed_model, target, limiter)
+    return len(missing), len(stale)
+
+
+def sync_summaries(current, space, domain, embed_model, rate: float, batch_size: int) -> tuple[int, int]:
+    """Bring the summary store of ``space`` in line with the active space's."""
+    target = open_space(space, domain, summaries=True)
+    added, removed = sync_space(open_space(current, domain, summaries=True), target, embed_model, rate, batch_size)
+    target.finalize()
+    return added, removed
+
+
+def target_centroids(target) -> dict:
+    """
+    Cluster centroids in the target space, for cluster routing.
+
+    document_clusters holds one centroid per cluster, so they are saved in
+    the cutover transaction: saving them earlier would route queries on the
+    still-active space with the new space's centroids.
+    """
+    return {cid: vec / (np.linalg.norm(vec) or 1.0) for cid, vec in target.centroids().items()}
+
+
+def check_no_running_ingest(conn, force: bool = False):
+    """Refuse to cut over while an ingest job is still writing to the active space."""
+    jobs = running_jobs(conn)
+    if not jobs:
+        return
+    listing = ", ".join(f"{j.job_id} ({j.domain}, last batch {j.updated_at:%Y-%m-%d %H:%M})" for j in jobs)
+    if not force:
+        raise SystemExit(f"Ingest job {listing} is running; wait for it to finish, "
+                         f"or pass --force if it crashed")
+    print(f"⚠️  Cutting over despite running ingest job {listing}; its remaining batches will fail "
+          f"the space check and can be resumed into the new space")
+
+
+def build(metadata_engine, domain, version: str, rate: float, batch_size: int):
+    space = get_space(metadata_engine, version)
+    current = active_space(metadata_engine)
+    if space is None:
+        raise SystemExit(f"No embedding space {version}; run: st reembed start --version {version} ...")
+    source, target = open_space(current, domain), open_space(space, domain)
+    embed_model = make_embed_model(space, OLLAMA_URL, embed_batch_size=batch_size)
+
+    print(f"\n1. Re-embedding {current.version} ({current.model}) -> {space.version} ({space.model}, "
+          f"dim {space.dim}) at <= {rate:g} chunks/s")
+    copy_space(metadata_engine, source, target, embed_model, rate, batch_size)
+    print("\n2. Syncing chunks ingested or deleted during the copy...")
+    added, removed = sync_space(source, target, embed_model, rate, batch_size)
+    target.finalize()
+    summaries, _ = sync_summaries(current, space, domain, embed_model, rate, batch_size)
+    save_progress(metadata_engine, version, *load_progress(metadata_engine, version), status="ready")
+    print(f"✅ {version} is ready ({added} added, {removed} removed in sync, {summaries} summaries re-embedded)")
+
+
+def cutover(metadata_engine, domain, version: str, rate: float, batch_size: int, force: bool = False):
+    space = get_space(metadata_engine, version)
+    if space is None or space.status != "ready":
+        raise SystemExit(f"Embedding space {version} is not ready (status: {space.status if space else 'missing'})")
+    with metadata_engine.connect() as conn:
+        check_no_running_ingest(conn, force)  # fail before the final sync, not after it
+    current = active_space(metadata_engine)
+    source, target = open_space(current, domain), open_space(space, domain)
+    embed_model = make_embed_model(space, OLLAMA_URL, embed_batch_size=batch_size)
+    added, removed = sync_space(source, target, embed_model, rate, batch_size)
+    target.finalize()
+    sync_summaries(current, space, domain, embed_model, rate, batch_size)
+    centroids = target_centroids(target)
+
+    def before_commit(conn):
+        # Checked again under the cutover's lock: a job may have started during the sync
+        check_no_running_ingest(conn, force)
+        if centroids:
+            save_centroids(conn, centroids, version)
+
+    cut_over(metadata_engine, version, before_commit)
+    routed = len(centroids)
+    print(f"✅ Active embedding space is now {version} ({space.model}); "
+          f"{current.version} retired ({added} added, {removed} removed in final sync, "
+          f"{routed} cluster centroids recomputed)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Re-embed the corpus into a new embedding space")
+    parser.add_argument("action", choices=["start", "resume", "cutover", "status"])
+    parser.add_argument("--domain", default=None)
+    parser.add_argument("--version", help="new space version tag, e.g. v2")
+    parser.add_argument("--model", help="embedding model for the new space (start)")
+    parser.add_argument("--dim", type=int, help="embedding dimension of --model (start)")
+    parser.add_argument("--rate", type=float, default=REEMBED_RATE, help="max chunks re-embedded per second")
+    parser.add_argument("--batch-size", type=int, default=REEMBED_BATCH_SIZE)
+    parser.add_argument("--cutover", action="store_true", help="cut over as soon as the new space is ready")
+    parser.add_argument("--force", action="store_true",
+                        help="cut over even though an ingest job is marked running (e.g. after a crash)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    domain_config = load_domain_config(os.getenv("CONFIG_PATH"))
+    domains = load_domains(domain_config)
+    domain = domains[args.domain or default_domain_name(domain_config, domains)]
+    metadata_engine = scoped_engine(domain.metadata_db_uri, domain.schema)
+    ensure_domain_schema(metadata_engine, domain.schema)
+    ensure_space_table(metadata_engine, domain.schema)
+    ensure_job_tables(metadata_engine, domain.schema)
+
+    if args.action == "status":
+        for s in list_spaces(metadata_engine):
+            print(f"{s['version']:>8}  {s['status']:<9} {s['model']} (dim {s['dim']}), "
+                  f"{s['rows_embedded'] or 0} rows, table {s['table_name']}")
+        return
+    if not args.version:
+        raise SystemExit("--version is required")
+
+    if args.action == "start":
+        if not args.model or not args.dim:
+            raise SystemExit("start needs --model and --dim")
+        register_space(metadata_engine, args.version, args.model, args.dim)
+    if args.action in ("start", "resume"):
+        build(metadata_engine, domain, args.version, args.rate, args.batch_size)
+        if not args.cutover:
+            print(f"   Cut over with: st reembed cutover --version {args.version}")
+            return
+    cutover(metadata_engine, domain, args.version, args.rate, args.batch_size, args.force)
+
+
+if __name__ == "__main__":
+    main()
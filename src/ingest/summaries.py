@@ -0,0 +1,244 @@
+"""
+/src/ingest/summaries.py
+
+Document and section summaries for small-to-big retrieval.
+
+For every embedded document, ingestion writes a summary per section (a run
+of chunks under one heading, when it spans at least
+``summary_min_section_chunks`` chunks) and one per document, built from
+the section summaries so long documents are covered without an oversized
+prompt. Summaries are embedded into a companion vector store next to the
+chunks (``<table>_summaries`` / ``<index dir>/summaries``), and their text
+is kept in ``document_summaries`` for ``st manage summary``.
+
+Each chunk carries ``parent_id`` (its section summary, or the document
+summary when its section has none) and a PARENT relationship; section
+summaries point at the document summary. With ``summary_first_retrieval``
+on, queries also search summaries and add them, and more chunks of their
+documents, to the normal chunk search (src/agents/semantic_retriever_agent.py).
+
+``summary_mode: extractive`` (the default) takes the leading sentences,
+with no LLM calls; ``llm`` asks the ingest LLM (bulk priority on the
+endpoint pool), one call per summarized section and per document.
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import hashlib
+
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from sqlalchemy import text
+
+from src.common.config import load_global_config
+from src.common.llm_pool import complete_many
+from src.ingest.chunking import SENTENCE_RE, TokenCounter
+
+GLOBAL_CONFIG = load_global_config()
+SUMMARIES_ENABLED = bool(GLOBAL_CONFIG.get("summaries", True))
+SUMMARY_MODE = GLOBAL_CONFIG.get("summary_mode", "extractive")
+SUMMARY_MIN_SECTION_CHUNKS = int(GLOBAL_CONFIG.get("summary_min_section_chunks", 2))
+SUMMARY_MAX_INPUT_TOKENS = int(GLOBAL_CONFIG.get("summary_max_input_tokens", 3000))
+SUMMARY_MAX_WORDS = int(GLOBAL_CONFIG.get("summary_max_words", 120))
+if SUMMARY_MODE not in ("llm", "extractive"):
+    raise ValueError(f"summary_mode must be 'llm' or 'extractive', got '{SUMMARY_MODE}'")
+
+# Summary and parent keys stay out of embeddings and prompts
+SUMMARY_META_KEYS = ["summary_level", "parent_id", "section_index", "chunk_count"]
+
+SECTION_PROMPT = """Summarize this section of a document in at most {words} words.
+State what it covers: parties, obligations, events, dates and conclusions. No preamble.
+
+Section: {heading}
+
+{text}
+
+Summary:"""
+
+DOCUMENT_PROMPT = """Summarize this document in at most {words} words from its section summaries.
+State what kind of document it is, who it concerns and its main points. No preamble.
+
+{text}
+
+Summary:"""
+
+
+def summary_id(doc_id: str, section_index: int = None) -> str:
+    key = f"{doc_id}:summary" if section_index is None else f"{doc_id}:summary:{section_index}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def group_sections(nodes: list[TextNode]) -> list[tuple[str, list[TextNode]]]:
+    """Consecutive chunks of one document under the same heading, in chunk order."""
+    sections = []
+    for node in sorted(nodes, key=lambda n: n.metadata.get("chunk_index", 0)):
+        heading = node.metadata.get("section", "")
+        if sections and sections[-1][0] == heading:
+            sections[-1][1].append(node)
+        else:
+            sections.append((heading, [node]))
+    return sections
+
+
+class Summarizer:
+    """
+    Builds summary nodes for a batch of documents and links their chunks.
+
+    Args:
+        llm: LLM used in ``llm`` mode (complete_many spreads it over the endpoint pool)
+        mode: 'llm' or 'extractive'
+        min_section_chunks: Sections with fewer chunks get no summary of their own
+        max_input_tokens: Text per summary prompt is cut to this many tokens
+        max_words: Target summary length
+    """
+
+    def __init__(self, llm=None, mode: str = SUMMARY_MODE, min_section_chunks: int = SUMMARY_MIN_SECTION_CHUNKS,
+                 max_input_tokens: int = SUMMARY_MAX_INPUT_TOKENS, max_words: int = SUMMARY_MAX_WORDS,
+                 counter: TokenCounter = None):
+        self.llm = llm
+        self.mode = mode
+        self.min_section_chunks = min_section_chunks
+        self.max_input_tokens = max_input_tokens
+        self.max_words = max_words
+        self.counter = counter or TokenCounter()
+        self.stats = {"documents": 0, "sections": 0, "llm_calls": 0}
+
+    def _truncate(self, parts: list[str]) -> str:
+        kept, used = [], 0
+        for part, n in zip(parts, self.counter.count_many(parts)):
+            if used + n > self.max_input_tokens:
+                break
+            kept.append(part)
+            used += n
+        return "\n\n".join(kept or [parts[0][: self.max_input_tokens * 4]])
+
+    def _extract(self, text_: str) -> str:
+        words, out = 0, []
+        for sentence in SENTENCE_RE.split(" ".join(text_.split())):
+            n = len(sentence.split())
+            if out and words + n > self.max_words:
+                break
+            out.append(sentence)
+            words += n
+        return " ".join(out)
+
+    def _summarize(self, prompts: list[str], texts: list[str]) -> list[str]:
+        if self.mode == "extractive":
+            return [self._extract(t) for t in texts]
+        self.stats["llm_calls"] += len(prompts)
+        return [s.strip() for s in complete_many(self.llm, prompts)]
+
+    def summarize(self, documents: list, nodes_by_doc: dict) -> list[TextNode]:
+        """
+        Summary nodes for ``documents``; sets parent links on their chunks in place.
+
+        Args:
+            documents: Documents whose metadata carries doc_id / cluster_id / canonical_doc_id
+            nodes_by_doc: {doc_id: [chunk TextNode]} from the chunker
+
+        Returns:
+            Section and document summary nodes, not yet embedded
+        """
+        # Pass 1: every document's summarized sections
+        sections, prompts, texts = [], [], []
+        for doc in documents:
+            doc_id = doc.metadata["doc_id"]
+            for index, (heading, chunks) in enumerate(group_sections(nodes_by_doc.get(doc_id, []))):
+                if len(chunks) < self.min_section_chunks:
+                    continue
+                body = self._truncate([c.get_content() for c in chunks])
+                sections.append((doc, index, heading, chunks))
+                texts.append(body)
+                prompts.append(SECTION_PROMPT.format(words=self.max_words, heading=heading or "(untitled)",
+                                                     text=body))
+        section_summaries = self._summarize(prompts, texts)
+
+        # Pass 2: document summaries from the section summaries (or the opening chunks)
+        by_doc = {}
+        for (doc, index, heading, chunks), summary in zip(sections, section_summaries):
+            by_doc.setdefault(doc.metadata["doc_id"], []).append((index, heading, chunks, summary))
+        prompts, texts = [], []
+        for doc in documents:
+            doc_id = doc.metadata["doc_id"]
+            parts = [f"{h or '(untitled)'}: {s}" for _, h, _, s in by_doc.get(doc_id, [])]
+            if not parts:
+                parts = [c.get_content() for c in sorted(nodes_by_doc.get(doc_id, []),
+                                                         key=lambda n: n.metadata.get("chunk_index", 0))]
+            body = self._truncate(parts) if parts else doc.text[: self.max_input_tokens * 4]
+            texts.append(body)
+            prompts.append(DOCUMENT_PROMPT.format(words=self.max_words, text=body))
+        document_summaries = self._summarize(prompts, texts)
+
+        summary_nodes = []
+        for doc, doc_summary in zip(documents, document_summaries):
+            doc_id = doc.metadata["doc_id"]
+            chunks = nodes_by_doc.get(doc_id, [])
+            doc_node = self._node(doc, summary_id(doc_id), doc_summary, "document", None, "", None, len(chunks))
+            summary_nodes.append(doc_node)
+            parents = {c.node_id: doc_node for c in chunks}
+            for index, heading, section_chunks, summary in by_doc.get(doc_id, []):
+                node = self._node(doc, summary_id(doc_id, index), summary, "section", index, heading,
+                                  doc_node, len(section_chunks))
+                summary_nodes.append(node)
+                parents.update({c.node_id: node for c in section_chunks})
+            for chunk in chunks:
+                link_parent(chunk, parents[chunk.node_id])
+        self.stats["documents"] += len(documents)
+        self.stats["sections"] += len(sections)
+        return summary_nodes
+
+    @staticmethod
+    def _node(doc, node_id: str, summary: str, level: str, section_index, heading: str, parent,
+              chunk_count: int) -> TextNode:
+        metadata = dict(doc.metadata)
+        metadata.update({"summary_level": level, "section": heading, "section_index": section_index,
+                         "chunk_count": chunk_count})
+        node = TextNode(
+            id_=node_id, text=summary, metadata=metadata,
+            excluded_embed_metadata_keys=list(doc.excluded_embed_metadata_keys) + SUMMARY_META_KEYS,
+            excluded_llm_metadata_keys=list(doc.excluded_llm_metadata_keys) + SUMMARY_META_KEYS,
+        )
+        node.relationships[NodeRelationship.SOURCE] = doc.as_related_node_info()
+        if parent is not None:
+            link_parent(node, parent)
+        return node
+
+
+def link_parent(node: TextNode, parent: TextNode):
+    node.metadata["parent_id"] = parent.node_id
+    node.relationships[NodeRelationship.PARENT] = RelatedNodeInfo(node_id=parent.node_id)
+    for keys in (node.excluded_embed_metadata_keys, node.excluded_llm_metadata_keys):
+        if "parent_id" not in keys:
+            keys.append("parent_id")
+
+
+def save_summaries(conn, summary_nodes: list[TextNode]):
+    """Replace the stored summary text of the nodes' documents (inside the batch transaction)."""
+    doc_ids = sorted({n.metadata["doc_id"] for n in summary_nodes})
+    if not doc_ids:
+        return
+    conn.execute(text("DELETE FROM document_summaries WHERE doc_id = ANY(:ids)"), {"ids": doc_ids})
+    conn.execute(
+        text("INSERT INTO document_summaries "
+             "(summary_id, doc_id, level, section_index, section, summary, parent_id, chunk_count) "
+             "VALUES (:summary_id, :doc_id, :level, :section_index, :section, :summary, :parent_id, :chunk_count)"),
+        [{"summary_id": n.node_id, "doc_id": n.metadata["doc_id"], "level": n.metadata["summary_level"],
+          "section_index": n.metadata.get("section_index"), "section": n.metadata.get("section") or None,
+          "summary": n.get_content(), "parent_id": n.metadata.get("parent_id"),
+          "chunk_count": n.metadata.get("chunk_count")}
+         for n in summary_nodes],
+    )
+
+
+def load_summaries(metadata_engine, doc_id: str) -> list[dict]:
+    """Stored summaries of one document: the document summary first, then sections in order."""
+    with metadata_engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT level, section_index, section, summary, chunk_count, updated_at "
+                 "FROM document_summaries WHERE doc_id = :doc_id "
+                 "ORDER BY level = 'section', section_index"),
+            {"doc_id": doc_id},
+        ).mappings().all()
+    return [dict(r) for r in rows]
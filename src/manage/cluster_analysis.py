@@ -0,0 +1,394 @@
+"""
+/src/manage/cluster_analysis.py
+
+Catalog-wide clustering diagnostics (``st manage analyze``).
+
+Works on one vector per document (the normalized mean of its chunk
+embeddings), exported once per index generation to memory-mapped files:
+
+  vectors.f32   (docs, dim) float32, unit rows
+  clusters.i32  cluster_id per document (-1: unclustered)
+  doc_ids.json  document ids, in row order
+  meta.json     dim, count, embedding version, index generation
+
+Every pass reads ``block_rows`` documents at a time, so memory stays at a
+few blocks (plus one float per document) however large the catalog is.
+Blocks are spread over a thread pool; the NumPy matrix products release
+the GIL, so all cores are used.
+
+  centroids   per-cluster sums through a one-hot matrix product
+  cohesion    each document's similarity to its own centroid
+  silhouette  exact silhouette for a random sample of documents, with
+              per-cluster mean distances accumulated over all blocks
+  outliers    nearest-neighbor similarity per document (within its cluster
+              by default, or over the whole catalog); the lowest are reported
+  separation  centroid-to-centroid similarity; close pairs are merge candidates
+
+Author: Forest Mars
+Version: 0.1
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+from src.common.config import load_global_config
+from src.common.local_vector_store import NO_CLUSTER, LocalVectorIndex
+
+GLOBAL_CONFIG = load_global_config()
+ANALYSIS_DIR = Path(os.getenv("ANALYSIS_DIR", GLOBAL_CONFIG.get("analysis_dir", "~/.swamp-thing/analysis"))).expanduser()
+ANALYSIS_BLOCK_ROWS = int(GLOBAL_CONFIG.get("analysis_block_rows", 2048))
+ANALYSIS_WORKERS = int(GLOBAL_CONFIG.get("analysis_workers", 0)) or os.cpu_count() or 1
+
+
+# --- chunk sources: blocks of (doc_ids, cluster_ids, vectors) ---
+
+def local_chunk_blocks(index_dir: Path, block_rows: int):
+    """Live rows of a LocalVectorIndex, straight from its memory-mapped arrays."""
+    index = LocalVectorIndex(index_dir, read_only=True)
+    try:
+        docs = np.empty(len(index.doc_vocab), dtype=object)
+        for doc_id, code in index.doc_vocab.items():
+            docs[code] = doc_id
+        clusters = np.full(len(index.cluster_vocab) + 1, NO_CLUSTER, dtype=np.int32)
+        for cluster_id, code in index.cluster_vocab.items():
+            clusters[code] = int(cluster_id)
+        for start in range(0, index.count, block_rows):
+            stop = min(start + block_rows, index.count)
+            live = np.flatnonzero(index.tombstones[start:stop] == 0) + start
+            codes = index.cluster_codes[live]
+            yield (docs[index.doc_codes[live]],
+                   np.where(codes == NO_CLUSTER, NO_CLUSTER, clusters[codes]),
+                   np.asarray(index.vectors[live], dtype=np.float32))
+    finally:
+        index.close()
+
+
+def pg_chunk_blocks(vector_db_uri: str, table: str, block_rows: int):
+    """Chunk embeddings of a pgvector table, streamed through a server-side cursor."""
+    engine = create_engine(vector_db_uri)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=block_rows).execute(text(
+            f"SELECT metadata_->>'doc_id', metadata_->>'cluster_id', embedding::text FROM {table}"
+        ))
+        for rows in result.partitions(block_rows):
+            vectors = np.stack([np.fromstring(r[2][1:-1], sep=",", dtype=np.float32) for r in rows])
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            yield (np.array([r[0] for r in rows], dtype=object),
+                   np.array([NO_CLUSTER if r[1] is None else int(r[1]) for r in rows], dtype=np.int32),
+                   vectors)
+    engine.dispose()
+
+
+# --- document vectors ---
+
+class DocVectors:
+    """Memory-mapped per-document vectors written by export_doc_vectors."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text())
+        n, dim = self.meta["count"], self.meta["dim"]
+        self.vectors = np.memmap(self.path / "vectors.f32", dtype=np.float32, mode="r", shape=(n, dim)) \
+            if n else np.empty((0, dim), dtype=np.float32)
+        self.clusters = np.fromfile(self.path / "clusters.i32", dtype=np.int32)
+        self.doc_ids = json.loads((self.path / "doc_ids.json").read_text())
+
+    def __len__(self):
+        return self.meta["count"]
+
+    @staticmethod
+    def current(path: Path, generation: int, embedding_version: str) -> bool:
+        """True when ``path`` holds an export of this index generation and space."""
+        try:
+            meta = json.loads((Path(path) / "meta.json").read_text())
+        except (OSError, ValueError):
+            return False
+        return meta.get("generation") == generation and meta.get("embedding_version") == embedding_version
+
+
+def export_doc_vectors(blocks, path: Path, dim: int, embedding_version: str, generation: int) -> DocVectors:
+    """
+    Average chunk vectors into one unit vector per document.
+
+    Chunk blocks are folded into an on-disk accumulator, so only the
+    document id map lives in memory. A document's cluster is the one its
+    chunks were tagged with.
+
+    Args:
+        blocks: Iterable of (doc_ids, cluster_ids, vectors) chunk blocks
+        path: Output directory
+        dim: Embedding dimension
+        embedding_version: Space the vectors come from (recorded in meta.json)
+        generation: Index generation exported (recorded in meta.json)
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    accumulator = path / "vectors.acc"
+    doc_index, clusters, counts = {}, [], []
+    sums = None
+    capacity = 0
+    with open(accumulator, "w+b") as fh:
+        for doc_ids, cluster_ids, vectors in blocks:
+            if not len(doc_ids):
+                continue
+            rows = np.array([doc_index.setdefault(d, len(doc_index)) for d in doc_ids], dtype=np.int64)
+            if len(doc_index) > capacity:
+                # Grow the accumulator geometrically; new pages read as zeros
+                if sums is not None:
+                    sums.flush()
+                    del sums
+                capacity = max(len(doc_index), capacity * 2, 1024)
+                fh.truncate(capacity * dim * 4)
+                sums = np.memmap(fh, dtype=np.float32, mode="r+", shape=(capacity, dim))
+            order = np.argsort(rows, kind="stable")
+            unique, starts = np.unique(rows[order], return_index=True)
+            sums[unique] += np.add.reduceat(vectors[order], starts, axis=0)
+            clusters.extend([NO_CLUSTER] * (len(doc_index) - len(clusters)))
+            counts.extend([0] * (len(doc_index) - len(counts)))
+            for row, cluster_id in zip(rows, cluster_ids):
+                counts[row] += 1
+                if cluster_id != NO_CLUSTER:
+                    clusters[row] = int(cluster_id)
+
+        n = len(doc_index)
+        if n:
+            out = np.memmap(path / "vectors.f32", dtype=np.float32, mode="w+", shape=(n, dim))
+            for start in range(0, n, ANALYSIS_BLOCK_ROWS):
+                block = np.asarray(sums[start:min(start + ANALYSIS_BLOCK_ROWS, n)])
+                out[start:start + len(block)] = block / np.maximum(
+                    np.linalg.norm(block, axis=1, keepdims=True), 1e-12
+                )
+            out.flush()
+            del out
+        del sums
+    accumulator.unlink()
+
+    np.asarray(clusters, dtype=np.int32).tofile(path / "clusters.i32")
+    (path / "doc_ids.json").write_text(json.dumps(list(doc_index)))
+    (path / "meta.json").write_text(json.dumps({
+        "count": n, "dim": dim, "chunks": int(sum(counts)),
+        "embedding_version": embedding_version, "generation": generation,
+        "exported_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }))
+    return DocVectors(path)
+
+
+# --- analysis ---
+
+def _blocks(n: int, block_rows: int):
+    return [(start, min(start + block_rows, n)) for start in range(0, n, block_rows)]
+
+
+def _one_hot(labels: np.ndarray, k: int) -> np.ndarray:
+    hot = np.zeros((len(labels), k), dtype=np.float32)
+    hot[np.arange(len(labels)), labels] = 1.0
+    return hot
+
+
+class ClusterAnalyzer:
+    """
+    Blocked, multithreaded diagnostics over a DocVectors export.
+
+    Args:
+        docs: DocVectors export
+        block_rows: Documents per block (bounds memory at ~block_rows^2 floats per worker)
+        workers: Threads for block work
+    """
+
+    def __init__(self, docs: DocVectors, block_rows: int = ANALYSIS_BLOCK_ROWS, workers: int = ANALYSIS_WORKERS):
+        self.docs = docs
+        self.block_rows = block_rows
+        self.workers = workers
+        self.X = docs.vectors
+        # Clustered documents only; labels are dense 0..k-1 codes
+        self.cluster_ids, labels = np.unique(docs.clusters, return_inverse=True)
+        self.labels = labels.astype(np.int64)
+        if len(self.cluster_ids) and self.cluster_ids[0] == NO_CLUSTER:
+            self.cluster_ids = self.cluster_ids[1:]
+            self.labels -= 1  # unclustered documents become -1
+        self.k = len(self.cluster_ids)
+        self.sizes = np.bincount(self.labels[self.labels >= 0], minlength=self.k)
+        self.centroids = None
+
+    def _map(self, fn, items):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(fn, items))
+
+    def compute_centroids(self) -> np.ndarray:
+        """Unit centroid per cluster."""
+        def partial(bounds):
+            start, stop = bounds
+            labels = self.labels[start:stop]
+            keep = labels >= 0
+            return _one_hot(labels[keep], self.k).T @ np.asarray(self.X[start:stop])[keep]
+
+        sums = sum(self._map(partial, _blocks(len(self.X), self.block_rows)), np.zeros((self.k, self.X.shape[1])))
+        self.centroids = (sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)).astype(np.float32)
+        return self.centroids
+
+    def cohesion(self) -> tuple[np.ndarray, list[dict]]:
+        """Similarity of every document to its own centroid, and per-cluster summaries."""
+        if self.centroids is None:
+            self.compute_centroids()
+        sims = np.full(len(self.X), np.nan, dtype=np.float32)
+
+        def fill(bounds):
+            start, stop = bounds
+            labels = self.labels[start:stop]
+            keep = np.flatnonzero(labels >= 0)
+            block = np.asarray(self.X[start:stop])
+            sims[start + keep] = np.einsum("ij,ij->i", block[keep], self.centroids[labels[keep]])
+
+        self._map(fill, _blocks(len(self.X), self.block_rows))
+        per_cluster = []
+        for c in range(self.k):
+            s = sims[self.labels == c]
+            per_cluster.append({
+                "cluster_id": int(self.cluster_ids[c]), "docs": int(self.sizes[c]),
+                "cohesion_mean": round(float(s.mean()), 4) if len(s) else None,
+                "cohesion_std": round(float(s.std()), 4) if len(s) else None,
+                "cohesion_min": round(float(s.min()), 4) if len(s) else None,
+            })
+        return sims, per_cluster
+
+    def silhouette(self, sample_size: int = 2000, seed: int = 0) -> dict:
+        """
+        Silhouette of a random sample of clustered documents (cosine distance).
+
+        Each sampled document's mean distance to every cluster is accumulated
+        over all blocks, so the scores are exact for the sample.
+        """
+        clustered = np.flatnonzero(self.labels >= 0)
+        if self.k < 2 or not len(clustered):
+            return {"sample": 0, "mean": None, "per_cluster": {}}
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(clustered, size=min(sample_size, len(clustered)), replace=False))
+        Xs = np.asarray(self.X[sample])
+
+        def partial(bounds):
+            start, stop = bounds
+            labels = self.labels[start:stop]
+            keep = labels >= 0
+            distances = 1.0 - Xs @ np.asarray(self.X[start:stop])[keep].T
+            return distances @ _one_hot(labels[keep], self.k)
+
+        totals = sum(self._map(partial, _blocks(len(self.X), self.block_rows)), np.zeros((len(sample), self.k)))
+        own = self.labels[sample]
+        rows = np.arange(len(sample))
+        # Own-cluster mean excludes the document itself (its distance is ~0)
+        a = totals[rows, own] / np.maximum(self.sizes[own] - 1, 1)
+        means = totals / np.maximum(self.sizes, 1)
+        means[:, self.sizes == 0] = np.inf
+        means[rows, own] = np.inf
+        b = means.min(axis=1)
+        scores = np.where(self.sizes[own] > 1, (b - a) / np.maximum(np.maximum(a, b), 1e-12), 0.0)
+        return {
+            "sample": len(sample),
+            "mean": round(float(scores.mean()), 4),
+            "per_cluster": {
+                int(self.cluster_ids[c]): round(float(scores[own == c].mean()), 4)
+                for c in range(self.k) if (own == c).any()
+            },
+        }
+
+    def nearest_neighbors(self, scope: str = "cluster") -> tuple[np.ndarray, np.ndarray]:
+        """
+        Each document's most similar other document.
+
+        Args:
+            scope: 'cluster' compares documents within their cluster (sum of
+                size^2 work); 'global' compares every pair in the catalog
+
+        Returns:
+            (similarity, neighbor row) per document; NaN / -1 where none exists
+        """
+        best = np.full(len(self.X), -np.inf, dtype=np.float32)
+        neighbor = np.full(len(self.X), -1, dtype=np.int64)
+        if scope == "global":
+            groups = [np.arange(len(self.X))]
+        else:
+            groups = [np.flatnonzero(self.labels == c) for c in range(self.k)]
+
+        tasks = []
+        for rows in groups:
+            if len(rows) > 1:
+                tasks.extend((rows, start, stop) for start, stop in _blocks(len(rows), self.block_rows))
+
+        def scan(task):
+            rows, start, stop = task
+            query_rows = rows[start:stop]
+            queries = np.asarray(self.X[query_rows])
+            top, arg = np.full(len(query_rows), -np.inf, dtype=np.float32), np.full(len(query_rows), -1)
+            for c_start, c_stop in _blocks(len(rows), self.block_rows):
+                sims = queries @ np.asarray(self.X[rows[c_start:c_stop]]).T
+                if c_start < stop and start < c_stop:
+                    # Mask each query's similarity to itself
+                    overlap = np.arange(max(start, c_start), min(stop, c_stop))
+                    sims[overlap - start, overlap - c_start] = -np.inf
+                j = sims.argmax(axis=1)
+                s = sims[np.arange(len(j)), j]
+                better = s > top
+                top[better], arg[better] = s[better], rows[c_start + j[better]]
+            best[query_rows], neighbor[query_rows] = top, arg
+
+        self._map(scan, tasks)
+        best[neighbor < 0] = np.nan
+        return best, neighbor
+
+    def separation(self, top: int = 10) -> list[dict]:
+        """Most similar centroid pairs (merge candidates), most similar first."""
+        if self.centroids is None:
+            self.compute_centroids()
+        sims = self.centroids @ self.centroids.T
+        i, j = np.triu_indices(self.k, k=1)
+        order = np.argsort(-sims[i, j])[:top]
+        return [{"clusters": [int(self.cluster_ids[i[o]]), int(self.cluster_ids[j[o]])],
+                 "similarity": round(float(sims[i[o], j[o]]), 4)} for o in order]
+
+    def run(self, sample_size: int = 2000, nn_scope: str = "cluster", outliers: int = 20, seed: int = 0) -> dict:
+        """All diagnostics; timings per pass under ``seconds``."""
+        report, timings = {"docs": len(self.X), "clusters": self.k,
+                           "unclustered": int((self.labels < 0).sum())}, {}
+
+        t0 = time.perf_counter()
+        self.compute_centroids()
+        centroid_sims, report["per_cluster"] = self.cohesion()
+        timings["cohesion"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        report["silhouette"] = self.silhouette(sample_size, seed)
+        timings["silhouette"] = time.perf_counter() - t0
+        for entry in report["per_cluster"]:
+            entry["silhouette"] = report["silhouette"]["per_cluster"].get(entry["cluster_id"])
+
+        t0 = time.perf_counter()
+        nn_sims, neighbors = self.nearest_neighbors(nn_scope)
+        timings["nearest_neighbors"] = time.perf_counter() - t0
+        ranked = np.argsort(np.where(np.isnan(nn_sims), np.inf, nn_sims))[:outliers]
+        ranked = [r for r in ranked if not np.isnan(nn_sims[r])]
+        doc_ids = self.docs.doc_ids
+        report["outliers"] = {
+            "scope": nn_scope,
+            "nn_similarity_p5": round(float(np.nanpercentile(nn_sims, 5)), 4) if np.isfinite(nn_sims).any() else None,
+            "docs": [{
+                "doc_id": doc_ids[r],
+                "cluster_id": int(self.cluster_ids[self.labels[r]]) if self.labels[r] >= 0 else None,
+                "nn_similarity": round(float(nn_sims[r]), 4),
+                "nearest_doc_id": doc_ids[neighbors[r]],
+                "centroid_similarity": None if np.isnan(centroid_sims[r]) else round(float(centroid_sims[r]), 4),
+            } for r in ranked],
+        }
+
+        t0 = time.perf_counter()
+        report["closest_clusters"] = self.separation()
+        timings["separation"] = time.perf_counter() - t0
+        report["seconds"] = {k: round(v, 3) for k, v in timings.items()}
+        return report
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""
+/src/manage/manage_clusters.py
+
+Cluster management commands.
+
+Author: Forest Mars
+Version: 0.1
+
+Run with:
+  st manage analyze                               # cohesion, silhouette, outliers, close clusters
+  st manage analyze --nn-scope global --output report.json
+  st manage analyze --refresh                     # re-export document vectors first
+  st manage summary <doc_id>                      # stored document and section summaries
+"""
+__version__ = '0.1'
+__author__ = 'Forest Mars'
+
+import argparse
+import json
+import os
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.common.config import load_domain_config, load_global_config
+from src.common.domains import default_domain_name, load_domains, scoped_engine
+from src.common.embedding_spaces import active_space
+from src.common.query_cache import read_generation
+from src.common.vector_storage import pg_table_name
+from src.ingest.summaries import load_summaries
+from src.manage.cluster_analysis import (
+    ANALYSIS_BLOCK_ROWS,
+    ANALYSIS_DIR,
+    ANALYSIS_WORKERS,
+    ClusterAnalyzer,
+    DocVectors,
+    export_doc_vectors,
+    local_chunk_blocks,
+    pg_chunk_blocks,
+)
+
+GLOBAL_CONFIG = load_global_config()
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", GLOBAL_CONFIG.get("vector_backend", "postgres"))
+LOCAL_INDEX_DIR = Path(os.getenv("LOCAL_INDEX_DIR", GLOBAL_CONFIG.get("local_index_dir", "~/.swamp-thing/index"))).expanduser()
+
+
+def cluster_names(metadata_engine) -> dict:
+    try:
+        with metadata_engine.connect() as conn:
+            return dict(conn.execute(text("SELECT cluster_id, cluster_name FROM document_clusters")).all())
+    except SQLAlchemyError:
+        return {}
+
+
+def load_doc_vectors(domain, metadata_engine, block_rows: int, refresh: bool = False) -> DocVectors:
+    """Per-document vectors for the domain's active space, exported again only when the index has moved."""
+    space = active_space(metadata_engine)
+    generation = read_generation(metadata_engine)
+    path = ANALYSIS_DIR / domain.schema / space.version
+    if not refresh and DocVectors.current(path, generation, space.version):
+        print(f"✅ Using document vectors exported at generation {generation} ({path})")
+        return DocVectors(path)
+
+    print(f"Exporting document vectors ({space.version}, generation {generation}) to {path}...")
+    if VECTOR_BACKEND == "local":
+        base = LOCAL_INDEX_DIR if domain.schema == "public" else LOCAL_INDEX_DIR / domain.schema
+        blocks = local_chunk_blocks(space.local_dir(base), block_rows)
+    else:
+        table = f"{domain.schema}.{pg_table_name(space.table_name)}"
+        blocks = pg_chunk_blocks(domain.vector_db_uri, table, block_rows)
+    docs = export_doc_vectors(blocks, path, space.dim, space.version, generation)
+    print(f"✅ {len(docs)} documents from {docs.meta['chunks']} chunks")
+    return docs
+
+
+def print_report(report: dict, names: dict):
+    print(f"\n{report['docs']} documents in {report['clusters']} clusters "
+          f"({report['unclustered']} unclustered)")
+    silhouette = report["silhouette"]
+    print(f"Silhouette (sample of {silhouette['sample']}): {silhouette['mean']}")
+
+    fmt = lambda v: "-" if v is None else f"{v:.3f}"
+    print(f"\n{'cluster':>8}  {'docs':>7}  {'cohesion':>8}  {'std':>6}  {'min':>6}  {'silh.':>6}  name")
+    for c in sorted(report["per_cluster"], key=lambda c: c["cohesion_mean"] if c["cohesion_mean"] is not None else 1):
+        print(f"{c['cluster_id']:>8}  {c['docs']:>7}  {fmt(c['cohesion_mean']):>8}  {fmt(c['cohesion_std']):>6}  "
+              f"{fmt(c['cohesion_min']):>6}  {fmt(c['silhouette']):>6}  {names.get(c['cluster_id'], '')}")
+
+    outliers = report["outliers"]
+    print(f"\nOutliers (lowest nearest-neighbor similarity, {outliers['scope']} scope; "
+          f"p5 = {outliers['nn_similarity_p5']}):")
+    for o in outliers["docs"]:
+        print(f"   ⚠️  {o['doc_id']} (cluster {o['cluster_id']}): nn {o['nn_similarity']:.3f} "
+              f"-> {o['nearest_doc_id']}, centroid {o['centroid_similarity']}")
+
+    print("\nClosest cluster pairs (merge candidates):")
+    for pair in report["closest_clusters"]:
+        a, b = pair["clusters"]
+        print(f"   {a} {names.get(a, '')!r} ~ {b} {names.get(b, '')!r}: {pair['similarity']:.3f}")
+    print(f"\nTimings (s): {report['seconds']}")
+
+
+def analyze(domain, args):
+    metadata_engine = scoped_engine(domain.metadata_db_uri, domain.schema)
+    docs = load_doc_vectors(domain, metadata_engine, args.block_rows, refresh=args.refresh)
+    if not len(docs):
+        print("❌ No document vectors to analyze")
+        return
+    analyzer = ClusterAnalyzer(docs, block_rows=args.block_rows, workers=args.workers)
+    print(f"Analyzing with {args.workers} workers, {args.block_rows}-document blocks...")
+    report = analyzer.run(sample_size=args.sample, nn_scope=args.nn_scope, outliers=args.outliers, seed=args.seed)
+    print_report(report, cluster_names(metadata_engine))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"✅ Report written to {args.output}")
+
+
+def summary(domain, args):
+    metadata_engine = scoped_engine(domain.metadata_db_uri, domain.schema)
+    with metadata_engine.connect() as conn:
+        doc = conn.execute(
+            text("SELECT doc_path, cluster_id, canonical_doc_id FROM document_metadata_catalog WHERE id = :id"),
+            {"id": args.doc_id},
+        ).mappings().first()
+    if doc is None:
+        print(f"❌ No document {args.doc_id} in domain {domain.name}")
+        return
+    print(f"{args.doc_id}: {doc['doc_path']} (cluster {doc['cluster_id']})")
+    if doc["canonical_doc_id"] and doc["canonical_doc_id"] != args.doc_id:
+        print(f"   Near-duplicate of {doc['canonical_doc_id']}; summaries are kept for the canonical copy")
+    rows = load_summaries(metadata_engine, args.doc_id)
+    if not rows:
+        print("⚠️  No summaries stored; re-ingest with summaries enabled (st ingest --reingest)")
+        return
+    for row in rows:
+        if row["level"] == "document":
+            print(f"\nDocument summary ({row['chunk_count']} chunks, {row['updated_at']}):\n   {row['summary']}")
+        else:
+            print(f"\n[{row['section_index']}] {row['section'] or '(untitled)'} ({row['chunk_count']} chunks):\n"
+                  f"   {row['summary']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Manage document clusters")
+    parser.add_argument("--domain", default=None)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("analyze", help="cluster quality and outlier diagnostics over the whole catalog")
+    p.add_argument("--sample", type=int, default=2000, help="documents sampled for the silhouette")
+    p.add_argument("--nn-scope", choices=["cluster", "global"], default="cluster",
+                   help="nearest-neighbor search within each cluster, or across the catalog")
+    p.add_argument("--outliers", type=int, default=20, help="outliers listed")
+    p.add_argument("--block-rows", type=int, default=ANALYSIS_BLOCK_ROWS)
+    p.add_argument("--workers", type=int, default=ANALYSIS_WORKERS)
+    p.add_argument("--refresh", action="store_true", help="re-export document vectors")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--output", type=Path, default=None, help="write the report as JSON")
+
+    p = commands.add_parser("summary", help="show a document's stored document and section summaries")
+    p.add_argument("doc_id")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    domain_config = load_domain_config(os.getenv("CONFIG_PATH"))
+    domains = load_domains(domain_config)
+    domain = domains[args.domain or default_domain_name(domain_config, domains)]
+    if args.command == "analyze":
+        analyze(domain, args)
+    elif args.command == "summary":
+        summary(domain, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+/tests/test_chunking.py
+
+Chunk size bounds of the structure-aware chunker (src/ingest/chunking.py).
+
+Author: Forest Mars
+Version: 0.1
+"""
+import random
+
+import pytest
+from llama_index.core import Document
+
+from src.ingest.chunking import StructureAwareChunker
+
+WORDS = ["the", "agreement", "shall", "termination", "Party", "(a)", "notwithstanding", "§",
+         "indemnification", "x" * 40, "тест", "数据"]
+
+
+def random_document(rng: random.Random, doc_id: str) -> Document:
+    paragraphs = []
+    for p in range(rng.randint(5, 30)):
+        length = rng.randint(1, 120) if p % 7 else 900  # every 7th paragraph needs hard windows
+        paragraphs.append(" ".join(rng.choice(WORDS) for _ in range(length)) + ".")
+    paragraphs.append("A" + "b" * 3000)  # one word longer than any chunk
+    return Document(text="\n\n".join(paragraphs), metadata={"doc_id": doc_id})
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(64, 16), (128, 32), (256, 64)])
+def test_chunks_never_exceed_chunk_size(chunk_size, chunk_overlap):
+    rng = random.Random(chunk_size)
+    chunker = StructureAwareChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap, dedupe=False)
+    for d in range(15):
+        nodes = chunker.chunk_document(random_document(rng, f"d{d}"))
+        assert nodes
+        counts = chunker.counter.count_many([n.text for n in nodes])
+        assert max(counts) <= chunk_size
+
+
+def test_separators_count_toward_chunk_size():
+    chunker = StructureAwareChunker(chunk_size=128, chunk_overlap=0, dedupe=False)
+    unit = "word " * 20
+    units = [unit.strip()] * 12
+    n = chunker.counter.count(units[0])
+    for chunk in chunker._pack(units):
+        assert chunker.counter.count(chunk) <= 128
+    # Without the separators six units (6 * n tokens) would fit; with them only as many as do
+    per_chunk = (128 + chunker.separator_tokens) // (n + chunker.separator_tokens)
+    assert len(chunker._pack(units)[0].split("\n\n")) == per_chunk
+
+
+def test_hard_windows_keep_all_words():
+    chunker = StructureAwareChunker(chunk_size=32, chunk_overlap=8, dedupe=False)
+    sentence = " ".join(f"w{i}" for i in range(500))
+    windows = chunker._fit_units([sentence])
+    assert " ".join(windows).split() == sentence.split()
+    assert all(chunker.counter.count(w) <= 32 for w in windows)
@@ -0,0 +1,73 @@
+"""
+/tests/test_cluster_routing.py
+
+Centroid loading, incremental cluster assignment and routing
+(src/common/cluster_routing.py).
+
+Author: Forest Mars
+Version: 0.1
+"""
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, text
+
+from src.common.cluster_routing import ClusterRouter, assign_clusters, cluster_centroids, load_centroids
+
+
+def unit(*values):
+    v = np.asarray(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE document_clusters (cluster_id INTEGER PRIMARY KEY, cluster_name TEXT, "
+                          "doc_count INTEGER, centroid BLOB, centroid_dim INTEGER, embedding_version TEXT)"))
+    return engine
+
+
+def store(engine, rows):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO document_clusters VALUES (:id, :name, :count, :centroid, :dim, :version)"),
+                     [{"id": cid, "name": f"c{cid}", "count": count,
+                       "centroid": vec.tobytes() if vec is not None else None,
+                       "dim": vec.size if vec is not None else None, "version": version}
+                      for cid, count, vec, version in rows])
+
+
+def test_load_centroids_keeps_only_the_space(engine):
+    store(engine, [(0, 4, unit(1, 0, 0), "v1"), (1, 2, unit(0, 1, 0), "v1"),
+                   (2, 1, unit(0, 0, 1), "v0"), (3, 5, None, None)])
+    with engine.connect() as conn:
+        ids, matrix, counts = load_centroids(conn, "v1", dim=3)
+        assert load_centroids(conn, "v1", dim=8)[1] is None
+    assert ids == [0, 1] and counts == [4, 2]
+    assert np.allclose(matrix, [unit(1, 0, 0), unit(0, 1, 0)])
+
+
+def test_new_documents_join_the_nearest_stored_cluster():
+    stored = np.stack([unit(1, 0, 0), unit(0, 1, 0), unit(0, 0, 1)])
+    new = [unit(0.9, 0.1, 0), unit(0, 0.2, 1), unit(0.1, 0, 1)]
+    clusters, centroids = assign_clusters(new, [10, 11, 12], stored, [3, 5, 1])
+    assert clusters == {10: [0], 12: [1, 2]}
+    # Running mean weighted by the documents already in the cluster
+    expected = stored[2] * 1 + new[1] + new[2]
+    assert np.allclose(centroids[12], expected / np.linalg.norm(expected), atol=1e-6)
+    assert np.linalg.norm(centroids[10] - stored[0]) < np.linalg.norm(new[0] - stored[0])
+
+
+def test_router_routes_only_with_more_clusters_than_top_n(engine):
+    vectors = [unit(1, 0, 0), unit(0, 1, 0), unit(0, 0, 1), unit(1, 1, 0)]
+    store(engine, [(i, 1, v, "v1") for i, v in enumerate(vectors[:3])])
+    router = ClusterRouter(engine, "v1", dim=3, top_n=3, min_docs=0, enabled=True)
+    assert router.route(unit(1, 0, 0), generation=1) is None
+    store(engine, [(3, 1, vectors[3], "v1")])
+    assert router.route(unit(1, 0.1, 0), generation=2) == [0, 3, 1]
+    assert router.stats == {"routed": 1, "unrouted": 1}
+
+
+def test_cluster_centroids_are_unit_means():
+    centroids = cluster_centroids([[2, 0], [0, 2], [0, 4]], {0: [0, 1], 1: [2]})
+    assert np.allclose(centroids[0], unit(1, 1)) and np.allclose(centroids[1], [0, 1])
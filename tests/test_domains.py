@@ -0,0 +1,28 @@
+"""
+/tests/test_domains.py
+
+Domain config loading and schema names (src/common/domains.py).
+
+Author: Forest Mars
+Version: 0.1
+"""
+import pytest
+
+from src.common.domains import load_domains
+
+BASE = {"metadata_db_uri": "postgresql://u:p@localhost/metadata_catalog"}
+
+
+def test_flat_config_uses_public_and_entries_get_slugged_schemas():
+    assert load_domains({**BASE, "domain_name": "solo"})["solo"].schema == "public"
+    domains = load_domains({**BASE, "domains": [{"domain_name": "Acme Litigation"}, {"domain_name": "b2",
+                                                                                      "schema": "tenant_b"}]})
+    assert domains["Acme Litigation"].schema == "domain_acme_litigation"
+    assert domains["b2"].schema == "tenant_b"
+
+
+@pytest.mark.parametrize("schema", ["acme; DROP SCHEMA public CASCADE", "Acme", "1tenant", "a-b", "x" * 64,
+                                    "public,evil"])
+def test_configured_schema_must_be_a_plain_identifier(schema):
+    with pytest.raises(ValueError, match="must match"):
+        load_domains({**BASE, "domains": [{"domain_name": "acme", "schema": schema}]})
@@ -0,0 +1,117 @@
+"""
+/tests/test_extraction.py
+
+Parser-service retries, local fallback and the extracted-text cache
+(src/ingest/extraction.py), against a stub Tika server on localhost.
+
+Author: Forest Mars
+Version: 0.1
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.ingest.endpoints import StagedFile
+from src.ingest.extraction import Extractor, ParserClient, ParserServiceError
+
+
+class StubTika(ThreadingHTTPServer):
+    """Answers PUT /tika with the uppercased body after ``failures`` 503s."""
+
+    def __init__(self, failures: int = 0, status: int = 503):
+        super().__init__(("127.0.0.1", 0), StubTikaHandler)
+        self.failures = failures
+        self.status = status
+        self.requests = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubTikaHandler(BaseHTTPRequestHandler):
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests += 1
+        if self.server.requests <= self.server.failures:
+            self.send_response(self.server.status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        text = body.decode().upper().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def tika(request):
+    server = StubTika(*getattr(request, "param", ()))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def staged(tmp_path):
+    path = tmp_path / "brief.txt"
+    path.write_text("the court finds for the plaintiff")
+    return StagedFile(uri=path.as_uri(), path=path, etag="1", name="brief.txt")
+
+
+@pytest.mark.parametrize("tika", [(2,)], indirect=True)
+def test_retries_unavailable_parser(tika, staged):
+    client = ParserClient(tika.url, "tika", timeout=5, retries=2)
+    assert client.extract(staged.path) == "THE COURT FINDS FOR THE PLAINTIFF"
+    assert tika.requests == 3
+    client.close()
+
+
+@pytest.mark.parametrize("tika", [(5,)], indirect=True)
+def test_gives_up_after_retries(tika, staged):
+    client = ParserClient(tika.url, "tika", timeout=5, retries=1)
+    with pytest.raises(Exception):
+        client.extract(staged.path)
+    assert tika.requests == 2
+    client.close()
+
+
+@pytest.mark.parametrize("tika", [(1, 500)], indirect=True)
+def test_client_errors_are_not_retried(tika, staged):
+    client = ParserClient(tika.url, "tika", timeout=5, retries=2)
+    with pytest.raises(ParserServiceError, match="HTTP 500"):
+        client.extract(staged.path)
+    assert tika.requests == 1
+    client.close()
+
+
+@pytest.mark.parametrize("tika", [(1, 500)], indirect=True)
+def test_extractor_falls_back_locally(tika, staged, tmp_path):
+    extractor = Extractor("tika", tika.url, timeout=5, cache_dir=tmp_path / "text", service_formats=(".txt",))
+    documents, source = extractor.extract(staged)
+    assert source == "fallbacks"
+    assert documents[0].text == "the court finds for the plaintiff"
+    assert documents[0].metadata["content_sha256"]
+
+    # A fallback is cached as a local parse, so the service gets the file again once it recovers
+    documents, source = extractor.extract(staged)
+    assert source == "service" and tika.requests == 2
+    documents, source = extractor.extract(staged)
+    assert source == "cache_hits" and tika.requests == 2
+    extractor.close()
+
+
+def test_extractor_uses_service_and_cache(tika, staged, tmp_path):
+    extractor = Extractor("tika", tika.url, timeout=5, cache_dir=tmp_path / "text", service_formats=(".txt",))
+    results = list(extractor.extract_stream([staged, staged]))
+    assert [docs[0].text for _, docs in results] == ["THE COURT FINDS FOR THE PLAINTIFF"] * 2
+    assert extractor.stats["service"] + extractor.stats["cache_hits"] == 2
+    extractor.close()
@@ -0,0 +1,231 @@
+"""
+/tests/test_llm_pool.py
+
+Routing, failover, priorities and async calls of the LLM endpoint pool
+(src/common/llm_pool.py), against stub Ollama servers on localhost.
+
+Author: Forest Mars
+Version: 0.1
+"""
+import asyncio
+import json
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from llama_index.core.base.llms.types import ChatMessage
+
+from src.common.llm_pool import EndpointPool, HostSlots, NoHealthyEndpoint, PooledOllama, complete_many
+
+
+class StubOllama(ThreadingHTTPServer):
+    """Answers /api/generate and /api/chat with its own name, after ``delay`` seconds or with ``status``."""
+
+    daemon_threads = True
+
+    def __init__(self, name: str, status: int = 200, delay: float = 0.0):
+        super().__init__(("127.0.0.1", 0), StubOllamaHandler)
+        self.name = name
+        self.status = status
+        self.delay = delay
+        self.served = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._reply(self.server.status, {"models": []})
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server._lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.delay)
+            if server.status != 200:
+                self._reply(server.status, {"error": "unavailable"})
+                return
+            with server._lock:
+                server.served += 1
+            text = f"{server.name}:{request.get('prompt') or request['messages'][-1]['content']}"
+            if self.path == "/api/chat":
+                self._reply(200, {"message": {"role": "assistant", "content": text}})
+            else:
+                self._reply(200, {"response": text})
+        finally:
+            with server._lock:
+                server.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stubs():
+    servers = []
+
+    def start(name, **kwargs):
+        server = StubOllama(name, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_pool(*servers, **kwargs) -> EndpointPool:
+    kwargs.setdefault("health_check_sec", 0)
+    return EndpointPool([s if isinstance(s, str) else s.url for s in servers], **kwargs)
+
+
+def test_spreads_requests_over_endpoints(stubs):
+    a, b = stubs("a", delay=0.05), stubs("b", delay=0.05)
+    llm = PooledOllama(make_pool(a, b, max_concurrency=2), model="stub")
+    answers = complete_many(llm, [f"p{i}" for i in range(8)])
+    assert [x.split(":")[1] for x in answers] == [f"p{i}" for i in range(8)]
+    assert a.served and b.served and a.served + b.served == 8
+    assert max(a.max_in_flight, b.max_in_flight) <= 2
+
+
+def test_fails_over_on_5xx_and_connection_errors(stubs):
+    down, ok = stubs("down", status=503), stubs("ok")
+    dead_url = "http://127.0.0.1:9"  # discard port: connection refused
+    pool = make_pool(down, dead_url, ok)
+    llm = PooledOllama(pool, model="stub")
+    for i in range(4):
+        assert llm.complete(f"q{i}").text == f"ok:q{i}"
+    health = {e["url"]: e for e in pool.stats()["endpoints"]}
+    assert not health[down.url]["healthy"] and health[down.url]["last_error"] == "HTTP 503"
+    assert not health[dead_url]["healthy"]
+    assert health[ok.url]["served"] == 4
+
+
+def test_raises_when_every_endpoint_fails(stubs):
+    pool = make_pool(stubs("a", status=500), stubs("b", status=502))
+    with pytest.raises(NoHealthyEndpoint):
+        PooledOllama(pool, model="stub").complete("q")
+
+
+def test_client_errors_are_not_failed_over(stubs):
+    bad = stubs("bad", status=400)
+    pool = make_pool(bad)
+    with pytest.raises(requests.HTTPError):
+        PooledOllama(pool, model="stub").complete("q")
+    assert pool.stats()["endpoints"][0]["healthy"]
+
+
+def test_bulk_leaves_reserved_slots_for_interactive(stubs):
+    pool = make_pool(stubs("a"), max_concurrency=2, reserved_interactive=1)
+    bulk = pool.acquire("bulk")
+    with pytest.raises(TimeoutError):
+        pool.acquire("bulk", timeout=0.2)
+    interactive = pool.acquire("interactive", timeout=0.2)
+    pool.release(bulk)
+    pool.release(interactive)
+
+
+def test_waiting_interactive_goes_before_bulk(stubs):
+    pool = make_pool(stubs("a"), max_concurrency=1, reserved_interactive=0)
+    held = pool.acquire("interactive")
+    order = []
+
+    def take(priority):
+        endpoint = pool.acquire(priority)
+        order.append(priority)
+        time.sleep(0.05)
+        pool.release(endpoint)
+
+    bulk = threading.Thread(target=take, args=("bulk",))
+    bulk.start()
+    time.sleep(0.1)
+    interactive = threading.Thread(target=take, args=("interactive",))
+    interactive.start()
+    time.sleep(0.1)
+    pool.release(held)
+    bulk.join(5)
+    interactive.join(5)
+    assert order == ["interactive", "bulk"]
+
+
+HOLD_SLOT = """
+import fcntl, sys, time
+handle = open(sys.argv[1], "a")
+fcntl.flock(handle, fcntl.LOCK_EX)
+print("held", flush=True)
+time.sleep(30)
+"""
+
+
+def test_host_bulk_slots_are_shared_across_processes(tmp_path):
+    slots = HostSlots(tmp_path, slots=1)
+    holder = subprocess.Popen([sys.executable, "-c", HOLD_SLOT, str(tmp_path / "slot0.lock")],
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == "held"
+        with pytest.raises(TimeoutError):
+            with slots.hold(timeout=0.2):
+                pass
+    finally:
+        holder.kill()
+        holder.wait()
+    with slots.hold(timeout=2):  # released when the holding process exits
+        pass
+
+
+def test_bulk_requests_take_a_host_slot(stubs, tmp_path):
+    server = stubs("a", delay=0.1)
+    pool = make_pool(server, max_concurrency=4, reserved_interactive=1, bulk_slots_per_host=1,
+                     bulk_lock_dir=tmp_path)
+    llm = PooledOllama(pool, model="stub", priority="bulk")
+    answers = complete_many(llm, ["a", "b", "c"], max_workers=3)
+    assert answers == ["a:a", "a:b", "a:c"]
+    assert server.max_in_flight == 1
+
+
+def test_async_calls_do_not_block_the_event_loop(stubs):
+    server = stubs("a", delay=0.3)
+    llm = PooledOllama(make_pool(server), model="stub")
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        stream = await llm.astream_chat([ChatMessage(role="user", content="hi")])
+        chunks = [r async for r in stream]
+        completion = [r async for r in await llm.astream_complete("yo")]
+        task.cancel()
+        return ticks, chunks, completion
+
+    ticks, chunks, completion = asyncio.run(main())
+    assert ticks >= 20  # ~0.6 s of stub latency, ticking every 10 ms
+    assert chunks[-1].message.content == "a:hi" and chunks[-1].delta == "a:hi"
+    assert completion[-1].text == "a:yo"
@@ -0,0 +1,80 @@
+"""
+/tests/test_local_vector_store.py
+
+Crash recovery of the local vector index (src/common/local_vector_store.py):
+a batch killed before its header commit is dropped on the next writable open.
+
+Author: Forest Mars
+Version: 0.1
+"""
+import subprocess
+import sys
+
+import numpy as np
+
+from src.common.local_vector_store import LocalVectorIndex
+
+DIM = 8
+
+KILLED_WRITER = """
+import os, sys
+import numpy as np
+from src.common.local_vector_store import LocalVectorIndex
+
+def die(self, start, end):
+    os._exit(9)  # killed after the rows were appended, before linking and the header commit
+
+index = LocalVectorIndex(sys.argv[1])
+LocalVectorIndex._link_batch = die
+rng = np.random.default_rng(1)
+index.add(rng.normal(size=(5, %d)), [{"row": "ghost%%d" %% i} for i in range(5)],
+          ["ghost"] * 5, cluster_ids=[7] * 5)
+""" % DIM
+
+
+def batch(rng, name: str, n: int):
+    return rng.normal(size=(n, DIM)), [{"row": f"{name}{i}"} for i in range(n)], [name] * n
+
+
+def test_interrupted_batch_is_dropped_and_appends_resume(tmp_path):
+    rng = np.random.default_rng(0)
+    index = LocalVectorIndex(tmp_path, dim=DIM, m=4, brute_force_limit=0)
+    committed = batch(rng, "a", 40)
+    index.add(*committed, cluster_ids=[1] * 40)
+    index.close()
+
+    killed = subprocess.run([sys.executable, "-c", KILLED_WRITER, str(tmp_path)], cwd=".")
+    assert killed.returncode == 9
+    assert (tmp_path / "vectors.f32").stat().st_size > 40 * DIM * 4  # orphaned rows on disk
+
+    index = LocalVectorIndex(tmp_path, m=4, brute_force_limit=0)
+    assert index.count == 40
+    for name, row_bytes in index._row_bytes().items():
+        assert (tmp_path / name).stat().st_size == 40 * row_bytes, name
+    assert not (index.graph >= 40).any()
+
+    # Resume: the batch is written again after the committed rows, aligned with its records
+    vectors, records, doc_ids = batch(rng, "b", 10)
+    rows = index.add(vectors, records, doc_ids, cluster_ids=[2] * 10)
+    assert list(rows) == list(range(40, 50))
+    for i, vec in enumerate(vectors):
+        (score, row), = index.search(vec, 1, exact=True)
+        assert row == 40 + i and index.record(row) == {"row": f"b{i}"}
+        assert index.doc_codes[row] == index.doc_vocab["b"] and not index.tombstones[row]
+    for i, vec in enumerate(committed[0]):
+        (_, row), = index.search(vec, 1, mask=index.doc_mask(["a"]))
+        assert index.record(row) == {"row": f"a{i}"}
+    assert index.doc_mask(["ghost"]) is None or not index.doc_mask(["ghost"]).any()
+    assert index.cluster_mask([2]).sum() == 10
+
+
+def test_reopening_a_committed_index_changes_nothing(tmp_path):
+    rng = np.random.default_rng(2)
+    index = LocalVectorIndex(tmp_path, dim=DIM)
+    index.add(*batch(rng, "a", 12))
+    sizes = {p.name: p.stat().st_size for p in tmp_path.iterdir()}
+    graph = index.graph.copy()
+    index.close()
+    reopened = LocalVectorIndex(tmp_path)
+    assert {p.name: p.stat().st_size for p in tmp_path.iterdir()} == sizes
+    assert np.array_equal(reopened.graph, graph)
@@ -0,0 +1,36 @@
+"""
+/tests/test_query_cache.py
+
+Query embedding cache keys (src/common/query_cache.py).
+
+Author: Forest Mars
+Version: 0.1
+"""
+from src.common.query_cache import cached_query_embedding, embedding_cache, query_hash
+
+
+class CountingEmbedding:
+    model_name = "counting"
+
+    def __init__(self):
+        self.calls = []
+
+    def get_query_embedding(self, query: str):
+        self.calls.append(query)
+        return [float(len(self.calls))]
+
+
+def test_whitespace_is_normalized_but_case_is_kept():
+    assert query_hash("contracts  signed\nin May") == query_hash(" contracts signed in May ")
+    assert query_hash("US sanctions") != query_hash("us sanctions")
+    assert query_hash("May") != query_hash("may")
+
+
+def test_embeddings_are_not_shared_across_case():
+    embedding_cache.clear()
+    model = CountingEmbedding()
+    us = cached_query_embedding(model, "US exports", "v-test")
+    lower = cached_query_embedding(model, "us exports", "v-test")
+    again = cached_query_embedding(model, "US   exports", "v-test")
+    assert model.calls == ["US exports", "us exports"]
+    assert us != lower and again == us